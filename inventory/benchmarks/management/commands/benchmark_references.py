@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from benchmarks.references import INSERT_BATCH_SIZE, SCHEMES, compare_schemes
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the transaction_ref schemes: insert throughput, references that were already taken, and the '
+        'size and fill of the unique index after --rows inserts into a scratch SQLite table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000_000)
+        parser.add_argument('--batch-size', type=int, default=INSERT_BATCH_SIZE, help='Rows per transaction.')
+        parser.add_argument('--only', nargs='+', choices=sorted(SCHEMES), metavar='SCHEME')
+        parser.add_argument('--output', help='Also write the report to this JSON file.')
+
+    def handle(self, *args, **options):
+        def progress(name, done, total):
+            if options['verbosity'] > 1 and done % 1_000_000 < options['batch_size']:
+                self.stdout.write(f'{name}: {done}/{total}')
+
+        report = compare_schemes(options['rows'], options['batch_size'], options['only'], progress)
+        for name, result in report.items():
+            index = f"{result['index_mb']:8.2f} MB index, {result['index_fill']:.0%} full" if result['index_mb'] else ''
+            self.stdout.write(
+                f"{name:<10} {result['rows_per_s'] or 0:10} rows/s {result['collisions']:6} collisions   {index}"
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+                handle.write('\n')
@@ -0,0 +1,77 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from benchmarks.suite import (
+    ADMIN_PAGES, BENCHMARKS, REGRESSION_THRESHOLD, SCALES, SuiteData, regressions, run_benchmarks, run_pages, seed,
+)
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'baselines')
+
+
+class Command(BaseCommand):
+    help = (
+        'Time issuing, returning, exporting and searching plus the main admin pages against synthetic data, '
+        'check the pages against their query budgets and compare everything with the stored baseline for the '
+        'database vendor. Exits with an error when something regressed. Writes to the configured database '
+        'when seeding, so point DB_NAME at a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help='Top up synthetic data to --scale first.')
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per benchmark.')
+        parser.add_argument('--only', nargs='+', choices=sorted([*BENCHMARKS, *ADMIN_PAGES]), metavar='NAME',
+                            help='Run only these benchmarks or pages.')
+        parser.add_argument('--baseline', help='Baseline report (default: baselines/<vendor>.json in this app).')
+        parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                            help='Flag timings slower than the baseline by more than this share.')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Store this run as the baseline instead of comparing with it.')
+        parser.add_argument('--output', help='Also write the report to this JSON file.')
+
+    def handle(self, *args, **options):
+        vendor = connections[DEFAULT_DB_ALIAS].vendor
+        if options['seed']:
+            def progress(label, done, total):
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Seeded {done}/{total} {label}')
+
+            seed(**SCALES[options['scale']], progress=progress)
+        try:
+            data = SuiteData()
+        except ValueError as error:
+            raise CommandError(f'{error} Run with --seed.')
+
+        report = {
+            **run_benchmarks(data, options['repeat'], options['only']),
+            **run_pages(data, max(1, options['repeat'] // 4), options['only']),
+        }
+        baseline_path = options['baseline'] or os.path.join(BASELINE_DIR, f'{vendor}.json')
+        baseline = {}
+        if not options['save_baseline'] and os.path.exists(baseline_path):
+            with open(baseline_path, encoding='utf-8') as handle:
+                baseline = json.load(handle)
+
+        for name, result in report.items():
+            line = f"{name:<22} {result['median_ms']:10.2f} ms {result['queries']:5} queries"
+            if 'budget' in result:
+                line += f" (budget {result['budget']})"
+            if name in baseline:
+                line += f"   baseline {baseline[name]['median_ms']:10.2f} ms {baseline[name]['queries']:5} queries"
+            self.stdout.write(line)
+
+        for path in filter(None, [options['output'], baseline_path if options['save_baseline'] else None]):
+            with open(path, 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+                handle.write('\n')
+        if options['save_baseline']:
+            self.stdout.write(self.style.SUCCESS(f'Saved the {vendor} baseline to {baseline_path}.'))
+            return
+
+        found = regressions(report, baseline, options['threshold'])
+        if found:
+            raise CommandError('Regressions:\n  ' + '\n  '.join(found))
+        self.stdout.write(self.style.SUCCESS(f'No regressions against the {vendor} baseline.'))
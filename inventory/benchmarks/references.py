@@ -0,0 +1,71 @@
+"""
+Insert throughput and index size of the transaction_ref schemes.
+
+Each scheme fills a scratch SQLite table shaped like the outbound's
+reference column (an integer key plus a unique text column) in batched
+transactions, then measures the unique index with the dbstat table. The
+project database is only used by the sequence scheme, for its blocks.
+"""
+import os
+import sqlite3
+import tempfile
+import time
+
+from outbound.references import RandomReferenceGenerator, SequenceReferenceGenerator, TimeOrderedReferenceGenerator
+
+SCHEMES = {
+    'random': RandomReferenceGenerator,
+    'time': TimeOrderedReferenceGenerator,
+    'sequence': SequenceReferenceGenerator,
+}
+INSERT_BATCH_SIZE = 10000
+
+
+def index_stats(db, name):
+    """``(bytes, fill)`` of an index's pages, or ``(None, None)`` without dbstat."""
+    try:
+        size, used = db.execute(
+            'SELECT SUM(pgsize), SUM(pgsize - unused) FROM dbstat WHERE name = ?', [name],
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return None, None
+    return size, used / size
+
+
+def compare_schemes(rows, batch_size=INSERT_BATCH_SIZE, names=None, progress=None):
+    """
+    ``{scheme: result}`` with rows inserted per second, how many generated
+    references were already taken, and the size and fill of the unique index.
+    """
+    report = {}
+    for name in names or SCHEMES:
+        generator = SCHEMES[name]()
+        with tempfile.TemporaryDirectory() as scratch:
+            db = sqlite3.connect(os.path.join(scratch, 'references.sqlite3'))
+            try:
+                db.execute('CREATE TABLE refs (id INTEGER PRIMARY KEY, ref TEXT NOT NULL UNIQUE)')
+                inserted = collisions = 0
+                elapsed = 0.0
+                while inserted < rows:
+                    batch = [(generator(),) for _ in range(min(batch_size, rows - inserted))]
+                    started = time.perf_counter()
+                    with db:
+                        before = db.total_changes
+                        db.executemany('INSERT OR IGNORE INTO refs (ref) VALUES (?)', batch)
+                        added = db.total_changes - before
+                    elapsed += time.perf_counter() - started
+                    inserted += added
+                    collisions += len(batch) - added
+                    if progress:
+                        progress(name, inserted, rows)
+                size, fill = index_stats(db, 'sqlite_autoindex_refs_1')
+            finally:
+                db.close()
+        report[name] = {
+            'rows': inserted,
+            'rows_per_s': round(inserted / elapsed) if elapsed else None,
+            'collisions': collisions,
+            'index_mb': round(size / 2 ** 20, 2) if size else None,
+            'index_fill': round(fill, 3) if fill else None,
+        }
+    return report
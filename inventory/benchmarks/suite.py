@@ -0,0 +1,200 @@
+"""
+The benchmark suite: timings of the hot write and read paths and of the
+admin pages, with query-count budgets for the pages, run against the
+synthetic data from outbound.seed on the configured database (SQLite, or
+PostgreSQL with DB_ENGINE=postgresql).
+
+Each write benchmark runs inside a transaction that is rolled back, so a run
+leaves the data as it found it and repeated runs measure the same thing.
+Queries are counted through instrumentation's per-context profile.
+"""
+import random
+import statistics
+import time
+from contextlib import nullcontext
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from instrumentation.profile import RequestProfile, current_profile
+from outbound.exports import iter_csv
+from outbound.models import Outbound
+from outbound.rollups import backfill_outflow
+from outbound.seed import SEED_PREFIX, seed_outbounds, seed_stocks, seed_units, seed_users
+from outbound.services import issue_outbound, reconcile_outbound_items
+from search.backends import install_all, search
+from stocks.models import Stock
+
+SCALES = {
+    'small': {'stocks': 1000, 'items': 10000},
+    'medium': {'stocks': 100000, 'items': 1000000},
+    'large': {'stocks': 1000000, 'items': 5000000},
+}
+REGRESSION_THRESHOLD = 0.25  # slower than the baseline by more than this share
+OUTBOUND_LINES = 5
+EXPORT_ROWS = 1000
+
+BENCHMARKS = {}
+
+
+class SuiteData:
+    """The seeded rows the benchmarks draw from."""
+
+    def __init__(self, prefix=SEED_PREFIX):
+        self.stock_ids = list(
+            Stock.objects.filter(stock_no__startswith=f'{prefix}-').order_by('pk').values_list('pk', flat=True)
+        )
+        if len(self.stock_ids) < OUTBOUND_LINES:
+            raise ValueError('No benchmark data found; seed it first.')
+        self.units = seed_units(prefix=prefix)
+        self.users = seed_users(prefix=prefix)
+        self.admin, created = User.objects.get_or_create(
+            username=f'{prefix.lower()}-admin', defaults={'is_staff': True, 'is_superuser': True},
+        )
+        self.outbound_ids = list(Outbound.objects.order_by('-pk').values_list('pk', flat=True)[:EXPORT_ROWS])
+
+
+def seed(stocks, items, progress=None):
+    """Top the synthetic data up to the given scale and index it for search and the dashboard."""
+    seed_units()
+    seed_users()
+    seed_stocks(stocks, progress=progress)
+    seed_outbounds(items, progress=progress)
+    backfill_outflow()
+    install_all(connections[DEFAULT_DB_ALIAS])
+
+
+def benchmark(name):
+    """
+    Register ``setup(data, rng)`` under ``name``. It prepares one iteration
+    and returns the callable that is timed.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def random_lines(data, rng):
+    return [(stock_id, 1) for stock_id in rng.sample(data.stock_ids, OUTBOUND_LINES)]
+
+
+@benchmark('issue_outbound')
+def issue(data, rng):
+    outbound = Outbound(unit=rng.choice(data.units), processed_by=rng.choice(data.users))
+    lines = random_lines(data, rng)
+    return lambda: issue_outbound(outbound, lines)
+
+
+@benchmark('return_outbound')
+def return_items(data, rng):
+    outbound = Outbound(unit=rng.choice(data.units), processed_by=rng.choice(data.users))
+    issue_outbound(outbound, random_lines(data, rng))
+    items = list(outbound.outbounditem_set.all())
+    return lambda: reconcile_outbound_items(outbound, deleted=items)
+
+
+@benchmark('export_csv')
+def export(data, rng):
+    queryset = Outbound.objects.filter(pk__in=data.outbound_ids)
+    return lambda: sum(1 for row in iter_csv(queryset))
+
+
+@benchmark('search_stocks')
+def search_stocks(data, rng):
+    term = f'Item {rng.randrange(100, max(len(data.stock_ids), 101))}'
+
+    def run():
+        results = search(Stock.objects.all(), term)
+        if results is None:  # no search index on this database
+            results = Stock.objects.filter(name__icontains=term)
+        return list(results[:20])
+    return run
+
+
+# name -> (url for the data, most queries the page may run once its caches are warm)
+ADMIN_PAGES = {
+    'admin_index': (lambda data: reverse('admin:index'), 3),
+    'outbound_changelist': (lambda data: reverse('admin:outbound_outbound_changelist'), 4),
+    'outbound_search': (lambda data: reverse('admin:outbound_outbound_changelist') + '?q=bench', 5),
+    'outbound_change': (lambda data: reverse('admin:outbound_outbound_change', args=[data.outbound_ids[0]]), 7),
+    'outbound_add': (lambda data: reverse('admin:outbound_outbound_add'), 4),
+    'outbound_dashboard': (lambda data: reverse('admin:outbound_outbound_dashboard'), 5),
+    'stock_changelist': (lambda data: reverse('admin:stocks_stock_changelist'), 4),
+    'stock_search': (lambda data: reverse('admin:stocks_stock_changelist') + '?q=Item+123', 5),
+    'stock_change': (lambda data: reverse('admin:stocks_stock_change', args=[data.stock_ids[0]]), 6),
+    'unit_changelist': (lambda data: reverse('admin:profiles_unit_changelist'), 5),
+    'job_changelist': (lambda data: reverse('admin:jobs_job_changelist'), 6),
+}
+
+
+def measure(call, repeat, rollback=False, setup=None):
+    """Median and best time (ms) of ``repeat`` calls, and the queries of the last one."""
+    timings = []
+    for _ in range(repeat):
+        with transaction.atomic() if rollback else nullcontext():
+            timed = setup() if setup else call
+            profile = RequestProfile()
+            token = current_profile.set(profile)
+            try:
+                started = time.perf_counter()
+                timed()
+                timings.append((time.perf_counter() - started) * 1000)
+            finally:
+                current_profile.reset(token)
+            if rollback:
+                transaction.set_rollback(True)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'queries': profile.queries,
+    }
+
+
+def run_benchmarks(data, repeat=20, names=None, seed=0):
+    rng = random.Random(seed)
+    return {
+        name: measure(None, repeat, rollback=True, setup=lambda setup=setup: setup(data, rng))
+        for name, setup in BENCHMARKS.items() if not names or name in names
+    }
+
+
+def run_pages(data, repeat=5, names=None):
+    client = Client(HTTP_HOST='localhost')
+    client.force_login(data.admin)
+    results = {}
+    with override_settings(ALLOWED_HOSTS=['localhost']):
+        for name, (url, budget) in ADMIN_PAGES.items():
+            if names and name not in names:
+                continue
+            path = url(data)
+
+            def get():
+                response = client.get(path)
+                if response.status_code != 200:
+                    raise AssertionError(f'{path} answered {response.status_code}.')
+
+            results[name] = {**measure(get, repeat), 'budget': budget}
+    return results
+
+
+def regressions(report, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    What got worse in ``report``: pages over their query budget, and anything
+    slower or running more queries than in ``baseline``.
+    """
+    found = []
+    for name, result in report.items():
+        if 'budget' in result and result['queries'] > result['budget']:
+            found.append(f"{name}: {result['queries']} queries, budget {result['budget']}")
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['queries'] > before['queries']:
+            found.append(f"{name}: {result['queries']} queries, was {before['queries']}")
+        if result['median_ms'] > before['median_ms'] * (1 + threshold):
+            found.append(f"{name}: {result['median_ms']:.2f} ms, was {before['median_ms']:.2f} ms "
+                         f"(+{result['median_ms'] / before['median_ms'] - 1:.0%})")
+    return found
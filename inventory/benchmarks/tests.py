@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase
+
+from caching import store as cache_store
+from outbound.models import Outbound, OutboundItem
+from outbound.seed import seed_outbounds, seed_stocks
+from stocks.models import Stock
+from .references import compare_schemes
+from .suite import ADMIN_PAGES, SuiteData, regressions, run_benchmarks, run_pages, seed
+
+
+class AdminQueryBudgetTests(TransactionTestCase):
+    # Outside a test transaction, so the admin's own atomic blocks cost what they do in production.
+
+    def setUp(self):
+        cache_store.clear()
+        self.addCleanup(cache_store.clear)
+
+    def test_admin_pages_stay_within_budget_as_data_grows(self):
+        seed(stocks=20, items=40)
+        small = run_pages(SuiteData(), repeat=2)
+        seed_stocks(60)
+        seed_outbounds(200)
+        large = run_pages(SuiteData(), repeat=2)
+
+        self.assertEqual(set(small), set(ADMIN_PAGES))
+        self.assertEqual(regressions(large, {}), [])
+        self.assertEqual({name: result['queries'] for name, result in small.items()},
+                         {name: result['queries'] for name, result in large.items()})
+
+
+class BenchmarkSuiteTests(TestCase):
+
+    def setUp(self):
+        cache_store.clear()
+        self.addCleanup(cache_store.clear)
+
+    def test_write_benchmarks_leave_the_data_alone(self):
+        seed(stocks=20, items=40)
+        quantities = list(Stock.objects.order_by('pk').values_list('quantity', flat=True))
+
+        report = run_benchmarks(SuiteData(), repeat=2)
+
+        self.assertEqual(set(report), {'issue_outbound', 'return_outbound', 'export_csv', 'search_stocks'})
+        self.assertEqual(list(Stock.objects.order_by('pk').values_list('quantity', flat=True)), quantities)
+        self.assertEqual(OutboundItem.objects.count(), 40)
+        self.assertEqual(report['export_csv']['queries'], 2)
+
+    def test_regressions_against_the_baseline(self):
+        baseline = {'issue_outbound': {'median_ms': 10.0, 'queries': 12}}
+
+        self.assertEqual(regressions({'issue_outbound': {'median_ms': 12.0, 'queries': 12}}, baseline), [])
+        self.assertEqual(regressions({'issue_outbound': {'median_ms': 13.0, 'queries': 13}}, baseline), [
+            'issue_outbound: 13 queries, was 12',
+            'issue_outbound: 13.00 ms, was 10.00 ms (+30%)',
+        ])
+        self.assertEqual(regressions({'page': {'median_ms': 1.0, 'queries': 6, 'budget': 5}}, {}),
+                         ['page: 6 queries, budget 5'])
+
+    def test_command_saves_and_checks_a_baseline(self):
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'baseline.json')
+        out = StringIO()
+        call_command('run_benchmarks', seed=True, scale='small', repeat=1, only=['export_csv'],
+                     baseline=path, save_baseline=True, stdout=out)
+        with open(path, encoding='utf-8') as handle:
+            baseline = json.load(handle)
+        self.assertEqual(set(baseline), {'export_csv'})
+        self.assertGreater(Outbound.objects.count(), 0)
+
+        baseline['export_csv']['queries'] = 1
+        with open(path, 'w', encoding='utf-8') as handle:
+            json.dump(baseline, handle)
+        with self.assertRaisesMessage(CommandError, 'export_csv: 2 queries, was 1'):
+            call_command('run_benchmarks', repeat=1, only=['export_csv'], baseline=path, threshold=100, stdout=out)
+
+    def test_reference_schemes_are_compared(self):
+        report = compare_schemes(rows=3000, batch_size=1000)
+
+        self.assertEqual(set(report), {'random', 'time', 'sequence'})
+        self.assertTrue(all(result['rows'] == 3000 and result['rows_per_s'] for result in report.values()))
@@ -0,0 +1,39 @@
+from django import forms
+from django.forms.models import ModelChoiceIterator
+
+from .store import cached_queryset, is_cached
+
+
+class CachedModelChoiceIterator(ModelChoiceIterator):
+    """Renders a ModelChoiceField's options from the cache instead of querying each time."""
+
+    def cached_choices(self):
+        field = self.field
+        return cached_queryset(
+            self.queryset,
+            build=lambda rows: [(field.prepare_value(obj), field.label_from_instance(obj)) for obj in rows],
+            variant=f'choices:{type(field).__qualname__}',
+        )
+
+    def __iter__(self):
+        if not is_cached(self.queryset.model):
+            yield from super().__iter__()
+            return
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        yield from self.cached_choices()
+
+    def __len__(self):
+        if not is_cached(self.queryset.model):
+            return super().__len__()
+        return len(self.cached_choices()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        if not is_cached(self.queryset.model):
+            return super().__bool__()
+        return self.field.empty_label is not None or bool(self.cached_choices())
+
+
+class CachedModelChoiceField(forms.ModelChoiceField):
+    # Only rendering is cached; a submitted value is still checked against the database.
+    iterator = CachedModelChoiceIterator
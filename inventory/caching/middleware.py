@@ -0,0 +1,44 @@
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .store import EVENTS, request_stats
+
+
+class CacheStatsMiddleware:
+    """
+    Count the cache lookups made while serving a request and report them in
+    X-Cache-Stats. Runs natively under both WSGI and ASGI, so it does not
+    push async views onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = Counter()
+        token = request_stats.set(counter)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        return self.report(response, counter)
+
+    async def __acall__(self, request):
+        counter = Counter()
+        token = request_stats.set(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_stats.reset(token)
+        return self.report(response, counter)
+
+    def report(self, response, counter):
+        response['X-Cache-Stats'] = ', '.join(f'{event}={counter[event]}' for event in EVENTS)
+        return response
@@ -0,0 +1,33 @@
+from django.db import models
+
+from .store import invalidate
+
+
+class CachedQuerySet(models.QuerySet):
+    """
+    QuerySet for the models in CACHED_MODELS. Bulk writes send no post_save,
+    so they retire the model's cached querysets themselves, and the cached
+    objects they know the pks of. update() cannot name the rows it touched:
+    callers that update cached objects also send stocks_changed with the pks.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        invalidate(self.model, [obj.pk for obj in objs if obj.pk is not None], using=self.db)
+        return objs
+
+    def bulk_update(self, objs, *args, **kwargs):
+        objs = list(objs)
+        updated = super().bulk_update(objs, *args, **kwargs)
+        invalidate(self.model, [obj.pk for obj in objs], using=self.db)
+        return updated
+
+    bulk_update.alters_data = True
+
+    def update(self, **kwargs):
+        updated = super().update(**kwargs)
+        if updated:
+            invalidate(self.model, using=self.db)
+        return updated
+
+    update.alters_data = True
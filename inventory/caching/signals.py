@@ -0,0 +1,22 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
+
+from stocks.models import Stock
+from stocks.signals import stocks_changed
+from .store import CACHED_MODELS, invalidate
+
+
+def invalidate_instance(sender, instance, using, **kwargs):
+    invalidate(sender, [instance.pk], using=using)
+
+
+def invalidate_stocks(sender, stock_ids, using=None, **kwargs):
+    invalidate(Stock, stock_ids, using=using)
+
+
+for label in CACHED_MODELS:
+    model = apps.get_model(label)
+    post_save.connect(invalidate_instance, sender=model, dispatch_uid=f'cache_invalidate_save_{label}')
+    post_delete.connect(invalidate_instance, sender=model, dispatch_uid=f'cache_invalidate_delete_{label}')
+
+stocks_changed.connect(invalidate_stocks, dispatch_uid='cache_invalidate_stocks_changed')
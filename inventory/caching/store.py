@@ -0,0 +1,191 @@
+"""
+Read-through caching for models that are read far more often than written.
+
+Values live in two tiers: a bounded in-process LRU in front of the configured
+Django cache (``CACHES['default']``: local memory, file or Redis). Entries are
+retired by versioning rather than deletion. Every cached model has a generation
+token and every cached object a version token, both kept in the shared tier,
+and a write replaces the tokens so older keys are never asked for again. Token
+lookups always go to the shared tier, so the local tier cannot serve a value
+that another process has invalidated.
+"""
+import hashlib
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .lru import LRUCache
+
+# Models whose writes are tracked by caching.signals (and, for bulk writes, by
+# their CachedQuerySet manager); nothing else is cached.
+CACHED_MODELS = ('stocks.Stock', 'profiles.Unit', 'outbound.OutboundItem')
+
+EVENTS = ('local_hits', 'hits', 'misses')
+
+local = LRUCache(getattr(settings, 'CACHE_LOCAL_MAX_ENTRIES', 1000))
+
+# Process totals, plus the counters of the request being served when
+# CacheStatsMiddleware is installed.
+stats = Counter()
+request_stats = ContextVar('request_cache_stats', default=None)
+
+_MISSING = object()
+
+
+def _count(event, amount=1):
+    if amount:
+        stats[event] += amount
+        current = request_stats.get()
+        if current is not None:
+            current[event] += amount
+
+
+def is_cached(model):
+    return model._meta.label in CACHED_MODELS
+
+
+def _check(model):
+    if not is_cached(model):
+        raise ValueError(f'{model._meta.label} is not in CACHED_MODELS; its writes would not invalidate the cache.')
+
+
+def _new_token():
+    return uuid.uuid4().hex[:12]
+
+
+def _get_tokens(keys):
+    """The current token of each version key, creating the missing ones."""
+    tokens = cache.get_many(keys)
+    for key in keys:
+        if key not in tokens:
+            token = _new_token()
+            # add() loses to a concurrent creator; use whichever token won.
+            if not cache.add(key, token, None):
+                token = cache.get(key, token)
+            tokens[key] = token
+    return tokens
+
+
+def _bump(keys):
+    cache.set_many({key: _new_token() for key in keys}, None)
+
+
+def _generation_key(model):
+    return f'gen:{model._meta.label_lower}'
+
+
+def _version_key(model, pk):
+    return f'ver:{model._meta.label_lower}:{pk}'
+
+
+def _read(keys):
+    """Look ``keys`` up in the local tier, then the shared one. Returns the hits."""
+    found = {}
+    for key in keys:
+        value = local.get(key, _MISSING)
+        if value is not _MISSING:
+            found[key] = value
+    _count('local_hits', len(found))
+
+    remaining = [key for key in keys if key not in found]
+    if remaining:
+        shared = cache.get_many(remaining)
+        for key, value in shared.items():
+            local.set(key, value)
+        found.update(shared)
+        _count('hits', len(shared))
+        _count('misses', len(remaining) - len(shared))
+    return found
+
+
+def _write(values):
+    cache.set_many(values)
+    for key, value in values.items():
+        local.set(key, value)
+
+
+def get_objects(model, pks):
+    """Return ``{pk: instance}`` for the pks that exist, loading cache misses in one query."""
+    _check(model)
+    pks = {model._meta.pk.to_python(pk) for pk in pks}
+    if not pks:
+        return {}
+    tokens = _get_tokens([_version_key(model, pk) for pk in pks])
+    keys = {pk: f'obj:{model._meta.label_lower}:{pk}:{tokens[_version_key(model, pk)]}' for pk in pks}
+
+    found = _read(list(keys.values()))
+    objects = {pk: found[key] for pk, key in keys.items() if key in found}
+    missing = [pk for pk in pks if pk not in objects]
+    if missing:
+        loaded = model._default_manager.in_bulk(missing)
+        _write({keys[pk]: obj for pk, obj in loaded.items()})
+        objects.update(loaded)
+    return objects
+
+
+def get_object(model, pk):
+    """The instance with primary key ``pk``, or None."""
+    return get_objects(model, [pk]).get(model._meta.pk.to_python(pk))
+
+
+def queryset_models(queryset):
+    """Every model whose table the compiled queryset reads, select_related joins included."""
+    query = queryset.query.chain()
+    sql, params = query.get_compiler(queryset.db).as_sql()
+    tables = {model._meta.db_table: model for model in apps.get_models()}
+    models = {tables[join.table_name] for join in query.alias_map.values() if join.table_name in tables}
+    return models, sql, params
+
+
+def cached_queryset(queryset, build=list, variant=''):
+    """
+    Return ``build(queryset)``, cached under a key made of the SQL and the
+    generation of every model the query reads, so a write to any of them
+    starts a fresh entry. ``variant`` tells different ``build`` callables apart.
+    """
+    models, sql, params = queryset_models(queryset)
+    for model in models:
+        _check(model)
+    generations = [_generation_key(model) for model in sorted(models, key=lambda model: model._meta.label)]
+    tokens = _get_tokens(generations)
+    digest = hashlib.sha1(f'{queryset.db}|{sql}|{params!r}'.encode()).hexdigest()
+    key = 'qs:{}:{}:{}:{}'.format(
+        queryset.model._meta.label_lower, variant, digest, '.'.join(tokens[key] for key in generations),
+    )
+
+    found = _read([key])
+    if key in found:
+        return found[key]
+    value = build(queryset.all())  # a fresh clone, never the caller's result cache
+    _write({key: value})
+    return value
+
+
+def invalidate(model, pks=(), using=None):
+    """Retire every cached queryset that reads ``model`` and the cached objects in ``pks``."""
+    keys = [_generation_key(model)] + [_version_key(model, pk) for pk in pks]
+    _bump(keys)
+    if connections[using or DEFAULT_DB_ALIAS].in_atomic_block:
+        # Again once the rows are visible: a reader may have cached the
+        # pre-commit values under the tokens set just now.
+        transaction.on_commit(lambda: _bump(keys), using=using)
+
+
+def cache_stats():
+    """Process-wide hit and miss totals since start-up or the last clear()."""
+    totals = {event: stats[event] for event in EVENTS}
+    lookups = sum(totals.values())
+    totals['hit_ratio'] = (totals['local_hits'] + totals['hits']) / lookups if lookups else 0.0
+    return totals
+
+
+def clear():
+    """Empty both tiers and reset the counters."""
+    local.clear()
+    cache.clear()
+    stats.clear()
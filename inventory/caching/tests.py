@@ -0,0 +1,98 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+
+from profiles.models import Unit
+from stocks.models import Stock
+from stocks.services import apply_stock_deltas
+from . import store
+from .lru import LRUCache
+
+
+class CacheStoreTests(TestCase):
+
+    def setUp(self):
+        store.clear()
+        self.addCleanup(store.clear)
+
+    def make_stock(self, stock_no, quantity=10):
+        return Stock.objects.create(stock_no=stock_no, unit='pcs', description='', quantity=quantity)
+
+    def test_lru_drops_least_recently_used(self):
+        lru = LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+    def test_objects_are_read_through(self):
+        stocks = [self.make_stock('A-1'), self.make_stock('A-2')]
+
+        with self.assertNumQueries(1):
+            self.assertEqual(store.get_objects(Stock, [stock.pk for stock in stocks]), {s.pk: s for s in stocks})
+        with self.assertNumQueries(0):
+            self.assertEqual(store.get_object(Stock, str(stocks[0].pk)).stock_no, 'A-1')
+        self.assertEqual(store.cache_stats()['misses'], 2)
+        self.assertEqual(store.cache_stats()['local_hits'], 1)
+
+    def test_writes_invalidate_the_object(self):
+        stock = self.make_stock('A-1')
+        store.get_object(Stock, stock.pk)
+
+        stock.name = 'Renamed'
+        stock.save()
+        self.assertEqual(store.get_object(Stock, stock.pk).name, 'Renamed')
+
+        apply_stock_deltas({stock.pk: -4})
+        self.assertEqual(store.get_object(Stock, stock.pk).quantity, 6)
+
+        stock.delete()
+        self.assertIsNone(store.get_object(Stock, stock.pk))
+
+    def test_querysets_follow_model_generations(self):
+        Unit.objects.create(name='Store 1')
+        names = Unit.objects.values_list('name', flat=True).order_by('name')
+
+        self.assertEqual(store.cached_queryset(names), ['Store 1'])
+        with self.assertNumQueries(0):
+            self.assertEqual(store.cached_queryset(names), ['Store 1'])
+
+        Unit.objects.create(name='Store 2')
+        self.assertEqual(store.cached_queryset(names), ['Store 1', 'Store 2'])
+
+    def test_bulk_writes_invalidate(self):
+        names = Unit.objects.values_list('name', flat=True).order_by('name')
+        self.assertEqual(store.cached_queryset(names), [])
+
+        units = Unit.objects.bulk_create([Unit(name='Store 1'), Unit(name='Store 2')])
+        self.assertEqual(store.cached_queryset(names), ['Store 1', 'Store 2'])
+
+        Unit.objects.filter(pk=units[0].pk).update(name='Store 0')
+        self.assertEqual(store.cached_queryset(names), ['Store 0', 'Store 2'])
+
+        store.get_object(Unit, units[1].pk)
+        units[1].name = 'Store 3'
+        Unit.objects.bulk_update([units[1]], ['name'])
+        self.assertEqual(store.get_object(Unit, units[1].pk).name, 'Store 3')
+
+    def test_querysets_reading_uncached_models_are_refused(self):
+        with self.assertRaises(ValueError):
+            store.cached_queryset(Stock.objects.select_related('modified_by'))
+
+    def test_outbound_form_renders_choices_from_cache(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.make_stock('A-1')
+        Unit.objects.create(name='Store 1')
+        url = reverse('admin:outbound_outbound_add')
+        self.client.get(url)
+
+        response = self.client.get(url)
+        self.assertContains(response, 'A-1')
+        self.assertIn('misses=0', response['X-Cache-Stats'])
+
+        Unit.objects.create(name='Store 2')
+        response = self.client.get(url)
+        self.assertContains(response, 'Store 2')
+        self.assertIn('misses=1', response['X-Cache-Stats'])
@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+
+
+class InstrumentationConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'instrumentation'
+
+    def ready(self):
+        from django.db import connections
+        from django.db.backends.signals import connection_created
+
+        from .profile import install_query_recorder
+
+        connection_created.connect(install_query_recorder, dispatch_uid='instrumentation_query_recorder')
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(sender=type(connection), connection=connection)
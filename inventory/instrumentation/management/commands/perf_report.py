@@ -0,0 +1,83 @@
+import os
+import statistics
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from instrumentation.profile import read_records
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(records, top=10):
+    """The ``top`` slowest endpoints (by p95) and statements (by total time) in ``records``."""
+    endpoints = defaultdict(list)
+    statements = defaultdict(lambda: {'count': 0, 'ms': 0.0, 'requests': 0, 'repeated': 0})
+    for record in records:
+        endpoints[f"{record['method']} {record['route']}"].append(record)
+        for query in record.get('slowest', []):
+            totals = statements[query['sql']]
+            totals['count'] += query['count']
+            totals['ms'] += query['ms']
+            totals['requests'] += 1
+        for query in record.get('duplicates', []):
+            statements[query['sql']]['repeated'] += 1
+
+    endpoint_rows = []
+    for name, hits in endpoints.items():
+        durations = sorted(hit['ms'] for hit in hits)
+        endpoint_rows.append({
+            'endpoint': name,
+            'requests': len(hits),
+            'p50_ms': percentile(durations, 0.50),
+            'p95_ms': percentile(durations, 0.95),
+            'max_ms': durations[-1],
+            'queries': statistics.mean(hit['queries'] for hit in hits),
+            'db_ms': statistics.mean(hit['db_ms'] for hit in hits),
+            'repeated': sum(1 for hit in hits if hit.get('duplicates')),
+        })
+    endpoint_rows.sort(key=lambda row: -row['p95_ms'])
+    statement_rows = sorted(
+        ({'sql': sql, **totals} for sql, totals in statements.items()), key=lambda row: -row['ms'],
+    )
+    return endpoint_rows[:top], statement_rows[:top]
+
+
+class Command(BaseCommand):
+    help = (
+        'Summarize the requests sampled by PerformanceMiddleware: the slowest endpoints and the statements '
+        'taking the most database time, flagging repeated (N+1) statements.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=settings.PERF_LOG, help='Log to read (PERF_LOG by default).')
+        parser.add_argument('--top', type=int, default=10, help='Rows shown in each table.')
+
+    def handle(self, *args, **options):
+        if not os.path.exists(options['log']):
+            raise CommandError(f"No performance log at {options['log']}; is PERF_SAMPLE_RATE above 0?")
+        endpoints, statements = summarize(read_records(options['log']), options['top'])
+        if not endpoints:
+            self.stdout.write('No sampled requests yet.')
+            return
+
+        self.stdout.write('Slowest endpoints (by p95)')
+        self.stdout.write(f"{'requests':>8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'queries':>8} {'db ms':>9} "
+                          f"{'N+1':>5}  endpoint")
+        for row in endpoints:
+            self.stdout.write(
+                f"{row['requests']:>8} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['max_ms']:>9.1f} "
+                f"{row['queries']:>8.1f} {row['db_ms']:>9.1f} {row['repeated']:>5}  {row['endpoint']}"
+            )
+
+        self.stdout.write('\nStatements by total time')
+        self.stdout.write(f"{'total ms':>9} {'runs':>7} {'requests':>8} {'N+1':>5}  statement")
+        for row in statements:
+            self.stdout.write(
+                f"{row['ms']:>9.1f} {row['count']:>7} {row['requests']:>8} {row['repeated']:>5}  {row['sql']}"
+            )
@@ -0,0 +1,103 @@
+import cProfile
+import os
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .profile import RequestProfile, current_profile, query_entries, write_record
+
+
+class PerformanceMiddleware:
+    """
+    Time every request in a Server-Timing header. A PERF_SAMPLE_RATE share
+    of requests is also profiled: query count, database time and repeated
+    statements go into the header and PERF_LOG, and a PERF_PROFILE_RATE
+    share of synchronous ones is run under cProfile into PERF_PROFILE_DIR.
+    Put it first so the timings cover the other middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        profile = RequestProfile() if random.random() < settings.PERF_SAMPLE_RATE else None
+        profiler = cProfile.Profile() if profile and random.random() < settings.PERF_PROFILE_RATE else None
+        # Unsampled requests leave an enclosing profile (a benchmark's) in place.
+        token = current_profile.set(profile) if profile else None
+        try:
+            if profiler:
+                response = profiler.runcall(self.get_response, request)
+            else:
+                response = self.get_response(request)
+        finally:
+            if token:
+                current_profile.reset(token)
+        return self.report(request, response, started, profile, profiler)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        # cProfile only sees its own thread, which an async request leaves.
+        profile = RequestProfile() if random.random() < settings.PERF_SAMPLE_RATE else None
+        token = current_profile.set(profile) if profile else None
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token:
+                current_profile.reset(token)
+        return self.report(request, response, started, profile)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profile = current_profile.get()
+        if profile is not None:
+            profile.view_started = time.perf_counter()
+
+    def report(self, request, response, started, profile, profiler=None):
+        finished = time.perf_counter()
+        timings = [f'app;dur={(finished - started) * 1000:.1f}']
+        if profile is None:
+            response['Server-Timing'] = ', '.join(timings)
+            return response
+
+        duplicates = profile.duplicates(settings.PERF_DUPLICATE_THRESHOLD)
+        view_ms = (finished - profile.view_started) * 1000 if profile.view_started else None
+        timings.append(f'db;dur={profile.db_time * 1000:.1f};desc="{profile.queries} queries"')
+        if view_ms is not None:
+            timings.append(f'view;dur={view_ms:.1f}')
+        if duplicates:
+            timings.append(f'dup;desc="{len(duplicates)} repeated statements"')
+        response['Server-Timing'] = ', '.join(timings)
+
+        match = request.resolver_match
+        record = {
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'route': match.route if match else request.path,
+            'status': response.status_code,
+            'ms': round((finished - started) * 1000, 3),
+            'view_ms': round(view_ms, 3) if view_ms is not None else None,
+            'db_ms': round(profile.db_time * 1000, 3),
+            'queries': profile.queries,
+            'duplicates': query_entries(duplicates),
+            'slowest': query_entries(profile.slowest()),
+        }
+        if profiler:
+            os.makedirs(settings.PERF_PROFILE_DIR, exist_ok=True)
+            record['profile'] = os.path.join(
+                settings.PERF_PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{slugify(record['route']) or 'root'}-"
+                                           f'{os.getpid()}-{random.getrandbits(32):08x}.prof',
+            )
+            profiler.dump_stats(record['profile'])
+        write_record(record)
+        return response
@@ -0,0 +1,103 @@
+"""
+Per-request performance profiles.
+
+Every database connection gets an execute wrapper that, while a profile is
+active in the current context, adds each query's time to it under a
+fingerprint (the SQL with parameter lists and literals collapsed), so
+repeated statements such as N+1 lookups show up as one fingerprint with a
+high count. Outside a profile the wrapper costs one ContextVar lookup.
+Profiles of sampled requests are appended to PERF_LOG as JSON lines, which
+``manage.py perf_report`` aggregates.
+"""
+import json
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+current_profile = ContextVar('request_profile', default=None)
+
+# Queries kept per logged request, by total time.
+LOGGED_QUERIES = 10
+MAX_SQL_LENGTH = 500
+
+PARAMETER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)(?:\s*,\s*\(\s*%s(?:\s*,\s*%s)*\s*\))*')
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+_log_lock = threading.Lock()
+
+
+def fingerprint(sql):
+    """``sql`` with IN/VALUES lists and literal values collapsed, so repeats of a statement compare equal."""
+    return LITERAL.sub('?', PARAMETER_LIST.sub('(...)', sql))
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.view_started = None
+        self.statements = {}  # fingerprint -> [count, seconds]
+
+    def add_query(self, sql, duration):
+        self.queries += 1
+        self.db_time += duration
+        entry = self.statements.setdefault(fingerprint(sql), [0, 0.0])
+        entry[0] += 1
+        entry[1] += duration
+
+    def duplicates(self, threshold):
+        """``(fingerprint, count, seconds)`` of the statements run at least ``threshold`` times."""
+        return sorted(
+            ((sql, count, seconds) for sql, (count, seconds) in self.statements.items() if count >= threshold),
+            key=lambda entry: -entry[1],
+        )
+
+    def slowest(self, limit=LOGGED_QUERIES):
+        return sorted(
+            ((sql, count, seconds) for sql, (count, seconds) in self.statements.items()),
+            key=lambda entry: -entry[2],
+        )[:limit]
+
+
+def record_query(execute, sql, params, many, context):
+    profile = current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add_query(sql, time.perf_counter() - started)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def query_entries(entries):
+    return [
+        {'sql': sql[:MAX_SQL_LENGTH], 'count': count, 'ms': round(seconds * 1000, 3)}
+        for sql, count, seconds in entries
+    ]
+
+
+def write_record(record):
+    """Append one request record to PERF_LOG."""
+    line = json.dumps(record, default=str) + '\n'
+    with _log_lock, open(settings.PERF_LOG, 'a', encoding='utf-8') as log:
+        log.write(line)
+
+
+def read_records(path):
+    """The request records in a PERF_LOG file; lines that do not parse are skipped."""
+    with open(path, encoding='utf-8') as log:
+        for line in log:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
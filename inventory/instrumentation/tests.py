@@ -0,0 +1,97 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from caching import store as cache_store
+from outbound.models import Outbound
+from profiles.models import Unit
+from stocks.models import Stock
+from .profile import RequestProfile, current_profile, fingerprint, read_records
+
+
+class PerformanceMiddlewareTests(TestCase):
+
+    def setUp(self):
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        self.log = os.path.join(directory, 'perf.log')
+        self.profiles = os.path.join(directory, 'profiles')
+        self.enterContext(override_settings(PERF_LOG=self.log, PERF_PROFILE_DIR=self.profiles, PERF_SAMPLE_RATE=1))
+        cache_store.clear()
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def test_unsampled_requests_are_only_timed(self):
+        with override_settings(PERF_SAMPLE_RATE=0):
+            response = self.client.get(reverse('admin:index'))
+
+        self.assertRegex(response['Server-Timing'], r'^app;dur=[\d.]+$')
+        self.assertFalse(os.path.exists(self.log))
+
+    def test_changelist_has_no_repeated_lookups(self):
+        unit = Unit.objects.create(name='Store 1')
+        for i in range(10):
+            Outbound.objects.create(processed_by=User.objects.create_user(f'clerk{i}'), unit=unit)
+
+        response = self.client.get(reverse('admin:outbound_outbound_changelist'))
+
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="\d+ queries", view;dur=')
+        self.assertNotIn('dup;', response['Server-Timing'])
+        [record] = read_records(self.log)
+        self.assertEqual((record['route'], record['status'], record['duplicates']),
+                         ('admin/outbound/outbound/', 200, []))
+        self.assertGreater(record['queries'], 0)
+
+    def test_repeated_statements_are_flagged(self):
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+        try:
+            for i in range(6):
+                Stock.objects.filter(pk=i).first()
+        finally:
+            current_profile.reset(token)
+
+        [(sql, count, seconds)] = profile.duplicates(5)
+        self.assertEqual(count, 6)
+        self.assertEqual(fingerprint('SELECT 1 FROM t WHERE id IN (%s, %s) AND name = \'x\''),
+                         'SELECT ? FROM t WHERE id IN (...) AND name = ?')
+
+    async def test_async_views_count_queries_made_in_threads(self):
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.get(reverse('api-stock-lookup'), {'stock_no': 'STK-1'})
+
+        self.assertEqual(response.status_code, 404)
+        [record] = read_records(self.log)
+        self.assertEqual(record['route'], 'api/stocks/lookup/')
+        self.assertGreaterEqual(record['queries'], 3)  # session, user, lookup
+
+    @override_settings(PERF_PROFILE_RATE=1)
+    def test_sampled_profile_dump(self):
+        self.client.get(reverse('admin:index'))
+
+        [record] = read_records(self.log)
+        self.assertTrue(record['profile'].startswith(self.profiles))
+        self.assertTrue(os.path.exists(record['profile']))
+
+    def test_report_ranks_endpoints_and_statements(self):
+        slow = {'sql': 'SELECT ? FROM stocks_stock WHERE id = ?', 'count': 40, 'ms': 80.0}
+        with open(self.log, 'w', encoding='utf-8') as log:
+            for ms in (10, 20, 30):
+                log.write(json.dumps({'method': 'GET', 'route': 'fast/', 'ms': ms, 'queries': 2, 'db_ms': 1,
+                                      'slowest': [], 'duplicates': []}) + '\n')
+            log.write(json.dumps({'method': 'GET', 'route': 'slow/', 'ms': 900, 'queries': 41, 'db_ms': 85,
+                                  'slowest': [slow], 'duplicates': [slow]}) + '\n')
+            log.write('not json\n')
+        out = StringIO()
+
+        call_command('perf_report', log=self.log, stdout=out)
+
+        endpoints, statements = out.getvalue().split('\n\n')
+        self.assertLess(endpoints.index('GET slow/'), endpoints.index('GET fast/'))
+        self.assertRegex(statements, r'80\.0\s+40\s+1\s+1  SELECT \? FROM stocks_stock')
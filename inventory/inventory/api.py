@@ -0,0 +1,256 @@
+"""
+Helpers shared by the JSON API views: authentication, cursor pagination,
+sparse field selection and conditional (ETag / Last-Modified) responses.
+
+API views accept the admin session or HTTP Basic credentials, so scanners
+and integrations can call them without a browser. A request that sends an
+Authorization header is authenticated by it alone and skips the CSRF check;
+any other request needs the session and, to write, a CSRF token.
+"""
+import base64
+import hashlib
+import json
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.auth import aauthenticate, authenticate
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, urlencode
+from django.views.decorators.csrf import csrf_exempt
+
+from .pagination import decode_cursor, decode_key, encode_cursor, seek_filter
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class APIError(Exception):
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.extra = extra
+
+
+def error_response(message, status, **extra):
+    return JsonResponse({'error': message, **extra}, status=status)
+
+
+def basic_credentials(request):
+    """``(username, password)`` from an HTTP Basic Authorization header, or None."""
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        username, _, password = base64.b64decode(credentials).decode().partition(':')
+    except ValueError:
+        return None
+    return username, password
+
+
+def basic_auth_user(request):
+    credentials = basic_credentials(request)
+    return authenticate(request, username=credentials[0], password=credentials[1]) if credentials else None
+
+
+async def abasic_auth_user(request):
+    credentials = basic_credentials(request)
+    return await aauthenticate(request, username=credentials[0], password=credentials[1]) if credentials else None
+
+
+class CSRFCheck(CsrfViewMiddleware):
+
+    def _reject(self, request, reason):
+        return reason
+
+
+def csrf_failure(request):
+    check = CSRFCheck(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+def method_not_allowed(request, methods):
+    if request.method in methods:
+        return None
+    response = error_response('Method not allowed.', 405)
+    response['Allow'] = ', '.join(methods)
+    return response
+
+
+def sends_credentials(request):
+    """Whether the request carries its own credentials, which a cross-site page cannot make a browser add."""
+    return 'HTTP_AUTHORIZATION' in request.META
+
+
+def session_csrf_failure(request):
+    """A 403 for a session-authenticated write without a valid CSRF token, else None."""
+    reason = None if request.method in SAFE_METHODS else csrf_failure(request)
+    return error_response(f'CSRF check failed: {reason}', 403) if reason else None
+
+
+def authentication_required():
+    response = error_response('Authentication required.', 401)
+    response['WWW-Authenticate'] = 'Basic realm="inventory"'
+    return response
+
+
+def api_view(methods=SAFE_METHODS, permission=None):
+    """
+    Wrap a view returning a JsonResponse: allow only ``methods``, require an
+    authenticated user (optionally holding ``permission``) and turn APIError
+    into a JSON error response. Coroutine views stay asynchronous.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            async def wrapper(request, *args, **kwargs):
+                rejected = method_not_allowed(request, methods)
+                if rejected:
+                    return rejected
+                if sends_credentials(request):
+                    user = await abasic_auth_user(request)
+                    if user is None:
+                        return authentication_required()
+                else:
+                    user = await request.auser()
+                    if not user.is_authenticated:
+                        return authentication_required()
+                    rejected = session_csrf_failure(request)
+                    if rejected:
+                        return rejected
+                request.user = user
+
+                if permission and not await sync_to_async(user.has_perm)(permission):
+                    return error_response('Permission denied.', 403)
+                try:
+                    return await view(request, *args, **kwargs)
+                except APIError as error:
+                    return error_response(error.message, error.status, **error.extra)
+        else:
+            def wrapper(request, *args, **kwargs):
+                rejected = method_not_allowed(request, methods)
+                if rejected:
+                    return rejected
+                if sends_credentials(request):
+                    user = basic_auth_user(request)
+                    if user is None:
+                        return authentication_required()
+                    request.user = user
+                else:
+                    if not request.user.is_authenticated:
+                        return authentication_required()
+                    rejected = session_csrf_failure(request)
+                    if rejected:
+                        return rejected
+
+                if permission and not request.user.has_perm(permission):
+                    return error_response('Permission denied.', 403)
+                try:
+                    return view(request, *args, **kwargs)
+                except APIError as error:
+                    return error_response(error.message, error.status, **error.extra)
+        return csrf_exempt(wraps(view)(wrapper))
+    return decorator
+
+
+def read_json(request):
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        raise APIError('The request body is not valid JSON.')
+
+
+def select_fields(request, available):
+    """
+    The field names asked for with ``?fields=a,b``, checked against
+    ``available`` (all of them when not given). ``id`` is always included.
+    """
+    requested = request.GET.get('fields')
+    if not requested:
+        return list(available)
+    fields = [name.strip() for name in requested.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in available]
+    if unknown:
+        raise APIError(f'Unknown field(s): {", ".join(unknown)}.', available=list(available))
+    return ['id'] + [name for name in dict.fromkeys(fields) if name != 'id']
+
+
+def fetch_values(queryset, fields, paths):
+    """Rows of ``queryset`` as dicts keyed by the API ``fields``, read through their ORM ``paths``."""
+    names = [name for name in fields if name in paths]
+    return [dict(zip(names, row)) for row in queryset.values_list(*[paths[name] for name in names])]
+
+
+async def afetch_values(queryset, fields, paths):
+    names = [name for name in fields if name in paths]
+    # values() rather than values_list(): Django 5.0's ValuesListIterable runs
+    # its query eagerly, outside the thread aiterator() hands it to.
+    return [
+        {name: row[paths[name]] for name in names}
+        async for row in queryset.values(*[paths[name] for name in names]).aiterator()
+    ]
+
+
+class CursorPage:
+    """
+    One page of ``queryset`` in ``ordering`` (which must end in the primary
+    key), starting after the ``?cursor=`` position and holding at most
+    ``?limit=`` rows.
+    """
+
+    def __init__(self, request, queryset, ordering=('id',)):
+        self.request = request
+        self.ordering = list(ordering)
+        try:
+            self.limit = min(int(request.GET.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        except ValueError:
+            raise APIError('limit must be a number.')
+        if self.limit < 1:
+            raise APIError('limit must be at least 1.')
+
+        cursor = request.GET.get('cursor')
+        if cursor:
+            try:
+                values = decode_key(queryset.model, self.ordering, decode_cursor(cursor))
+            except ValueError:
+                values = None
+            if values is None:
+                raise APIError('Invalid cursor.')
+            queryset = queryset.filter(seek_filter(self.ordering, values))
+        # One extra row tells whether there is a next page.
+        self.queryset = queryset.order_by(*self.ordering)[:self.limit + 1]
+
+    def paginate(self, rows):
+        """Trim the extra row from ``rows`` (dicts with the ordering keys) and build the response body."""
+        rows = list(rows)
+        next_url = None
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            key = [rows[-1][field.lstrip('-')] for field in self.ordering]
+            params = {**self.request.GET.dict(), 'cursor': encode_cursor(key)}
+            next_url = self.request.build_absolute_uri(f'{self.request.path}?{urlencode(params)}')
+        return {'results': rows, 'next': next_url}
+
+
+def make_etag(*parts):
+    return '"{}"'.format(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def not_modified(request, etag, last_modified=None):
+    """A 304 response when the client's copy is current, else None."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    return None if response is None else set_validators(response, etag, last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Clients may keep the body but must revalidate before using it.
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,37 @@
+"""
+SQLite tuned for a single-node install with concurrent writers.
+
+Every new connection gets the PRAGMAs in ``OPTIONS['pragmas']`` (WAL so
+readers never wait for a writer, ``synchronous=NORMAL``, a busy timeout and
+memory-mapped reads). ``OPTIONS['transaction_mode']`` is how transactions
+opened by inventory.transactions.write_atomic() begin (``BEGIN IMMEDIATE``
+takes the write lock up front); every other transaction is DEFERRED. Unlike
+Django 5.1's option of the same name, it leaves read-only blocks alone.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    writing = False  # set by write_atomic()
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop('pragmas', {})
+        self.transaction_mode = (kwargs.pop('transaction_mode', None) or 'DEFERRED').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"transaction_mode must be one of {', '.join(TRANSACTION_MODES)}, not {self.transaction_mode!r}."
+            )
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode if self.writing else 'DEFERRED'}")
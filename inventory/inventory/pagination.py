@@ -0,0 +1,207 @@
+"""
+Keyset (seek) pagination for admin changelists.
+
+Moving to the next or previous page seeks past the first/last row of the
+current page (``WHERE (date, id) < (…)``) instead of using OFFSET, so every
+page costs the same as page one. The row count is only exact up to a
+threshold; beyond it an estimate is shown instead of a full ``COUNT(*)``.
+Sorting by a column or searching falls back to regular numbered pages.
+"""
+import base64
+import binascii
+import json
+
+from django.contrib.admin.views.main import ORDER_VAR, SEARCH_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
+
+CURSOR_VAR = 'cursor'
+NEXT, PREVIOUS = 'next', 'prev'
+
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+def seek_filter(ordering, values):
+    """Rows that come strictly after ``values`` in ``ordering``."""
+    condition = Q()
+    equal = {}
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
+
+
+def estimate_count(queryset):
+    """A cheap row estimate, or None when the backend cannot give one."""
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        plan = json.loads(queryset.explain(format='json'))
+        return int(plan[0]['Plan']['Plan Rows'])
+    if not queryset.query.where:
+        # Unfiltered: ids are close enough to a row count for a page header.
+        return queryset.model._default_manager.using(queryset.db).aggregate(last=Max('pk'))['last']
+    return None
+
+
+def encode_cursor(payload):
+    """An opaque, URL-safe token for a JSON-serializable ``payload``."""
+    # isoformat() keeps microseconds, which a seek comparison needs.
+    def default(value):
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        raise TypeError(f'{type(value).__name__} cannot be put in a cursor.')
+
+    return base64.urlsafe_b64encode(json.dumps(payload, default=default).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """The payload of an encode_cursor() token; ValueError if it does not parse."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError) as error:
+        raise ValueError(str(error))
+
+
+def decode_key(model, ordering, values):
+    """Convert decoded cursor ``values`` back to ``ordering``'s field types, or None."""
+    if not isinstance(values, list):
+        return None
+    fields = [model._meta.get_field(field.lstrip('-')) for field in ordering]
+    if len(values) != len(fields):
+        return None
+    try:
+        return [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValidationError, ValueError, TypeError):
+        return None
+
+
+class KeysetPaginator(Paginator):
+
+    def __init__(self, object_list, per_page, ordering, cursor=None, estimate_above=10000, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.ordering = list(ordering)
+        self.estimate_above = estimate_above
+        self.count_is_estimate = False
+        self.has_next_after_cursor = False
+        self.cursor = self.decode_cursor(cursor) if cursor and self.is_keyset else None
+
+    @cached_property
+    def is_keyset(self):
+        order_by = list(self.object_list.query.order_by)
+        return order_by[:len(self.ordering)] == self.ordering
+
+    @cached_property
+    def count(self):
+        capped = self.object_list[:self.estimate_above + 1].count()
+        if capped <= self.estimate_above:
+            return capped
+        self.count_is_estimate = True
+        return max(estimate_count(self.object_list) or 0, capped)
+
+    def key_for(self, obj):
+        return [getattr(obj, field.lstrip('-')) for field in self.ordering]
+
+    def encode_cursor(self, direction, obj):
+        return encode_cursor([direction, self.key_for(obj)])
+
+    def decode_cursor(self, cursor):
+        """Return ``(direction, values)``, or None for a cursor that does not parse."""
+        try:
+            direction, values = decode_cursor(cursor)
+        except (ValueError, TypeError):
+            return None
+        if direction not in (NEXT, PREVIOUS):
+            return None
+        values = decode_key(self.object_list.model, self.ordering, values)
+        return None if values is None else (direction, values)
+
+    def page(self, number):
+        if self.cursor is None:
+            page = super().page(number)
+            page.object_list = list(page.object_list)
+            return page
+
+        number = max(int(number), 1)
+        direction, values = self.cursor
+        if direction == NEXT:
+            rows = list(self.object_list.filter(seek_filter(self.ordering, values))[:self.per_page + 1])
+            self.has_next_after_cursor = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+        else:
+            ordering = reverse_ordering(self.ordering)
+            queryset = self.object_list.order_by(*ordering)
+            rows = list(queryset.filter(seek_filter(ordering, values))[:self.per_page])
+            rows.reverse()
+            self.has_next_after_cursor = True
+        return self._get_page(rows, number, self)
+
+
+class KeysetChangeList(ChangeList):
+
+    def __init__(self, request, *args, **kwargs):
+        super().__init__(request, *args, **kwargs)
+        # Links built from here on (sorting, filters, numbered pages) must not
+        # carry the seek position of the current page.
+        self.params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(CURSOR_VAR, None)
+        return params
+
+    def get_results(self, request):
+        super().get_results(request)
+        paginator = self.paginator
+        self.keyset_active = paginator.is_keyset and self.multi_page and not (self.show_all and self.can_show_all)
+        self.result_count_is_estimate = paginator.count_is_estimate
+        self.keyset_previous_url = self.keyset_next_url = None
+        if not self.keyset_active:
+            return
+
+        rows = self.result_list
+        if rows and self.page_num > 1:
+            self.keyset_previous_url = self.get_query_string(
+                {CURSOR_VAR: paginator.encode_cursor(PREVIOUS, rows[0]), 'p': self.page_num - 1}
+            )
+        if paginator.cursor is not None:
+            has_next = paginator.has_next_after_cursor
+        else:
+            has_next = self.page_num < paginator.num_pages
+        if rows and has_next:
+            self.keyset_next_url = self.get_query_string(
+                {CURSOR_VAR: paginator.encode_cursor(NEXT, rows[-1]), 'p': self.page_num + 1}
+            )
+
+
+class KeysetPaginationMixin:
+    """
+    ModelAdmin mixin: order the changelist by ``keyset_ordering`` (which must
+    end in the primary key) and page through it with KeysetPaginator.
+    """
+    keyset_ordering = ('-id',)
+    estimate_count_above = 10000
+    show_full_result_count = False
+
+    def get_ordering(self, request):
+        if request.GET.get(SEARCH_VAR) or request.GET.get(ORDER_VAR):
+            return super().get_ordering(request)
+        return self.keyset_ordering
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        return KeysetPaginator(
+            queryset, per_page, self.keyset_ordering,
+            cursor=request.GET.get(CURSOR_VAR),
+            estimate_above=self.estimate_count_above,
+            orphans=orphans,
+            allow_empty_first_page=allow_empty_first_page,
+        )
@@ -6,4 +6,6 @@ from .settings import *  # Import all settings from settings.py
 DEBUG = False
 ALLOWED_HOSTS = []
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# Cheap enough to leave on: profile one request in a hundred.
+PERF_SAMPLE_RATE = float(os.environ.get('PERF_SAMPLE_RATE', 0.01))
 # Add more production-specific settings as needed
@@ -0,0 +1,29 @@
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DB_ALIAS = 'replica'
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads to the ``replica`` database and everything else to the primary.
+
+    Reads made while the primary has a transaction open stay on the primary,
+    so code that writes and then reads back (stock deductions, the import
+    upsert) sees its own changes; SELECT ... FOR UPDATE is routed as a write.
+    Other reads may trail the primary by the replication lag.
+    """
+
+    def db_for_read(self, model, **hints):
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same rows.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
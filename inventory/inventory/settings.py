@@ -42,9 +42,15 @@ INSTALLED_APPS = [
     'outbound',
     'stocks',
     'profiles',
+    'search',
+    'caching',
+    'jobs',
+    'instrumentation',
+    'benchmarks',
 ]
 
 MIDDLEWARE = [
+    'instrumentation.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -52,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'caching.middleware.CacheStatsMiddleware',
 ]
 
 ROOT_URLCONF = 'inventory.urls'
@@ -77,13 +84,117 @@ WSGI_APPLICATION = 'inventory.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
+# DB_ENGINE picks 'sqlite' (default, single node) or 'postgresql'. Connections
+# are kept open for DB_CONN_MAX_AGE seconds and checked before reuse.
+# DB_POOLER=pgbouncer is for PostgreSQL behind PgBouncer in transaction mode.
+# Setting DB_REPLICA_HOST sends reads to that PostgreSQL replica.
+
 print('BASE DIRECTORY PATH: ', BASE_DIR)
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+DB_CONN_MAX_AGE = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+DB_ENGINES = {
+    'sqlite': {
+        'ENGINE': 'inventory.backends.sqlite3',
+        'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),  # Use Path for consistency
+        # DB_SQLITE_TUNING=off restores the stock behaviour, for benchmarks.
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'busy_timeout': int(os.environ.get('DB_BUSY_TIMEOUT', 5000)),  # ms
+                'mmap_size': 256 * 1024 * 1024,
+                'temp_store': 'MEMORY',
+            },
+        } if os.environ.get('DB_SQLITE_TUNING') != 'off' else {
+            # WAL is stored in the database file, so it has to be switched back.
+            'pragmas': {'journal_mode': 'DELETE'},
+        },
+    },
+    'postgresql': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'inventory'),
+        'USER': os.environ.get('DB_USER', 'inventory'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', '127.0.0.1'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        # PgBouncer's transaction pooling cannot keep cursors across transactions.
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_POOLER') == 'pgbouncer',
+        'OPTIONS': {
+            'connect_timeout': 5,
+        },
+    },
+}
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',  # Use Path for consistency
+        **DB_ENGINES[DB_ENGINE],
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default'].get('PORT', '')),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['inventory.routers.PrimaryReplicaRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+# CACHE_BACKEND picks the shared tier: 'locmem' (default, per process), 'file'
+# or 'redis' (anything speaking the Redis protocol, e.g. a local Valkey).
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'inventory',
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', BASE_DIR / 'cache'),
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'redis://127.0.0.1:6379/1'),
+    },
+}
+CACHES = {
+    'default': {
+        **CACHE_BACKENDS[CACHE_BACKEND],
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
     }
 }
+# Entries kept in each process's LRU tier in front of CACHES['default'].
+CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', 1000))
+
+# Request instrumentation: every response carries a Server-Timing header; a
+# PERF_SAMPLE_RATE share of requests also records its queries to PERF_LOG
+# (summarized by `manage.py perf_report`), and a PERF_PROFILE_RATE share of
+# those is run under cProfile, dumped into PERF_PROFILE_DIR.
+PERF_SAMPLE_RATE = float(os.environ.get('PERF_SAMPLE_RATE', 0))
+PERF_PROFILE_RATE = float(os.environ.get('PERF_PROFILE_RATE', 0))
+PERF_LOG = os.environ.get('PERF_LOG', os.path.join(BASE_DIR, 'perf.log'))
+PERF_PROFILE_DIR = os.environ.get('PERF_PROFILE_DIR', os.path.join(BASE_DIR, 'perf_profiles'))
+# A statement run this many times in one request is reported as a likely N+1.
+PERF_DUPLICATE_THRESHOLD = int(os.environ.get('PERF_DUPLICATE_THRESHOLD', 5))
+
+# Background jobs: uploads waiting for a worker and finished job results are
+# kept here, so every worker host must share the directory.
+JOB_RESULTS_ROOT = os.environ.get('JOB_RESULTS_ROOT', os.path.join(BASE_DIR, 'job_results'))
+# Worker processes started by `manage.py run_workers`.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+
+# How long a stock reservation holds quantity before it lapses, in seconds.
+# `manage.py sweep_reservations` deletes the lapsed rows.
+STOCK_HOLD_SECONDS = int(os.environ.get('STOCK_HOLD_SECONDS', 15 * 60))
+
+# Makes Outbound.transaction_ref; see outbound/references.py for the choices.
+OUTBOUND_REFERENCE_GENERATOR = os.environ.get(
+    'OUTBOUND_REFERENCE_GENERATOR', 'outbound.references.TimeOrderedReferenceGenerator',
+)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
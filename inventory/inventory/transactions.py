@@ -0,0 +1,58 @@
+"""
+Transactions for blocks that read rows and then write them.
+
+SQLite ignores SELECT ... FOR UPDATE, and a transaction that has read cannot
+later take the write lock if another writer got there first: one of them
+fails with "database is locked" instead of waiting out the busy timeout.
+write_atomic() marks the block so that the SQLite backend opens it with
+``OPTIONS['transaction_mode']`` (BEGIN IMMEDIATE) and holds the write lock
+from the start. Other transactions stay DEFERRED, so reads never queue
+behind writers. On other databases it is transaction.atomic().
+"""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_protect
+
+csrf_protect_m = method_decorator(csrf_protect)
+
+
+@contextmanager
+def write_atomic(using=None, savepoint=True):
+    """transaction.atomic() that takes the database's write lock when it opens a transaction."""
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    writing, connection.writing = getattr(connection, 'writing', False), True
+    try:
+        with transaction.atomic(using, savepoint=savepoint):
+            yield
+    finally:
+        connection.writing = writing
+
+
+class WriteAtomicAdminMixin:
+    """
+    ModelAdmin mixin that runs the change, delete and changelist POSTs in
+    write_atomic() instead of the admin's own atomic block, so their saves
+    never have to upgrade a read transaction. Other requests only read.
+    """
+
+    @csrf_protect_m
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        if request.method != 'POST':
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        with write_atomic(router.db_for_write(self.model)):
+            return self._changeform_view(request, object_id, form_url, extra_context)
+
+    @csrf_protect_m
+    def delete_view(self, request, object_id, extra_context=None):
+        if request.method != 'POST':
+            return super().delete_view(request, object_id, extra_context)
+        with write_atomic(router.db_for_write(self.model)):
+            return self._delete_view(request, object_id, extra_context)
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'POST':
+            return super().changelist_view(request, extra_context)
+        with write_atomic(router.db_for_write(self.model)):
+            return super().changelist_view(request, extra_context)
@@ -0,0 +1,94 @@
+import os
+
+from django import forms
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import Job
+from .registry import TASKS, maintenance_choices
+
+
+class MaintenanceJobForm(forms.ModelForm):
+    task = forms.ChoiceField(choices=maintenance_choices)
+
+    class Meta:
+        model = Job
+        fields = ('task',)
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'task_label', 'status', 'progress', 'created_by', 'created_at', 'finished_at',
+                    'download_link')
+    list_filter = ('status', 'task')
+    list_select_related = ('created_by',)
+    ordering = ('-id',)
+    readonly_fields = ('task', 'arguments', 'status', 'progress', 'message', 'download_link', 'created_by',
+                       'worker', 'created_at', 'started_at', 'heartbeat_at', 'finished_at')
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        # Results can hold anything the requester could see; keep them to their owner.
+        return queryset if request.user.is_superuser else queryset.filter(created_by=request.user)
+
+    def has_module_permission(self, request):
+        return request.user.is_active and request.user.is_staff
+
+    def has_view_permission(self, request, obj=None):
+        # Staff may follow the jobs they queued; get_queryset hides the rest.
+        return request.user.is_active and request.user.is_staff
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_form(self, request, obj=None, **kwargs):
+        if obj is None:
+            kwargs['form'] = MaintenanceJobForm
+        return super().get_form(request, obj, **kwargs)
+
+    def get_fields(self, request, obj=None):
+        return ('task',) if obj is None else self.readonly_fields
+
+    def get_readonly_fields(self, request, obj=None):
+        return () if obj is None else self.readonly_fields
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.created_by = request.user
+        super().save_model(request, obj, form, change)
+
+    def get_urls(self):
+        urls = [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view), name='jobs_job_download'),
+        ]
+        return urls + super().get_urls()
+
+    def download_view(self, request, pk):
+        job = get_object_or_404(self.get_queryset(request), pk=pk)
+        if not self.has_view_permission(request, job):
+            raise PermissionDenied
+        if not job.result:
+            raise Http404('This job has no result file.')
+        return FileResponse(job.result.open('rb'), as_attachment=True, filename=os.path.basename(job.result.name))
+
+    @admin.display(description='task')
+    def task_label(self, obj):
+        task = TASKS.get(obj.task)
+        return task.label if task else obj.task
+
+    @admin.display(description='progress')
+    def progress(self, obj):
+        if obj.progress_total:
+            return f'{obj.progress_done} / {obj.progress_total}'
+        return obj.progress_done or ''
+
+    @admin.display(description='result')
+    def download_link(self, obj):
+        if not obj.result:
+            return ''
+        return format_html('<a href="{}">Download</a>', reverse('admin:jobs_job_download', args=[obj.pk]))
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,58 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from jobs.queue import work, worker_name
+
+
+def worker_process(poll_interval, burst):
+    import django
+
+    django.setup()  # a no-op when the process was forked
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    work(worker_name(), poll_interval, burst, stop)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run background jobs (exports, imports, ledger rebuilds, rollup backfills) in a pool of worker '
+        'processes. SIGTERM lets every worker finish its current job before exiting.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.JOB_WORKERS,
+                            help='Number of worker processes (JOB_WORKERS by default).')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds an idle worker waits before looking for work again.')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] <= 1:
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+            count = work(worker_name(), options['poll_interval'], options['burst'], stop)
+            self.stdout.write(self.style.SUCCESS(f'Ran {count} jobs.'))
+            return
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=worker_process, args=(options['poll_interval'], options['burst']))
+            for _ in range(options['concurrency'])
+        ]
+        for process in processes:
+            process.start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: [process.terminate() for process in processes])
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            # The children got the SIGINT too and stop after their current job.
+            for process in processes:
+                process.join()
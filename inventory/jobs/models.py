@@ -0,0 +1,65 @@
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.utils import timezone
+
+
+class JobStorage(FileSystemStorage):
+    """Files under JOB_RESULTS_ROOT, read on every use rather than once at startup."""
+
+    @property
+    def base_location(self):
+        return settings.JOB_RESULTS_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+def job_storage():
+    """Where uploads waiting for a job and job results live; workers must see the same directory."""
+    return JobStorage()
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    arguments = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    progress_done = models.IntegerField(default=0)
+    progress_total = models.IntegerField(null=True, blank=True)
+    message = models.TextField(blank=True)  # the task's summary, or the error it failed with
+    result = models.FileField(storage=job_storage, upload_to='results/%Y/%m/', blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued job; finished jobs stay out of the index.
+            models.Index(fields=['id'], name='job_queued_idx', condition=models.Q(status='queued')),
+            models.Index(fields=['created_by', 'id'], name='job_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk}'
+
+    @property
+    def is_finished(self):
+        return self.status in (self.SUCCEEDED, self.FAILED)
@@ -0,0 +1,143 @@
+"""
+A job queue kept in the database.
+
+enqueue() inserts a Job row; ``manage.py run_workers`` processes claim the
+oldest queued row, run its task and record the outcome on it. A worker
+refreshes heartbeat_at while its job runs, so jobs left behind by a worker
+that died are put back in the queue once the heartbeat goes stale.
+"""
+import os
+import socket
+import tempfile
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connections, router
+from django.utils import timezone
+
+from inventory.transactions import write_atomic
+from .models import Job
+from .registry import TASKS
+
+HEARTBEAT_INTERVAL = getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 10)  # seconds
+STALE_AFTER = getattr(settings, 'JOB_STALE_AFTER', 120)  # seconds without a heartbeat
+PROGRESS_INTERVAL = 1.0  # seconds between progress writes
+
+
+def enqueue(task_name, arguments=None, user=None):
+    if task_name not in TASKS:
+        raise ValueError(f'Unknown task {task_name!r}.')
+    return Job.objects.create(task=task_name, arguments=arguments or {}, created_by=user)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim(worker):
+    """Mark the oldest queued job as running on ``worker`` and return it, or None."""
+    while True:
+        with write_atomic():
+            queued = Job.objects.filter(status=Job.QUEUED).order_by('id')
+            if connections[router.db_for_write(Job)].features.has_select_for_update_skip_locked:
+                queued = queued.select_for_update(skip_locked=True)
+            job = queued.first()
+            if job is None:
+                return None
+            now = timezone.now()
+            # The status guard keeps two workers from taking the same job
+            # where rows cannot be locked.
+            claimed = Job.objects.filter(pk=job.pk, status=Job.QUEUED).update(
+                status=Job.RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+            )
+        if claimed:
+            job.status, job.worker, job.started_at, job.heartbeat_at = Job.RUNNING, worker, now, now
+            return job
+
+
+def requeue_stale():
+    """Put back jobs whose worker stopped sending heartbeats. Returns how many."""
+    cutoff = timezone.now() - timedelta(seconds=STALE_AFTER)
+    return Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff).update(status=Job.QUEUED, worker='')
+
+
+class JobContext:
+    """What a task gets: the requesting user, progress reporting and a result file."""
+
+    def __init__(self, job):
+        self.job = job
+        self.user = job.created_by
+        self.last_progress = 0.0
+
+    def progress(self, done, total=None):
+        now = time.monotonic()
+        if now - self.last_progress < PROGRESS_INTERVAL and (total is None or done < total):
+            return
+        self.last_progress = now
+        Job.objects.filter(pk=self.job.pk).update(progress_done=done, progress_total=total)
+
+    def save_result(self, filename, chunks):
+        """Write ``chunks`` (str or bytes) to the job's downloadable result file."""
+        with tempfile.TemporaryFile() as handle:
+            for chunk in chunks:
+                handle.write(chunk.encode() if isinstance(chunk, str) else chunk)
+            handle.seek(0)
+            self.job.result.save(filename, File(handle), save=False)
+
+
+def heartbeat(job, stop):
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            Job.objects.filter(pk=job.pk, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+    finally:
+        connections.close_all()
+
+
+def run_job(job):
+    """Run a claimed job's task and record how it went."""
+    stop = threading.Event()
+    beat = threading.Thread(target=heartbeat, args=(job, stop), daemon=True)
+    beat.start()
+    context = JobContext(job)
+    try:
+        task = TASKS.get(job.task)
+        if task is None:
+            raise LookupError(f'Unknown task {job.task!r}.')
+        message = task.func(context, **job.arguments) or ''
+        status = Job.SUCCEEDED
+    except Exception:
+        message, status = traceback.format_exc(), Job.FAILED
+    finally:
+        stop.set()
+        beat.join()
+
+    Job.objects.filter(pk=job.pk).update(
+        status=status, message=message, result=job.result.name or '', finished_at=timezone.now(),
+    )
+    job.status, job.message = status, message
+    return job
+
+
+def work(worker=None, poll_interval=1.0, burst=False, stop=None):
+    """
+    Claim and run jobs until ``stop`` is set, or with ``burst`` until the
+    queue is empty. Returns the number of jobs run.
+    """
+    worker = worker or worker_name()
+    stop = stop or threading.Event()
+    count = 0
+    while not stop.is_set():
+        requeue_stale()
+        job = claim(worker)
+        if job is None:
+            if burst:
+                break
+            stop.wait(poll_interval)
+            continue
+        run_job(job)
+        count += 1
+    return count
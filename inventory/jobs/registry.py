@@ -0,0 +1,26 @@
+TASKS = {}
+
+
+class Task:
+
+    def __init__(self, name, func, label, maintenance):
+        self.name = name
+        self.func = func
+        self.label = label
+        self.maintenance = maintenance
+
+
+def task(name, label=None, maintenance=False):
+    """
+    Register a function as a background task under ``name``. It is called
+    with a JobContext and the job's arguments, and may return a summary.
+    ``maintenance`` tasks take no arguments and can be queued from the admin.
+    """
+    def decorator(func):
+        TASKS[name] = Task(name, func, label or name, maintenance)
+        return func
+    return decorator
+
+
+def maintenance_choices():
+    return sorted((name, task.label) for name, task in TASKS.items() if task.maintenance)
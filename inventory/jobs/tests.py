@@ -0,0 +1,121 @@
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from outbound.models import Outbound
+from outbound.services import issue_outbound
+from profiles.models import Unit
+from stocks.models import Stock
+from .models import Job
+from .queue import claim, enqueue, requeue_stale, run_job, work
+from .registry import task
+
+
+@task('tests.fail')
+def failing_task(context):
+    raise RuntimeError('no luck')
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        self.enterContext(override_settings(JOB_RESULTS_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        stock = Stock.objects.create(stock_no='STK-1', unit='pcs', description='', quantity=100)
+        unit = Unit.objects.create(name='Store 1')
+        for _ in range(3):
+            issue_outbound(Outbound.objects.create(processed_by=self.user, unit=unit), [(stock, 1)])
+
+    def test_oldest_job_is_claimed_once(self):
+        first, second = enqueue('outbound.backfill_totals'), enqueue('outbound.backfill_totals')
+
+        self.assertEqual(claim('worker-1').pk, first.pk)
+        self.assertEqual(claim('worker-2').pk, second.pk)
+        self.assertIsNone(claim('worker-3'))
+        self.assertEqual(Job.objects.get(pk=first.pk).worker, 'worker-1')
+
+    def test_unknown_task_is_refused(self):
+        with self.assertRaises(ValueError):
+            enqueue('tests.missing')
+
+    def test_failure_keeps_the_traceback(self):
+        enqueue('tests.fail')
+
+        job = run_job(claim('worker'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertIn('RuntimeError: no luck', job.message)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_stale_jobs_are_requeued(self):
+        job = enqueue('outbound.backfill_totals')
+        claim('worker')
+        Job.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(work(burst=True), 1)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.SUCCEEDED)
+
+    def test_export_is_downloaded_from_its_job(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('admin:outbound_outbound_changelist'), {
+            'action': 'export_as_csv', '_selected_action': list(Outbound.objects.values_list('pk', flat=True)),
+        }, follow=True)
+        job = Job.objects.get()
+        self.assertContains(response, reverse('admin:jobs_job_change', args=[job.pk]))
+
+        call_command('run_workers', burst=True, concurrency=1, stdout=StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress_done, job.progress_total), (Job.SUCCEEDED, 3, 3))
+        self.assertContains(self.client.get(reverse('admin:jobs_job_changelist')),
+                            reverse('admin:jobs_job_download', args=[job.pk]))
+        download = self.client.get(reverse('admin:jobs_job_download', args=[job.pk]))
+        self.assertIn('attachment', download['Content-Disposition'])
+        self.assertEqual(len(b''.join(download.streaming_content).decode().splitlines()), 4)
+
+    def test_export_of_all_matches_resolves_the_filter_in_the_job(self):
+        large = Outbound.objects.create(processed_by=self.user, unit=Unit.objects.get())
+        issue_outbound(large, [(Stock.objects.get(), 20)])
+        self.client.force_login(self.user)
+        self.client.post(reverse('admin:outbound_outbound_changelist') + '?total_quantity=11-100', {
+            'action': 'export_as_csv', 'select_across': '1', '_selected_action': [large.pk],
+        })
+        job = Job.objects.get()
+        self.assertEqual(job.arguments, {'query': 'total_quantity=11-100', 'selected': None, 'format': 'csv'})
+
+        work(burst=True)
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress_total), (Job.SUCCEEDED, 1))
+        download = self.client.get(reverse('admin:jobs_job_download', args=[job.pk]))
+        self.assertIn(large.transaction_ref, b''.join(download.streaming_content).decode())
+
+    def test_results_are_private_to_their_owner(self):
+        job = enqueue('outbound.export', {'selected': [], 'format': 'csv'}, user=self.user)
+        work(burst=True)
+        clerk = User.objects.create_user('clerk', password='password', is_staff=True)
+        self.client.force_login(clerk)
+
+        self.assertEqual(self.client.get(reverse('admin:jobs_job_download', args=[job.pk])).status_code, 404)
+
+    def test_maintenance_job_from_the_admin(self):
+        self.client.force_login(self.user)
+        add_page = self.client.get(reverse('admin:jobs_job_add'))
+        self.assertContains(add_page, 'stocks.rebuild_balances')
+        self.assertNotContains(add_page, 'outbound.export')
+
+        self.client.post(reverse('admin:jobs_job_add'), {'task': 'stocks.rebuild_balances'})
+
+        job = Job.objects.get()
+        self.assertEqual((job.task, job.created_by, job.status), ('stocks.rebuild_balances', self.user, Job.QUEUED))
+        work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual(job.message, 'Rebuilt balances of 1 stocks.')
@@ -1,12 +1,174 @@
-from django.contrib import admin
-from django.http import HttpResponse
-import csv
-from django.utils.translation import gettext_lazy as _
+from collections import defaultdict
+from datetime import timedelta
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.db.models import Sum
-from .models import Outbound, OutboundItem
+from django.forms.models import BaseInlineFormSet
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.choices import BaseChoiceIterator
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from django.utils.translation import gettext_lazy as _
+from caching.forms import CachedModelChoiceField
+from caching.store import cached_queryset
+from inventory.pagination import KeysetPaginationMixin
+from inventory.transactions import WriteAtomicAdminMixin
+from jobs.queue import enqueue
+from search.backends import IndexedSearchMixin
+from stocks.models import Stock, StockLocation
+from stocks.services import unavailable
+from profiles.models import Unit
+from .models import Outbound, OutboundItem, OutboundReversal
+from .rollups import outflow_summary
+from .services import reconcile_outbound_items, reverse_outbounds
+
+DASHBOARD_PERIODS = (30, 90, 365)  # days
+
+
+class SharedChoiceIterator(BaseChoiceIterator):
+    # Evaluated on first render only, then replayed for every other row.
+
+    def __init__(self, choices):
+        self.choices = choices
+        self.cache = None
+
+    def __iter__(self):
+        if self.cache is None:
+            self.cache = list(self.choices)
+        return iter(self.cache)
+
+
+class StockChoiceField(CachedModelChoiceField):
+    # Filled by OutboundItemFormSet with every stock submitted in the form, so
+    # each row resolves its choice without a query of its own.
+    resolved = None
+
+    def to_python(self, value):
+        if self.resolved is not None and value not in self.empty_values:
+            stock = self.resolved.get(str(value))
+            if stock is not None:
+                return stock
+        return super().to_python(value)
+
+    def share_choices(self, choices):
+        # Render every inline row from one evaluated list instead of
+        # re-running the stock query for each row's <select>.
+        self.choices = choices
+        widget = getattr(self.widget, 'widget', None)
+        if widget is not None:
+            widget.choices = choices
+
+
+class OutboundItemForm(forms.ModelForm):
+
+    def _get_validation_exclusions(self):
+        # The stock choice has already been checked against the database by
+        # StockChoiceField; skip the per-row foreign key existence query.
+        exclusions = super()._get_validation_exclusions()
+        exclusions.add('stock')
+        return exclusions
+
+
+class OutboundItemFormSet(BaseInlineFormSet):
+
+    @cached_property
+    def submitted_stocks(self):
+        if not self.is_bound:
+            return {}
+        pks = {self.data.get(f'{self.add_prefix(i)}-stock') for i in range(self.total_form_count())}
+        pks = [pk for pk in pks if pk and str(pk).isdigit()]
+        return {str(stock.pk): stock for stock in Stock.objects.filter(pk__in=pks)}
+
+    @cached_property
+    def stock_choices(self):
+        return SharedChoiceIterator(self.form.base_fields['stock'].choices)
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        field = form.fields.get('stock')
+        if isinstance(field, StockChoiceField):
+            if self.is_bound:
+                field.resolved = self.submitted_stocks
+            field.share_choices(self.stock_choices)
+        return form
+
+    @property
+    def empty_form(self):
+        form = super().empty_form
+        field = form.fields.get('stock')
+        if isinstance(field, StockChoiceField):
+            field.share_choices(self.stock_choices)
+        return form
+
+    def moved_stock(self):
+        """``{stock pk: quantity}`` that saving a changed unit moves between units."""
+        if not self.instance.pk:
+            return {}
+        stored_unit = Outbound.objects.filter(pk=self.instance.pk).values_list('unit_id', flat=True).first()
+        if stored_unit == self.instance.unit_id:
+            return {}
+        issued = dict(
+            OutboundItem.objects.filter(outbound=self.instance).values_list('stock_id')
+            .annotate(total=Sum('quantity')).order_by()
+        )
+        located = StockLocation.objects.filter(stock_id__in=issued).values_list('stock_id', flat=True)
+        return {pk: issued[pk] for pk in set(located)}
+
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+
+        # Net change per stock across the whole form: old lines are given back,
+        # new and edited lines are taken out.
+        deltas = defaultdict(int)
+        for form in self.forms:
+            if not form.has_changed() and not self._should_delete_form(form):
+                continue
+            if form.instance.pk and form.initial.get('stock'):
+                deltas[form.initial['stock']] += form.initial.get('quantity') or 0
+            if not self._should_delete_form(form) and form.cleaned_data.get('stock'):
+                quantity = form.cleaned_data.get('quantity') or 0
+                if quantity <= 0:
+                    form.add_error('quantity', _('Quantity must be greater than zero.'))
+                    continue
+                deltas[form.cleaned_data['stock'].pk] -= quantity
+
+        # Only stocks chosen in this form can be short, and those were already
+        # loaded by submitted_stocks.
+        short = [
+            stock.stock_no
+            for stock in self.submitted_stocks.values()
+            if stock.quantity + deltas.get(stock.pk, 0) < 0
+        ]
+        if short:
+            raise ValidationError(_('Not enough stock for: %(stocks)s.'), params={'stocks': ', '.join(sorted(short))})
+
+        # What other people have reserved cannot be taken, and stocks kept at
+        # locations must be held at the outbound's unit. A new unit first has
+        # to take over what the outbound already issued (see Outbound.save).
+        taken = {pk: -delta for pk, delta in deltas.items() if delta < 0}
+        moved = self.moved_stock()
+        short = set(unavailable(moved, self.instance.unit_id, moving=True)) if moved else set()
+        taken = {pk: quantity + moved.get(pk, 0) for pk, quantity in taken.items()}
+        short.update(unavailable(taken, self.instance.unit_id) if taken else [])
+        short = sorted(short)
+        if short and self.instance.unit_id:
+            raise ValidationError(_('Not enough stock at %(unit)s for: %(stocks)s.'),
+                                  params={'unit': self.instance.unit, 'stocks': ', '.join(short)})
+        if short:
+            raise ValidationError(_('Not enough unreserved stock for: %(stocks)s.'), params={'stocks': ', '.join(short)})
+
 
 class OutboundItemInline(admin.TabularInline):
     model = OutboundItem
+    form = OutboundItemForm
+    formset = OutboundItemFormSet
     extra = 1
     fields = ('stock', 'stock_name', 'quantity')  # Include 'stock_name' field
 
@@ -18,17 +180,51 @@ class OutboundItemInline(admin.TabularInline):
 
     stock_name.short_description = 'Stock Name'
 
+    def get_queryset(self, request):
+        # stock_name and each row's __str__ read item.stock
+        return super().get_queryset(request).select_related('stock')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'stock':
+            kwargs['form_class'] = StockChoiceField
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class TotalQuantityFilter(admin.SimpleListFilter):
+    title = _('total quantity')
+    parameter_name = 'total_quantity'
+    # (lookup, label, lower bound, upper bound) over the stored column
+    RANGES = (
+        ('1-10', _('1 to 10'), 1, 10),
+        ('11-100', _('11 to 100'), 11, 100),
+        ('101-1000', _('101 to 1000'), 101, 1000),
+        ('1001-', _('More than 1000'), 1001, None),
+    )
+
+    def lookups(self, request, model_admin):
+        return [(lookup, label) for lookup, label, low, high in self.RANGES]
 
-class OutboundAdmin(admin.ModelAdmin):
-    list_display = ('transaction_ref', 'total_quantity', 'outbound_date', 'processed_by', 'unit')
+    def queryset(self, request, queryset):
+        for lookup, label, low, high in self.RANGES:
+            if self.value() == lookup:
+                queryset = queryset.filter(total_quantity__gte=low)
+                return queryset if high is None else queryset.filter(total_quantity__lte=high)
+        return queryset
+
+
+class OutboundAdmin(WriteAtomicAdminMixin, KeysetPaginationMixin, IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('transaction_ref', 'total_quantity', 'line_count', 'outbound_date', 'processed_by', 'unit')
+    list_filter = (TotalQuantityFilter,)
     search_fields = ('transaction_ref', 'processed_by__username')
-    readonly_fields = ('transaction_ref', 'get_items_list')
+    keyset_ordering = ('-outbound_date', '-id')
+    readonly_fields = ('transaction_ref', 'total_quantity', 'line_count', 'get_items_list')
 
     inlines = [OutboundItemInline]
+    actions = ['export_as_csv', 'export_as_ndjson', 'reverse_selected']
 
     fieldsets = (
         (None, {
-            'fields': ('outbound_date', 'processed_by', 'transaction_ref', 'unit')
+            'fields': ('outbound_date', 'processed_by', 'transaction_ref', 'unit', 'total_quantity', 'line_count')
         }),
         ('Items', {
             'fields': ('get_items_list',),
@@ -38,55 +234,124 @@ class OutboundAdmin(admin.ModelAdmin):
 
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
-        queryset = queryset.annotate(total_quantity=Sum('outbounditem__quantity'))
+        queryset = queryset.select_related('processed_by', 'unit')
         return queryset
 
-    def total_quantity(self, obj):
-        return obj.total_quantity
+    def get_urls(self):
+        urls = [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view), name='outbound_outbound_dashboard'),
+        ]
+        return urls + super().get_urls()
+
+    def dashboard_view(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+
+        days = request.GET.get('days', '')
+        days = int(days) if days.isdigit() and int(days) in DASHBOARD_PERIODS else DASHBOARD_PERIODS[0]
+        units = cached_queryset(Unit.objects.order_by('name'))
+        unit = next((unit for unit in units if str(unit.pk) == request.GET.get('unit')), None)
+        end = timezone.localdate()
+        summary = outflow_summary(end - timedelta(days=days - 1), end, unit=unit)
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Outbound dashboard',
+            'periods': DASHBOARD_PERIODS,
+            'days': days,
+            'units': units,
+            'unit': unit,
+            'summary': summary,
+            'total_quantity': sum(summary['daily_quantity']),
+        }
+        return TemplateResponse(request, 'admin/outbound/outbound/dashboard.html', context)
 
     def unit(self, obj):
         return obj.unit.name if obj.unit else ''
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'unit':
+            kwargs['form_class'] = CachedModelChoiceField
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
     def get_items_list(self, obj):
-        items_list = obj.outbounditem_set.all()
+        items_list = obj.outbounditem_set.select_related('stock')
         return ', '.join([f'{item.stock.stock_no} ({item.quantity})' for item in items_list])
 
+    def enqueue_export(self, request, queryset, fmt):
+        # Large selections outlast proxy timeouts; a worker writes the file instead.
+        # The job keeps the changelist's query and resolves it itself; only
+        # ticked rows, at most a page of them, are passed by pk.
+        selected = None
+        if request.POST.get('select_across') != '1':
+            selected = request.POST.getlist(helpers.ACTION_CHECKBOX_NAME)
+        job = enqueue('outbound.export', {'query': request.GET.urlencode(), 'selected': selected, 'format': fmt},
+                      user=request.user)
+        self.message_user(request, format_html(
+            'Export queued. <a href="{}">Download it from its job</a> when it has finished.',
+            reverse('admin:jobs_job_change', args=[job.pk]),
+        ), messages.SUCCESS)
+
     def export_as_csv(self, request, queryset):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="outbound.csv"'
+        self.enqueue_export(request, queryset, 'csv')
 
-        writer = csv.writer(response)
-        writer.writerow(['Transaction Reference', 'Outbound Date', 'Processed By', 'Total Quantity', 'Unit', 'Items'])
+    def export_as_ndjson(self, request, queryset):
+        self.enqueue_export(request, queryset, 'ndjson')
 
-        for obj in queryset:
-            items_list = obj.outbounditem_set.all()
-            items_str = ', '.join([f'{item.stock.stock_no} ({item.quantity})' for item in items_list])
-            writer.writerow([obj.transaction_ref, obj.outbound_date, obj.processed_by.username, obj.total_quantity, obj.unit.name if obj.unit else '', items_str])
+    export_as_csv.short_description = _('Export selected Outbounds as CSV')
+    export_as_ndjson.short_description = _('Export selected Outbounds as NDJSON')
 
-        return response
+    def reverse_selected(self, request, queryset):
+        count = reverse_outbounds(queryset, user=request.user, reason='Reversed in the admin')
+        self.message_user(request, f'Reversed {count} outbounds; their stock has been returned.', messages.SUCCESS)
 
-    export_as_csv.short_description = _('Export selected Outbounds as CSV')
+    reverse_selected.short_description = _('Reverse selected Outbounds and return their stock')
+    reverse_selected.allowed_permissions = ('delete',)
 
-    total_quantity.short_description = 'Total Quantity'
-    total_quantity.admin_order_field = 'total_quantity'
-    get_items_list.short_description = 'Items'
+    # Deleting goes through the reversal too: a plain delete cascades to the
+    # items without returning their stock.
+    def delete_model(self, request, obj):
+        reverse_outbounds([obj], user=request.user, reason='Deleted in the admin')
 
-    def save_related(self, request, form, formsets, change):
-        super().save_related(request, form, formsets, change)
-        obj = form.instance
+    def delete_queryset(self, request, queryset):
+        reverse_outbounds(queryset, user=request.user, reason='Deleted in the admin')
 
-        # Deduct stock quantities for all outbound items
-        for outbound_item in obj.outbounditem_set.all():
-            # Ensure to check if the quantity exceeds available stock
-            if outbound_item.quantity > outbound_item.stock.quantity:
-                raise ValueError(f"Stock quantity for '{outbound_item.stock.stock_no}' cannot be negative or zero.")
+    get_items_list.short_description = 'Items'
 
-            # Deduct the outbound quantity from stock
-            outbound_item.stock.quantity -= outbound_item.quantity
-            outbound_item.stock.save()
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not OutboundItem:
+            return super().save_formset(request, form, formset, change)
 
-        # Update the total_quantity field in Outbound model
-        obj.total_quantity = obj.outbounditem_set.aggregate(total=Sum('quantity'))['total']
-        obj.save()
+        # Collect the inline edits without saving them row by row, then let the
+        # service apply only the net stock change in one locked update.
+        formset.save(commit=False)
+        reconcile_outbound_items(
+            form.instance,
+            created=formset.new_objects,
+            changed=[obj for obj, changed_fields in formset.changed_objects],
+            deleted=formset.deleted_objects,
+        )
 
 admin.site.register(Outbound, OutboundAdmin)
+
+
+class OutboundReversalAdmin(admin.ModelAdmin):
+    list_display = ('transaction_ref', 'reference', 'total_quantity', 'line_count', 'unit', 'reversed_by',
+                    'reversed_at')
+    list_filter = ('unit',)
+    search_fields = ('transaction_ref', 'reference')
+    list_select_related = ('unit', 'reversed_by')
+
+    # Written by reverse_outbounds() only, and kept as the record of it.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+admin.site.register(OutboundReversal, OutboundReversalAdmin)
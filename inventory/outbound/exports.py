@@ -0,0 +1,73 @@
+import csv
+import json
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+
+from .models import OutboundItem
+
+EXPORT_CHUNK_SIZE = 2000
+
+HEADER = ['Transaction Reference', 'Outbound Date', 'Processed By', 'Total Quantity', 'Unit', 'Items']
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """File-like object whose write() hands the value straight back to csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(queryset):
+    """Load everything a row needs up front: one query per chunk for outbounds, one for their items."""
+    items = OutboundItem.objects.select_related('stock').only('outbound_id', 'quantity', 'stock__stock_no').order_by('pk')
+    return queryset.select_related('processed_by', 'unit').prefetch_related(
+        Prefetch('outbounditem_set', queryset=items)
+    )
+
+
+def iter_records(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    for obj in export_queryset(queryset).iterator(chunk_size=chunk_size):
+        items = obj.outbounditem_set.all()
+        yield {
+            'transaction_ref': obj.transaction_ref,
+            'outbound_date': obj.outbound_date,
+            'processed_by': obj.processed_by.username if obj.processed_by else '',
+            'total_quantity': obj.total_quantity,
+            'unit': obj.unit.name if obj.unit else '',
+            'items': [{'stock_no': item.stock.stock_no, 'quantity': item.quantity} for item in items],
+        }
+
+
+def iter_csv(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    for record in iter_records(queryset, chunk_size):
+        items_str = ', '.join(f"{item['stock_no']} ({item['quantity']})" for item in record['items'])
+        yield writer.writerow([
+            record['transaction_ref'], record['outbound_date'], record['processed_by'],
+            record['total_quantity'], record['unit'], items_str,
+        ])
+
+
+def iter_ndjson(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    for record in iter_records(queryset, chunk_size):
+        record['outbound_date'] = record['outbound_date'].isoformat()
+        yield json.dumps(record) + '\n'
+
+
+EXPORTERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+}
+
+
+def streaming_export_response(queryset, fmt='csv', filename='outbound', chunk_size=EXPORT_CHUNK_SIZE):
+    response = StreamingHttpResponse(EXPORTERS[fmt](queryset, chunk_size), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
@@ -0,0 +1,111 @@
+"""
+Consumption-rate forecasting over the daily outflow rollup.
+
+The mean and standard deviation of each stock's daily demand are computed
+in the database in one grouped pass over DailyStockOutflow (days without
+outflow count as zero), and written back in batched conditional UPDATEs to
+the stocks whose figures changed. Reorder points follow the usual formula: expected demand over the lead time
+plus a safety stock of ``z`` standard deviations of that demand.
+"""
+import math
+from datetime import timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.utils import timezone
+
+from inventory.transactions import write_atomic
+from stocks.ledger import chunked
+from stocks.models import Stock
+from stocks.signals import stocks_changed
+from .models import DailyStockOutflow
+
+FORECAST_DAYS = 90
+SERVICE_LEVEL_Z = 1.65  # about a 95% chance of not running out within the lead time
+
+
+def demand_statistics(days=FORECAST_DAYS, end=None):
+    """``{stock_id: (mean, stddev)}`` of units issued per day over the ``days`` days up to ``end``."""
+    end = end or timezone.localdate()
+    daily = (
+        DailyStockOutflow.objects.filter(date__range=(end - timedelta(days=days - 1), end))
+        .values('stock_id', 'date')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+    )
+    daily_sql, params = daily.query.sql_with_params()
+    connection = connections[router.db_for_read(DailyStockOutflow)]
+    with connection.cursor() as cursor:
+        # Units are summed per day first, then each stock's days are folded
+        # into a sum and a sum of squares.
+        cursor.execute(
+            f'SELECT stock_id, SUM(total), SUM(total * total) FROM ({daily_sql}) daily GROUP BY stock_id',
+            params,
+        )
+        rows = cursor.fetchall()
+    statistics = {}
+    for stock_id, total, squares in rows:
+        mean = float(total) / days
+        statistics[stock_id] = (mean, math.sqrt(max(float(squares) / days - mean * mean, 0.0)))
+    return statistics
+
+
+def reorder_levels(mean, stddev, lead_time_days, z=SERVICE_LEVEL_Z):
+    """``(safety_stock, reorder_point)`` for a daily demand distribution and lead time."""
+    safety_stock = math.ceil(z * stddev * math.sqrt(lead_time_days))
+    return safety_stock, math.ceil(mean * lead_time_days) + safety_stock
+
+
+def forecast_demand(days=FORECAST_DAYS, z=SERVICE_LEVEL_Z, update_reorder_points=False, progress=None):
+    """
+    Store each stock's daily demand, and with ``update_reorder_points`` its
+    safety stock and reorder point. Stocks without outflow in the window get
+    a demand of zero and keep their thresholds. Returns the number of stocks
+    with demand.
+    """
+    statistics = demand_statistics(days)
+    now = timezone.now()
+    idle = list(Stock.objects.exclude(pk__in=statistics).exclude(daily_demand=0).values_list('pk', flat=True))
+    for batch in chunked(idle):
+        with transaction.atomic():
+            Stock.objects.filter(pk__in=batch).exclude(daily_demand=0).update(
+                daily_demand=0, last_modified_date=now, version=F('version') + 1,
+            )
+            stocks_changed.send(sender=Stock, stock_ids=batch)
+
+    done = 0
+    for batch in chunked(statistics):
+        with write_atomic():
+            # Only rows whose figures move are written: a version bump would
+            # void admin edits in progress and every API ETag.
+            changed = {}
+            for pk, demand, lead_time_days, safety, point in Stock.objects.filter(pk__in=batch).values_list(
+                'pk', 'daily_demand', 'lead_time_days', 'safety_stock', 'reorder_point',
+            ):
+                new = (statistics[pk][0],)
+                if update_reorder_points:
+                    new += reorder_levels(*statistics[pk], lead_time_days, z)
+                if new != (demand, safety, point)[:len(new)]:
+                    changed[pk] = new
+            if changed:
+                values = {'daily_demand': Case(
+                    *[When(pk=pk, then=Value(new[0])) for pk, new in changed.items()], default=F('daily_demand'),
+                )}
+                if update_reorder_points:
+                    values['safety_stock'] = Case(
+                        *[When(pk=pk, then=Value(new[1])) for pk, new in changed.items()],
+                        default=F('safety_stock'),
+                    )
+                    values['reorder_point'] = Case(
+                        *[When(pk=pk, then=Value(new[2])) for pk, new in changed.items()],
+                        default=F('reorder_point'),
+                    )
+                Stock.objects.filter(pk__in=changed).update(
+                    **values, last_modified_date=now, version=F('version') + 1,
+                )
+                # Caches and the below_reorder flags follow the new values.
+                stocks_changed.send(sender=Stock, stock_ids=list(changed))
+        done += len(batch)
+        if progress:
+            progress(done, len(statistics))
+    return len(statistics)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from outbound.services import BACKFILL_BATCH_SIZE, backfill_totals
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored total quantity and line count of every outbound from its items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE,
+                            help='Number of outbound ids updated per statement.')
+
+    def handle(self, *args, **options):
+        def progress(position, last_id):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Backfilled outbounds up to id {position} of {last_id}')
+
+        count = backfill_totals(options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Backfilled totals for {count} outbounds.'))
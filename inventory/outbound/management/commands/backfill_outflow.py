@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from outbound.rollups import BACKFILL_DAYS_PER_BATCH, backfill_outflow
+
+
+class Command(BaseCommand):
+    help = 'Recompute the daily outflow rollup behind the outbound dashboard from the outbound items.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days-per-batch', type=int, default=BACKFILL_DAYS_PER_BATCH,
+                            help='Number of days replaced per transaction.')
+
+    def handle(self, *args, **options):
+        def progress(day, last_day):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Backfilled up to {day} of {last_day}')
+
+        count = backfill_outflow(options['days_per_batch'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} daily outflow rows.'))
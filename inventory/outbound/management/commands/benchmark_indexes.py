@@ -0,0 +1,91 @@
+import json
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+from django.utils import timezone
+
+from outbound.models import Outbound
+from outbound.seed import SEED_PREFIX, seed_outbounds, seed_stocks, seed_units, seed_users
+from stocks.models import Stock
+
+
+def benchmark_queries(prefix=SEED_PREFIX):
+    """The lookups the admin and integrations actually run, keyed by a stable name."""
+    stock_count = Stock.objects.filter(stock_no__startswith=f'{prefix}-').count()
+    unit = seed_units(prefix=prefix)[0]
+    user = seed_users(prefix=prefix)[0]
+    month_ago = timezone.now() - timedelta(days=30)
+    return {
+        'stock_by_stock_no': Stock.objects.filter(stock_no=f'{prefix}-{stock_count // 2:010d}'),
+        'changelist_page': Outbound.objects.order_by('-outbound_date')[:100],
+        'unit_history_page': Outbound.objects.filter(unit=unit).order_by('-outbound_date')[:100],
+        'unit_last_30_days': Outbound.objects.filter(outbound_date__gte=month_ago, unit=unit).values('pk')[:1000],
+        'user_history_page': Outbound.objects.filter(processed_by=user).order_by('-outbound_date')[:100],
+        'user_month_total': (
+            Outbound.objects.filter(processed_by=user, outbound_date__gte=month_ago)
+            .values('processed_by')
+            .annotate(total=Sum('total_quantity'))
+        ),
+    }
+
+
+def time_query(queryset, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        list(queryset.all())
+        timings.append((time.perf_counter() - started) * 1000)
+    return {'min_ms': min(timings), 'median_ms': statistics.median(timings)}
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the stock and outbound lookups that the indexes are meant for and print their query plans. '
+        'Run once before and once after migrating, passing the first report as --baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help='Top up synthetic data first (writes to the configured database).')
+        parser.add_argument('--stocks', type=int, default=1000000)
+        parser.add_argument('--items', type=int, default=5000000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='Write the report to this JSON file.')
+        parser.add_argument('--baseline', help='Compare against a report written by an earlier run.')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            def progress(label, done, total):
+                self.stdout.write(f'Seeded {done}/{total} {label}')
+
+            seed_stocks(options['stocks'], progress=progress)
+            seed_outbounds(options['items'], progress=progress)
+
+        if not Stock.objects.filter(stock_no__startswith=f'{SEED_PREFIX}-').exists():
+            raise CommandError('No benchmark data found; run with --seed first.')
+
+        baseline = {}
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as handle:
+                baseline = json.load(handle)
+
+        report = {}
+        for name, queryset in benchmark_queries().items():
+            result = time_query(queryset, options['repeat'])
+            result['plan'] = queryset.explain()
+            report[name] = result
+
+            line = f"{name:<20} {result['median_ms']:10.2f} ms"
+            if name in baseline:
+                before = baseline[name]['median_ms']
+                line += f"   before {before:10.2f} ms   x{before / max(result['median_ms'], 0.001):.1f}"
+            self.stdout.write(line)
+            for plan_line in result['plan'].splitlines():
+                self.stdout.write(f'    {plan_line}')
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
@@ -0,0 +1,107 @@
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+from outbound.models import Outbound
+from outbound.seed import SEED_PREFIX, seed_stocks, seed_units, seed_users
+from outbound.services import issue_outbound
+from stocks.models import Stock
+
+
+def run_writers(stock_ids, writers, duration, lines=3, prefix=SEED_PREFIX):
+    """
+    Issue outbounds of ``lines`` random stocks from ``writers`` threads, each
+    on its own connection, for ``duration`` seconds. Returns throughput,
+    commit latency percentiles (ms) and the number of failed transactions.
+    """
+    unit = seed_units(prefix=prefix)[0]
+    user = seed_users(prefix=prefix)[0]
+    deadline = time.perf_counter() + duration
+
+    def writer(seed):
+        rng = random.Random(seed)
+        latencies, errors = [], 0
+        try:
+            while time.perf_counter() < deadline:
+                outbound = Outbound(unit=unit, processed_by=user)
+                started = time.perf_counter()
+                try:
+                    issue_outbound(outbound, [(stock_id, 1) for stock_id in rng.sample(stock_ids, lines)])
+                except OperationalError:
+                    # "database is locked" on SQLite, serialization failures elsewhere.
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+        finally:
+            connections[DEFAULT_DB_ALIAS].close()
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=writers) as pool:
+        results = list(pool.map(writer, range(writers)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for worker_latencies, errors in results for latency in worker_latencies)
+    return {
+        'outbounds': len(latencies),
+        'errors': sum(errors for worker_latencies, errors in results),
+        'per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0.0,
+        'p99_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0.0,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure outbounds issued per second by concurrent writers against the configured database. '
+        'Run once with the old configuration (e.g. DB_SQLITE_TUNING=off) and once with the new one, '
+        'passing the first report as --baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true',
+                            help='Top up synthetic stocks first (writes to the configured database).')
+        parser.add_argument('--stocks', type=int, default=1000)
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=10.0)
+        parser.add_argument('--lines', type=int, default=3, help='Stock lines per outbound.')
+        parser.add_argument('--output', help='Write the report to this JSON file.')
+        parser.add_argument('--baseline', help='Compare against a report written by an earlier run.')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            seed_stocks(options['stocks'])
+        stock_ids = list(
+            Stock.objects.filter(stock_no__startswith=f'{SEED_PREFIX}-').order_by('pk')
+            .values_list('pk', flat=True)[:options['stocks']]
+        )
+        if len(stock_ids) < options['lines']:
+            raise CommandError('Not enough benchmark stocks found; run with --seed first.')
+
+        connection = connections[DEFAULT_DB_ALIAS]
+        report = {
+            'vendor': connection.vendor,
+            'writers': options['writers'],
+            **run_writers(stock_ids, options['writers'], options['duration'], options['lines']),
+        }
+        line = (
+            f"{report['vendor']}, {report['writers']} writers: {report['per_second']:.1f} outbounds/s, "
+            f"p50 {report['p50_ms']:.2f} ms, p99 {report['p99_ms']:.2f} ms, {report['errors']} failed"
+        )
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as handle:
+                before = json.load(handle)
+            line += (
+                f"\n   before {before['per_second']:.1f} outbounds/s, {before['errors']} failed   "
+                f"x{report['per_second'] / max(before['per_second'], 0.001):.1f}"
+            )
+        self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
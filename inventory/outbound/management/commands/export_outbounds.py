@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime, parse_date
+
+from outbound.exports import EXPORT_CHUNK_SIZE, EXPORTERS
+from outbound.models import Outbound
+
+
+def parse_moment(value):
+    moment = parse_datetime(value) or parse_date(value)
+    if moment is None:
+        raise CommandError(f"'{value}' is not a valid date or datetime.")
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Stream outbound transactions to a CSV or NDJSON file without loading them all into memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORTERS), default='csv')
+        parser.add_argument('--output', help='File to write to. Defaults to stdout.')
+        parser.add_argument('--since', type=parse_moment, help='Only outbounds on or after this date.')
+        parser.add_argument('--until', type=parse_moment, help='Only outbounds before this date.')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        queryset = Outbound.objects.order_by('outbound_date', 'pk')
+        if options['since']:
+            queryset = queryset.filter(outbound_date__gte=options['since'])
+        if options['until']:
+            queryset = queryset.filter(outbound_date__lt=options['until'])
+
+        chunks = EXPORTERS[options['format']](queryset, options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from outbound.forecasting import FORECAST_DAYS, SERVICE_LEVEL_Z, forecast_demand
+
+
+class Command(BaseCommand):
+    help = (
+        'Compute each stock\'s daily demand from the daily outflow rollup and optionally set its safety '
+        'stock and reorder point. Run backfill_outflow first on an existing database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=FORECAST_DAYS, help='Days of history to forecast from.')
+        parser.add_argument('--z', type=float, default=SERVICE_LEVEL_Z,
+                            help='Safety stock in standard deviations of lead-time demand.')
+        parser.add_argument('--update-reorder-points', action='store_true',
+                            help='Overwrite safety stock and reorder point of every stock with demand.')
+
+    def handle(self, *args, **options):
+        def progress(done, total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Forecast {done} of {total} stocks')
+
+        count = forecast_demand(options['days'], options['z'], options['update_reorder_points'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Forecast demand for {count} stocks.'))
@@ -0,0 +1,128 @@
+import http.client
+import json
+import statistics
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stocks.models import Stock
+
+
+def default_paths():
+    """The async read endpoints, pointed at a stock that exists in this database."""
+    stock_no = Stock.objects.order_by('pk').values_list('stock_no', flat=True).first()
+    if stock_no is None:
+        raise CommandError('No stocks found; seed data first (benchmark_indexes --seed) or pass --path.')
+    return [
+        f'/api/stocks/lookup/?stock_no={stock_no}',
+        f'/api/stocks/availability/?lines={stock_no}:1',
+        '/api/outbounds/history/?limit=50',
+    ]
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run_load(base_url, paths, concurrency, duration, headers=None):
+    """
+    Keep ``concurrency`` keep-alive connections busy cycling through ``paths``
+    for ``duration`` seconds. Returns throughput, latency percentiles (ms)
+    and the number of failed requests.
+    """
+    target = urlsplit(base_url)
+    prefix = target.path.rstrip('/')
+    connection_class = http.client.HTTPSConnection if target.scheme == 'https' else http.client.HTTPConnection
+    deadline = time.perf_counter() + duration
+
+    def worker(offset):
+        connection = connection_class(target.hostname, target.port, timeout=30)
+        latencies, errors, position = [], 0, offset
+        while time.perf_counter() < deadline:
+            path = paths[position % len(paths)]
+            position += 1
+            started = time.perf_counter()
+            try:
+                connection.request('GET', prefix + path, headers=headers or {})
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                connection.close()
+                connection = connection_class(target.hostname, target.port, timeout=30)
+                continue
+            latencies.append(time.perf_counter() - started)
+            if response.status >= 400:
+                errors += 1
+        connection.close()
+        return latencies, errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for worker_latencies, errors in results for latency in worker_latencies)
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors for worker_latencies, errors in results),
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/second and p99 latency of the same endpoints served by different deployments, '
+        'e.g. --target wsgi=http://127.0.0.1:8000 (gunicorn inventory.wsgi) '
+        '--target asgi=http://127.0.0.1:8001 (uvicorn inventory.asgi:application). '
+        'Run the servers against the same database and with the same number of workers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True, metavar='NAME=URL',
+                            help='A deployment to load; repeat for each one to compare.')
+        parser.add_argument('--path', action='append',
+                            help='Endpoint path with query string; repeat to mix. Defaults to the async read endpoints.')
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds of measured load per target.')
+        parser.add_argument('--warmup', type=float, default=2.0, help='Seconds of unmeasured load per target first.')
+        parser.add_argument('--user', help='Username for HTTP Basic authentication.')
+        parser.add_argument('--password', default='')
+        parser.add_argument('--output', help='Write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        targets = []
+        for value in options['target']:
+            name, sep, url = value.partition('=')
+            if not sep or not url.startswith(('http://', 'https://')):
+                raise CommandError(f'--target must look like NAME=http://host:port, not {value!r}.')
+            targets.append((name, url))
+        paths = options['path'] or default_paths()
+        headers = {}
+        if options['user']:
+            token = b64encode(f"{options['user']}:{options['password']}".encode()).decode()
+            headers['Authorization'] = f'Basic {token}'
+
+        report = {}
+        self.stdout.write(f"{'target':<10} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for name, url in targets:
+            if options['warmup'] > 0:
+                run_load(url, paths, options['concurrency'], options['warmup'], headers)
+            result = run_load(url, paths, options['concurrency'], options['duration'], headers)
+            report[name] = {'url': url, 'paths': paths, 'concurrency': options['concurrency'], **result}
+            self.stdout.write(
+                f"{name:<10} {result['requests']:>9} {result['rps']:>9.1f} {result['p50_ms']:>9.2f} "
+                f"{result['p99_ms']:>9.2f} {result['errors']:>7}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from outbound.management.commands.export_outbounds import parse_moment
+from outbound.models import Outbound
+from outbound.services import REVERSAL_BATCH_SIZE, reverse_outbounds
+
+
+class Command(BaseCommand):
+    help = 'Return the stock issued by outbound transactions and delete them, keeping a reversal record of each.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('refs', nargs='*', help='Transaction references of the outbounds to reverse.')
+        parser.add_argument('--since', type=parse_moment, help='Only outbounds on or after this date.')
+        parser.add_argument('--until', type=parse_moment, help='Only outbounds before this date.')
+        parser.add_argument('--unit', type=int, help='Only outbounds of this unit id.')
+        parser.add_argument('--reason', default='', help='Stored with each reversal.')
+        parser.add_argument('--batch-size', type=int, default=REVERSAL_BATCH_SIZE,
+                            help='Number of outbounds reversed per transaction.')
+
+    def handle(self, *args, **options):
+        if not (options['refs'] or options['since'] or options['until'] or options['unit']):
+            raise CommandError('Name the outbounds to reverse, or narrow them down with --since, --until or --unit.')
+        queryset = Outbound.objects.all()
+        if options['refs']:
+            queryset = queryset.filter(transaction_ref__in=options['refs'])
+        if options['since']:
+            queryset = queryset.filter(outbound_date__gte=options['since'])
+        if options['until']:
+            queryset = queryset.filter(outbound_date__lt=options['until'])
+        if options['unit']:
+            queryset = queryset.filter(unit_id=options['unit'])
+
+        def progress(done, total):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Reversed {done} of {total} outbounds')
+
+        count = reverse_outbounds(queryset, reason=options['reason'], batch_size=options['batch_size'],
+                                  progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Reversed {count} outbounds.'))
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:34
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outbound', '0006_remove_outbounditem_unit'),
+        ('profiles', '0004_alter_unit_options'),
+        ('stocks', '0006_stock_no_unique_quantity_check'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outbound',
+            index=models.Index(fields=['outbound_date', 'unit'], name='outbound_date_unit_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='outbound',
+            index=models.Index(fields=['processed_by', 'outbound_date'], name='outbound_user_date_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outbound', '0007_outbound_date_indexes'),
+        ('profiles', '0004_alter_unit_options'),
+        ('stocks', '0007_stock_modified_seek_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outbound',
+            index=models.Index(fields=['outbound_date', 'id'], name='outbound_date_seek_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:41
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_totals(apps, schema_editor):
+    Outbound = apps.get_model('outbound', 'Outbound')
+    OutboundItem = apps.get_model('outbound', 'OutboundItem')
+    items = OutboundItem.objects.filter(outbound=OuterRef('pk')).order_by().values('outbound')
+    Outbound.objects.update(
+        total_quantity=Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total'),
+                                         output_field=IntegerField()), Value(0)),
+        line_count=Coalesce(Subquery(items.annotate(count=Count('pk')).values('count'),
+                                     output_field=IntegerField()), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outbound', '0008_outbound_date_seek_index'),
+        ('profiles', '0004_alter_unit_options'),
+        ('stocks', '0007_stock_modified_seek_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outbound',
+            name='line_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='outbound',
+            name='total_quantity',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='outbound',
+            index=models.Index(fields=['total_quantity', 'id'], name='outbound_total_qty_idx'),
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:00
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outbound', '0009_outbound_totals'),
+        ('profiles', '0004_alter_unit_options'),
+        ('stocks', '0007_stock_modified_seek_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStockOutflow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('txn_count', models.IntegerField(default=0)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_outflow', to='stocks.stock')),
+                ('unit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='profiles.unit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'unit'], name='daily_outflow_date_unit_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailystockoutflow',
+            constraint=models.UniqueConstraint(models.F('date'), models.F('stock'), django.db.models.functions.comparison.Coalesce(models.F('unit'), models.Value(0)), name='daily_outflow_key'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:52
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('outbound', '0011_reference_sequence'),
+        ('profiles', '0004_alter_unit_options'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundReversal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(db_index=True, max_length=100)),
+                ('transaction_ref', models.CharField(db_index=True, max_length=100)),
+                ('customer', models.CharField(blank=True, max_length=50)),
+                ('outbound_date', models.DateTimeField()),
+                ('total_quantity', models.IntegerField(default=0)),
+                ('line_count', models.IntegerField(default=0)),
+                ('lines', models.JSONField(default=list)),
+                ('reason', models.CharField(blank=True, max_length=200)),
+                ('reversed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('reversed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('unit', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='profiles.unit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['reversed_at', 'id'], name='outbound_reversal_date_idx')],
+            },
+        ),
+    ]
@@ -1,9 +1,17 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+from caching.querysets import CachedQuerySet
+from inventory.transactions import write_atomic
 from stocks.models import Stock
+from stocks.services import apply_stock_deltas, move_stock
 from profiles.models import Unit
 from django.utils import timezone
 from django.contrib.auth.models import User
-import uuid
+from .references import reference_generator
+
+# Inserts retried with a fresh transaction_ref when the generated one is taken.
+REFERENCE_ATTEMPTS = 3
 
 
 class Outbound(models.Model):
@@ -13,40 +21,196 @@ class Outbound(models.Model):
     items = models.ManyToManyField(Stock, through='OutboundItem')
     outbound_date = models.DateTimeField(default=timezone.now)
     processed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    # Kept in step with the items by adjust_totals(); never written by save().
+    total_quantity = models.IntegerField(default=0, editable=False)
+    line_count = models.IntegerField(default=0, editable=False)
+
+    TOTAL_FIELDS = ('total_quantity', 'line_count')
+
+    class Meta:
+        indexes = [
+            # Changelist date ordering/filtering per unit, and a user's history.
+            models.Index(fields=['outbound_date', 'unit'], name='outbound_date_unit_idx'),
+            models.Index(fields=['processed_by', 'outbound_date'], name='outbound_user_date_idx'),
+            # Keyset pagination of the changelist seeks on (outbound_date, id).
+            models.Index(fields=['outbound_date', 'id'], name='outbound_date_seek_idx'),
+            # Sorting the changelist by quantity.
+            models.Index(fields=['total_quantity', 'id'], name='outbound_total_qty_idx'),
+        ]
 
     def save(self, *args, **kwargs):
-        if not self.transaction_ref:
+        generated = not self.transaction_ref
+        if generated:
             self.transaction_ref = self.generate_transaction_ref()
-        super().save(*args, **kwargs)
+        if not args and not self._state.adding and kwargs.get('update_fields') is None:
+            # Re-saving a stale instance must not write old totals back over
+            # item changes made since it was loaded.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.TOTAL_FIELDS
+            ]
+        if self._state.adding:
+            if not generated:
+                super().save(*args, **kwargs)
+                return
+            for attempt in range(1, REFERENCE_ATTEMPTS + 1):
+                try:
+                    with transaction.atomic():
+                        super().save(*args, **kwargs)
+                    return
+                except IntegrityError:
+                    # Only a reference that is already taken is worth another try.
+                    if attempt == REFERENCE_ATTEMPTS or not (
+                        Outbound.objects.filter(transaction_ref=self.transaction_ref).exists()
+                    ):
+                        raise
+                    self.transaction_ref = self.generate_transaction_ref()
+        from .rollups import track_outflow
+
+        # A new date or unit moves the items to other rollup rows.
+        with write_atomic(), track_outflow(self):
+            previous_unit, fields = self.unit_id, kwargs.get('update_fields')
+            if fields is None or 'unit' in fields or 'unit_id' in fields:
+                previous_unit = Outbound.objects.filter(pk=self.pk).values_list('unit_id', flat=True).first()
+            super().save(*args, **kwargs)
+            if previous_unit != self.unit_id:
+                # Stock kept at locations was taken from the old unit; take it from the new one instead.
+                issued = dict(
+                    OutboundItem.objects.filter(outbound=self).values_list('stock_id')
+                    .annotate(total=Sum('quantity')).order_by()
+                )
+                move_stock(issued, from_unit=self.unit_id, to_unit=previous_unit,
+                           reference=self.transaction_ref, located_only=True)
 
     def generate_transaction_ref(self):
-        return uuid.uuid4().hex[:10].upper()
+        return reference_generator()()
 
     def __str__(self):
         return self.transaction_ref
 
 
+def adjust_totals(outbound_id, quantity=0, lines=0):
+    """Move an outbound's stored total_quantity and line_count by the given deltas."""
+    if quantity or lines:
+        Outbound.objects.filter(pk=outbound_id).update(
+            total_quantity=F('total_quantity') + quantity,
+            line_count=F('line_count') + lines,
+        )
+
+
 class OutboundItem(models.Model):
     outbound = models.ForeignKey('Outbound', on_delete=models.CASCADE)
     stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
     quantity = models.IntegerField()
 
+    objects = CachedQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+        # Settle the stock before the row is written, netting out any previous
+        # quantity when an existing item is edited.
+        from .rollups import track_outflow
 
-        # Check if the outbound quantity exceeds available stock
-        if self.quantity > self.stock.quantity:
-            raise ValueError(f"Stock quantity for '{self.stock.stock_no}' cannot be negative or zero.")
+        with write_atomic():
+            deltas = {self.stock_id: -self.quantity}
+            previous = None
+            if self.pk:
+                previous = (
+                    OutboundItem.objects.filter(pk=self.pk)
+                    .values_list('stock_id', 'quantity', 'outbound_id').first()
+                )
+            totals = {self.outbound_id: (self.quantity, 1)}
+            if previous:
+                stock_id, quantity, outbound_id = previous
+                moved, lines = totals.get(outbound_id, (0, 0))
+                totals[outbound_id] = (moved - quantity, lines - 1)
+                if outbound_id == self.outbound_id:
+                    deltas[stock_id] = deltas.get(stock_id, 0) + quantity
+                else:
+                    # Moved off another outbound: give the stock back to that one's unit.
+                    outbound = Outbound.objects.values_list('transaction_ref', 'unit_id').get(pk=outbound_id)
+                    apply_stock_deltas({stock_id: quantity}, reference=outbound[0], unit=outbound[1])
 
-        # Deduct the outbound quantity from stock
-        self.stock.quantity -= self.quantity
-        self.stock.save()
+            apply_stock_deltas(deltas, reference=self.outbound.transaction_ref, unit=self.outbound.unit_id)
+            for outbound_id, (quantity, lines) in totals.items():
+                adjust_totals(outbound_id, quantity, lines)
+            with track_outflow(*totals):
+                super().save(*args, **kwargs)
 
     def delete(self, *args, **kwargs):
+        from .rollups import track_outflow
+
         # Return quantity to stock when deleting an outbound item
-        self.stock.quantity += self.quantity
-        self.stock.save()
-        super().delete(*args, **kwargs)
+        with write_atomic(), track_outflow(self.outbound_id):
+            apply_stock_deltas(
+                {self.stock_id: self.quantity}, reference=self.outbound.transaction_ref, unit=self.outbound.unit_id,
+            )
+            adjust_totals(self.outbound_id, -self.quantity, -1)
+            return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f'{self.stock} - {self.quantity}'
+
+
+class DailyStockOutflow(models.Model):
+    """
+    Quantity issued per day, stock and unit, and the number of outbounds it
+    came from. Kept current by outbound.rollups; ``backfill_outflow``
+    recomputes it from the items.
+    """
+    date = models.DateField()
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='daily_outflow')
+    unit = models.ForeignKey(Unit, on_delete=models.CASCADE, null=True, blank=True)
+    quantity = models.IntegerField(default=0)
+    txn_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Outbounds without a unit share one row, so NULL must compare equal.
+            models.UniqueConstraint(
+                F('date'), F('stock'), Coalesce(F('unit'), Value(0)), name='daily_outflow_key',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'unit'], name='daily_outflow_date_unit_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.date} {self.stock} {self.quantity}'
+
+
+class ReferenceSequence(models.Model):
+    """Next unallocated transaction_ref number of a day, for SequenceReferenceGenerator."""
+    day = models.DateField(unique=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f'{self.day}: {self.next_value}'
+
+
+class OutboundReversal(models.Model):
+    """
+    An outbound taken back by services.reverse_outbounds(): what it had
+    issued, and who reversed it. ``reference`` is shared by every outbound
+    reversed in the same batch and by the batch's StockMovement rows.
+    """
+    reference = models.CharField(max_length=100, db_index=True)
+    transaction_ref = models.CharField(max_length=100, db_index=True)
+    customer = models.CharField(max_length=50, blank=True)
+    unit = models.ForeignKey(Unit, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    outbound_date = models.DateTimeField()
+    processed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    total_quantity = models.IntegerField(default=0)
+    line_count = models.IntegerField(default=0)
+    # [{'stock_id': ..., 'stock_no': ..., 'quantity': ...}] as issued
+    lines = models.JSONField(default=list)
+    reason = models.CharField(max_length=200, blank=True)
+    reversed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    reversed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['reversed_at', 'id'], name='outbound_reversal_date_idx'),
+        ]
 
     def __str__(self):
-        return f'{self.stock} - {self.quantity}'
\ No newline at end of file
+        return f'{self.transaction_ref} ({self.reference})'
@@ -0,0 +1,188 @@
+"""
+Daily outflow rollup (DailyStockOutflow) maintenance.
+
+Every write path that changes an outbound's items, date or unit reads the
+outbound's per-stock totals before and after the change (track_outflow) and
+adds the difference to the affected rollup rows with one upsert, so the
+rollup stays exact without ever re-aggregating a day. backfill_outflow
+rebuilds it from the items a few days per transaction.
+"""
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, time, timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyStockOutflow, Outbound, OutboundItem
+
+BACKFILL_DAYS_PER_BATCH = 7
+UPSERT_BATCH_SIZE = 1000  # rows; keeps SQLite under its bound-parameter limit
+
+# Outbounds whose outflow was already taken out by outflow_removed().
+removed_outbounds = ContextVar('removed_outbounds', default=frozenset())
+
+
+def start_of_day(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+def outflow_snapshot(outbound_ids):
+    """``{(date, stock_id, unit_id, outbound_id): quantity}`` for the items of the given outbounds."""
+    rows = (
+        OutboundItem.objects.filter(outbound_id__in=outbound_ids)
+        .values_list('outbound_id', 'outbound__outbound_date', 'outbound__unit_id', 'stock_id')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+    )
+    return {
+        (timezone.localtime(outbound_date).date(), stock_id, unit_id, outbound_id): total
+        for outbound_id, outbound_date, unit_id, stock_id, total in rows
+    }
+
+
+def outflow_changes(before, after):
+    """Per ``(date, stock_id, unit_id)``, the ``(quantity, txn_count)`` deltas between two snapshots."""
+    changes = defaultdict(Counter)
+    for snapshot, sign in ((before, -1), (after, 1)):
+        for (date, stock_id, unit_id, outbound_id), quantity in snapshot.items():
+            changes[date, stock_id, unit_id]['quantity'] += sign * quantity
+            changes[date, stock_id, unit_id]['txn_count'] += sign
+    return {
+        key: (change['quantity'], change['txn_count'])
+        for key, change in changes.items() if change['quantity'] or change['txn_count']
+    }
+
+
+def record_outflow(changes):
+    """Add ``{(date, stock_id, unit_id): (quantity, txn_count)}`` to the rollup, one statement per batch."""
+    table = DailyStockOutflow._meta.db_table
+    connection = connections[router.db_for_write(DailyStockOutflow)]
+    rows = [
+        (connection.ops.adapt_datefield_value(date), stock_id, unit_id, quantity, txn_count)
+        for (date, stock_id, unit_id), (quantity, txn_count) in changes.items()
+    ]
+    # ORM upserts can only overwrite; the conflict target is the daily_outflow_key index.
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            cursor.execute(
+                f"INSERT INTO {table} (date, stock_id, unit_id, quantity, txn_count) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))} "
+                f"ON CONFLICT (date, stock_id, COALESCE(unit_id, 0)) DO UPDATE SET "
+                f"quantity = {table}.quantity + excluded.quantity, "
+                f"txn_count = {table}.txn_count + excluded.txn_count",
+                [value for row in batch for value in row],
+            )
+
+    emptied = [key for key, (quantity, txn_count) in changes.items() if txn_count < 0]
+    if emptied:
+        DailyStockOutflow.objects.filter(
+            date__in={date for date, stock_id, unit_id in emptied},
+            stock_id__in={stock_id for date, stock_id, unit_id in emptied},
+            txn_count__lte=0,
+        ).delete()
+
+
+@contextmanager
+def track_outflow(*outbounds):
+    """
+    Record the rollup change made by the enclosed block to ``outbounds``
+    (instances or pks; an unsaved outbound is picked up once saved). Must
+    run inside the transaction that makes the change.
+    """
+    def saved_ids():
+        return [pk for pk in (getattr(outbound, 'pk', outbound) for outbound in outbounds) if pk]
+
+    before = outflow_snapshot(saved_ids())
+    yield
+    after = outflow_snapshot(saved_ids())
+    record_outflow(outflow_changes(before, after))
+
+
+def remove_outflow(outbound_ids):
+    """Take the items of outbounds that are about to be deleted out of the rollup."""
+    record_outflow(outflow_changes(outflow_snapshot(outbound_ids), {}))
+
+
+@contextmanager
+def outflow_removed(outbound_ids):
+    """
+    Take the outflow of many outbounds out in one pass before the enclosed
+    block deletes them, instead of once per outbound in the pre_delete hook.
+    """
+    remove_outflow(outbound_ids)
+    token = removed_outbounds.set(removed_outbounds.get() | frozenset(outbound_ids))
+    try:
+        yield
+    finally:
+        removed_outbounds.reset(token)
+
+
+def fold_unit_outflow(unit_id):
+    """Move a unit's rollup rows to the no-unit rows, as its outbounds are about to lose the unit."""
+    rows = DailyStockOutflow.objects.filter(unit_id=unit_id).values_list('date', 'stock_id', 'quantity', 'txn_count')
+    record_outflow({(date, stock_id, None): (quantity, txn_count) for date, stock_id, quantity, txn_count in rows})
+
+
+def outflow_summary(start, end, unit=None, top=10):
+    """Chart data for ``start <= date <= end``, read from the rollup only."""
+    rows = DailyStockOutflow.objects.filter(date__range=(start, end))
+    if unit is not None:
+        rows = rows.filter(unit=unit)
+    by_day = dict(rows.values_list('date').annotate(total=Sum('quantity')).order_by())
+    days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+    return {
+        'days': [day.isoformat() for day in days],
+        'daily_quantity': [by_day.get(day, 0) for day in days],
+        'top_stocks': list(
+            rows.values('stock__stock_no')
+            .annotate(quantity=Sum('quantity'), outbounds=Sum('txn_count'))
+            .order_by('-quantity', 'stock__stock_no')[:top]
+        ),
+        'units': list(
+            rows.values('unit__name').annotate(quantity=Sum('quantity')).order_by('-quantity', 'unit__name')
+        ),
+    }
+
+
+def backfill_outflow(days_per_batch=BACKFILL_DAYS_PER_BATCH, progress=None):
+    """
+    Recompute the rollup from the items, replacing ``days_per_batch`` days
+    per transaction. Writes made meanwhile land either before a day is
+    replaced or on top of the replaced rows, so it can run on a live system.
+    Returns the number of rollup rows written.
+    """
+    bounds = Outbound.objects.aggregate(first=Min('outbound_date'), last=Max('outbound_date'))
+    if bounds['first'] is None:
+        DailyStockOutflow.objects.all().delete()
+        return 0
+
+    first, last = timezone.localdate(bounds['first']), timezone.localdate(bounds['last'])
+    # Days that no longer have outbounds are not visited below.
+    DailyStockOutflow.objects.exclude(date__range=(first, last)).delete()
+    start, written = first, 0
+    while start <= last:
+        end = start + timedelta(days=days_per_batch)
+        with transaction.atomic():
+            DailyStockOutflow.objects.filter(date__gte=start, date__lt=end).delete()
+            rows = (
+                # Bounds on the column itself, so the outbound_date indexes apply.
+                OutboundItem.objects.filter(outbound__outbound_date__gte=start_of_day(start),
+                                            outbound__outbound_date__lt=start_of_day(end))
+                .values_list(TruncDate('outbound__outbound_date'), 'stock_id', 'outbound__unit_id')
+                .annotate(quantity=Sum('quantity'), txn_count=Count('outbound_id', distinct=True))
+                .order_by()
+            )
+            created = DailyStockOutflow.objects.bulk_create([
+                DailyStockOutflow(date=date, stock_id=stock_id, unit_id=unit_id, quantity=quantity, txn_count=txn_count)
+                for date, stock_id, unit_id, quantity, txn_count in rows
+            ], batch_size=1000)
+        written += len(created)
+        start = end
+        if progress:
+            progress(min(start, last), last)
+    return written
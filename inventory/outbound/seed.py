@@ -0,0 +1,107 @@
+"""
+Synthetic data for benchmarks. Everything is written with bulk_create in
+batches, and rows are tagged with a prefix so a run can be topped up or
+cleaned out without touching real data.
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from profiles.models import Unit
+from stocks.models import Stock, StockMovement
+from stocks.signals import stocks_changed
+from .models import Outbound, OutboundItem
+
+SEED_PREFIX = 'BENCH'
+SEED_BATCH_SIZE = 5000
+
+
+def seed_units(count=10, prefix=SEED_PREFIX):
+    existing = list(Unit.objects.filter(name__startswith=prefix))
+    Unit.objects.bulk_create([
+        Unit(name=f'{prefix} Unit {i}') for i in range(len(existing), count)
+    ])
+    return list(Unit.objects.filter(name__startswith=prefix).order_by('pk'))
+
+
+def seed_users(count=5, prefix=SEED_PREFIX):
+    prefix = prefix.lower()
+    existing = User.objects.filter(username__startswith=prefix).count()
+    User.objects.bulk_create([
+        User(username=f'{prefix}{i}', password='!') for i in range(existing, count)
+    ])
+    return list(User.objects.filter(username__startswith=prefix).order_by('pk'))
+
+
+def seed_stocks(count, batch_size=SEED_BATCH_SIZE, prefix=SEED_PREFIX, quantity=1000000, progress=None):
+    """Top the catalogue up to ``count`` seeded stocks, each with an opening ledger entry."""
+    start = Stock.objects.filter(stock_no__startswith=f'{prefix}-').count()
+    for offset in range(start, count, batch_size):
+        with transaction.atomic():
+            stocks = Stock.objects.bulk_create([
+                Stock(stock_no=f'{prefix}-{i:010d}', name=f'Item {i}', unit='pcs', description='', quantity=quantity)
+                for i in range(offset, min(offset + batch_size, count))
+            ])
+            StockMovement.objects.bulk_create([
+                StockMovement(stock=stock, kind=StockMovement.ADJUSTMENT, quantity=quantity, reference='Opening balance')
+                for stock in stocks
+            ])
+            stocks_changed.send(sender=Stock, stock_ids=[stock.pk for stock in stocks])
+        if progress:
+            progress('stocks', offset + len(stocks), count)
+    return Stock.objects.filter(stock_no__startswith=f'{prefix}-')
+
+
+def seed_outbounds(item_count, lines_per_outbound=5, days=365, batch_size=SEED_BATCH_SIZE,
+                   prefix=SEED_PREFIX, seed=0, progress=None):
+    """
+    Top the history up to ``item_count`` seeded outbound items spread over the
+    last ``days`` days. Items are inserted directly and do not move stock or
+    the daily rollup; run backfill_outflow afterwards for the dashboard.
+    """
+    rng = random.Random(seed)
+    units = seed_units(prefix=prefix)
+    users = seed_users(prefix=prefix)
+    stock_ids = list(Stock.objects.filter(stock_no__startswith=f'{prefix}-').values_list('pk', flat=True))
+    if not stock_ids:
+        raise ValueError('Seed stocks before seeding outbounds.')
+
+    now = timezone.now()
+    seeded = Outbound.objects.filter(transaction_ref__startswith=prefix)
+    created = OutboundItem.objects.filter(outbound__in=seeded).count()
+    next_ref = seeded.count()
+    outbounds_per_batch = max(1, batch_size // lines_per_outbound)
+    while created < item_count:
+        with transaction.atomic():
+            # Lines are drawn first so each outbound is inserted with its totals.
+            lines = []
+            remaining = item_count - created
+            while remaining > 0 and len(lines) < outbounds_per_batch:
+                count = min(lines_per_outbound, remaining)
+                lines.append([(rng.choice(stock_ids), rng.randint(1, 20)) for _ in range(count)])
+                remaining -= count
+            outbounds = Outbound.objects.bulk_create([
+                Outbound(
+                    transaction_ref=f'{prefix}{next_ref + i:010d}',
+                    unit=rng.choice(units),
+                    processed_by=rng.choice(users),
+                    outbound_date=now - timedelta(seconds=rng.randrange(days * 86400)),
+                    total_quantity=sum(quantity for stock_id, quantity in outbound_lines),
+                    line_count=len(outbound_lines),
+                )
+                for i, outbound_lines in enumerate(lines)
+            ])
+            next_ref += len(outbounds)
+            items = [
+                OutboundItem(outbound=outbound, stock_id=stock_id, quantity=quantity)
+                for outbound, outbound_lines in zip(outbounds, lines)
+                for stock_id, quantity in outbound_lines
+            ]
+            OutboundItem.objects.bulk_create(items, batch_size=batch_size)
+        created += len(items)
+        if progress:
+            progress('outbound items', created, item_count)
+    return seeded
@@ -0,0 +1,252 @@
+import uuid
+from collections import defaultdict
+
+from django.db.models import Count, IntegerField, Max, OuterRef, QuerySet, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from inventory.transactions import write_atomic
+from stocks.ledger import chunked
+from stocks.models import MovementCost, Stock, StockLocation, StockMovement, StockReservation
+from stocks.reservations import HoldNotFound
+from stocks.services import apply_stock_deltas
+from .models import Outbound, OutboundItem, OutboundReversal, adjust_totals
+from .rollups import outflow_removed, track_outflow
+
+BACKFILL_BATCH_SIZE = 5000
+REVERSAL_BATCH_SIZE = 500
+
+
+def _normalize_lines(lines):
+    """Turn ``(stock or stock pk, quantity)`` pairs into ``(stock_pk, quantity)``."""
+    normalized = []
+    for stock, quantity in lines:
+        if quantity <= 0:
+            raise ValueError('Outbound quantities must be greater than zero.')
+        normalized.append((getattr(stock, 'pk', stock), quantity))
+    return normalized
+
+
+def issue_outbound(outbound, lines):
+    """
+    Issue every line of an outbound in one transaction.
+
+    Stock for all lines is locked, validated and deducted with a single
+    conditional update before the items are inserted with ``bulk_create``,
+    so the number of queries does not grow with the number of lines. Stock
+    kept at locations is taken from the outbound's unit.
+    """
+    lines = _normalize_lines(lines)
+
+    totals = defaultdict(int)
+    for stock_id, quantity in lines:
+        totals[stock_id] -= quantity
+    issued = sum(quantity for stock_id, quantity in lines)
+
+    with write_atomic(), track_outflow(outbound):
+        outbound.total_quantity += issued
+        outbound.line_count += len(lines)
+        if outbound.pk is None:
+            # A new outbound is inserted with its totals already in place.
+            outbound.save()
+        else:
+            adjust_totals(outbound.pk, issued, len(lines))
+        apply_stock_deltas(totals, reference=outbound.transaction_ref, unit=outbound.unit_id)
+        return OutboundItem.objects.bulk_create([
+            OutboundItem(outbound=outbound, stock_id=stock_id, quantity=quantity)
+            for stock_id, quantity in lines
+        ])
+
+
+def confirm_hold(outbound, hold):
+    """
+    Issue the stock held under ``hold`` (see stocks.reservations) as the
+    outbound's items in one bulk step. The hold is deleted first so it does
+    not count against itself; a lapsed hold is still issued if the stock is
+    free. An outbound without a unit takes the hold's.
+    """
+    with write_atomic():
+        rows = list(
+            StockReservation.objects.select_for_update().filter(hold=hold)
+            .order_by('id').values_list('stock_id', 'unit_id', 'quantity')
+        )
+        if not rows:
+            raise HoldNotFound(f'No stock is held under {hold!r}.')
+        unit = rows[0][1]
+        if outbound.unit_id is None and outbound.pk is None:
+            outbound.unit_id = unit
+        elif outbound.unit_id != unit:
+            raise ValueError('The stock was held for another unit.')
+        StockReservation.objects.filter(hold=hold).delete()
+        return issue_outbound(outbound, [(stock_id, quantity) for stock_id, unit_id, quantity in rows])
+
+
+def reconcile_outbound_items(outbound, created=(), changed=(), deleted=()):
+    """
+    Persist edits to an outbound's items and settle stock by the net difference.
+
+    Previous stock/quantity values for changed and deleted items are read back
+    in a single query, so re-saving an unchanged line costs nothing and moving
+    a line to another stock returns the old quantity before taking the new one.
+    """
+    created, changed, deleted = list(created), list(changed), list(deleted)
+    for item in created + changed:
+        if item.quantity <= 0:
+            raise ValueError('Outbound quantities must be greater than zero.')
+
+    with write_atomic(), track_outflow(outbound):
+        deltas = defaultdict(int)
+        existing = [item.pk for item in changed + deleted]
+        if existing:
+            previous = OutboundItem.objects.filter(pk__in=existing).values_list('stock_id', 'quantity')
+            for stock_id, quantity in previous:
+                deltas[stock_id] += quantity
+        for item in created + changed:
+            deltas[item.stock_id] -= item.quantity
+
+        apply_stock_deltas(deltas, reference=outbound.transaction_ref, unit=outbound.unit_id)
+
+        # Stock deltas net to the change in the outbound's total quantity.
+        quantity = -sum(deltas.values())
+        lines = len(created) - len(deleted)
+        adjust_totals(outbound.pk, quantity, lines)
+        outbound.total_quantity += quantity
+        outbound.line_count += lines
+
+        if created:
+            for item in created:
+                item.outbound = outbound
+            OutboundItem.objects.bulk_create(created)
+        if changed:
+            OutboundItem.objects.bulk_update(changed, ['stock', 'quantity'])
+        if deleted:
+            # A queryset delete skips OutboundItem.delete(); stock was already returned above.
+            OutboundItem.objects.filter(pk__in=[item.pk for item in deleted]).delete()
+
+
+def reverse_outbounds(outbounds, user=None, reason='', batch_size=REVERSAL_BATCH_SIZE, progress=None):
+    """
+    Give back all stock issued by ``outbounds`` (a queryset, or instances or
+    pks) and delete them, leaving an OutboundReversal in place of each.
+
+    Outbounds are reversed ``batch_size`` at a time, one transaction per
+    batch. The items of a batch are summed per stock, so each stock gets one
+    ``F()`` update and one REVERSAL ledger row however many outbounds issued
+    it; stocks kept at locations get one per unit they were issued from.
+    Outbounds already gone are skipped, so a rerun after a failure picks up
+    where it stopped. Returns the number reversed.
+    """
+    if isinstance(outbounds, QuerySet):
+        ids = outbounds.order_by().values_list('pk', flat=True)
+    else:
+        ids = {getattr(outbound, 'pk', outbound) for outbound in outbounds}
+    ids = list(ids)
+
+    done = 0
+    for batch in chunked(ids, batch_size):
+        with write_atomic():
+            headers = list(
+                Outbound.objects.select_for_update().filter(pk__in=batch).order_by('pk')
+                .values_list('pk', 'transaction_ref', 'customer', 'unit_id', 'outbound_date', 'processed_by_id')
+            )
+            found = [header[0] for header in headers]
+            units = {header[0]: header[3] for header in headers}
+            lines = defaultdict(list)
+            deltas = defaultdict(lambda: defaultdict(int))
+            items = (
+                OutboundItem.objects.filter(outbound_id__in=found).order_by('outbound_id', 'pk')
+                .values_list('outbound_id', 'stock_id', 'stock__stock_no', 'quantity')
+            )
+            for outbound_id, stock_id, stock_no, quantity in items:
+                lines[outbound_id].append({'stock_id': stock_id, 'stock_no': stock_no, 'quantity': quantity})
+                deltas[units[outbound_id]][stock_id] += quantity
+
+            reference = 'RV-' + uuid.uuid4().hex[:10].upper()
+            # Every stock of the batch is locked up front, in pk order, so
+            # concurrent reversals cannot deadlock across the updates below.
+            stock_ids = {stock_id for unit_deltas in deltas.values() for stock_id in unit_deltas}
+            list(Stock.objects.select_for_update().filter(pk__in=stock_ids).order_by('pk').values_list('pk'))
+            # Only stocks kept at locations need returning unit by unit; the
+            # rest are summed over all units into one update.
+            located = set(StockLocation.objects.filter(stock_id__in=stock_ids).values_list('stock_id', flat=True))
+            unlocated = defaultdict(int)
+            for unit in sorted(deltas, key=lambda unit: (unit is not None, unit)):
+                for stock_id, quantity in deltas[unit].items():
+                    if stock_id not in located:
+                        unlocated[stock_id] += quantity
+                at_unit = {stock_id: quantity for stock_id, quantity in deltas[unit].items() if stock_id in located}
+                apply_stock_deltas(at_unit, kind=StockMovement.REVERSAL, reference=reference, unit=unit)
+            apply_stock_deltas(unlocated, kind=StockMovement.REVERSAL, reference=reference)
+
+            OutboundReversal.objects.bulk_create([
+                OutboundReversal(
+                    reference=reference, transaction_ref=transaction_ref, customer=customer, unit_id=unit_id,
+                    outbound_date=outbound_date, processed_by_id=processed_by_id, reason=reason, reversed_by=user,
+                    total_quantity=sum(line['quantity'] for line in lines[pk]), line_count=len(lines[pk]),
+                    lines=lines[pk],
+                )
+                for pk, transaction_ref, customer, unit_id, outbound_date, processed_by_id in headers
+            ])
+            with outflow_removed(found):
+                Outbound.objects.filter(pk__in=found).delete()
+        done += len(found)
+        if progress:
+            progress(done, len(ids))
+    return done
+
+
+def item_costs(items):
+    """
+    ``{item pk: (fifo_cost, average_cost)}`` for OutboundItems, from the
+    valued issue movements of their outbound (see stocks.valuation). An
+    outbound that issued a stock over several lines or edits costs each of
+    them at the average unit cost of those issues. Items whose issues have
+    not been valued yet are left out.
+    """
+    if isinstance(items, QuerySet):
+        items = items.values_list('pk', 'stock_id', 'quantity', 'outbound__transaction_ref')
+    else:
+        items = [(item.pk, item.stock_id, item.quantity, item.outbound.transaction_ref) for item in items]
+    items = list(items)
+    issues = (
+        MovementCost.objects.filter(
+            movement__kind=StockMovement.ISSUE,
+            movement__stock_id__in={stock_id for pk, stock_id, quantity, reference in items},
+            movement__reference__in={reference for pk, stock_id, quantity, reference in items},
+        )
+        .values_list('movement__stock_id', 'movement__reference')
+        .annotate(quantity=Sum('movement__quantity'), fifo=Sum('fifo_value'), average=Sum('average_value'))
+        .order_by()
+    )
+    unit_costs = {
+        (stock_id, reference): (fifo / quantity, average / quantity)
+        for stock_id, reference, quantity, fifo, average in issues
+    }
+    costs = {}
+    for pk, stock_id, quantity, reference in items:
+        if (stock_id, reference) in unit_costs:
+            fifo, average = unit_costs[stock_id, reference]
+            costs[pk] = (round(fifo * quantity, 4), round(average * quantity, 4))
+    return costs
+
+
+def backfill_totals(batch_size=BACKFILL_BATCH_SIZE, progress=None):
+    """
+    Recompute Outbound.total_quantity and line_count from the items, one
+    primary-key range per UPDATE. Returns the number of outbounds visited.
+    """
+    items = OutboundItem.objects.filter(outbound=OuterRef('pk')).order_by().values('outbound')
+    quantity = items.annotate(total=Sum('quantity')).values('total')
+    count = items.annotate(count=Count('pk')).values('count')
+
+    last_id = Outbound.objects.aggregate(last=Max('pk'))['last'] or 0
+    position = visited = 0
+    while position < last_id:
+        end_id = min(position + batch_size, last_id)
+        visited += Outbound.objects.filter(pk__gt=position, pk__lte=end_id).update(
+            total_quantity=Coalesce(Subquery(quantity, output_field=IntegerField()), Value(0)),
+            line_count=Coalesce(Subquery(count, output_field=IntegerField()), Value(0)),
+        )
+        position = end_id
+        if progress:
+            progress(position, last_id)
+    return visited
@@ -0,0 +1,18 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from profiles.models import Unit
+from .models import Outbound
+from .rollups import fold_unit_outflow, remove_outflow, removed_outbounds
+
+
+@receiver(pre_delete, sender=Outbound, dispatch_uid='outbound_remove_outflow')
+def outbound_deleted(sender, instance, **kwargs):
+    # Items go with the outbound in a cascade that skips OutboundItem.delete().
+    if instance.pk not in removed_outbounds.get():
+        remove_outflow([instance.pk])
+
+
+@receiver(pre_delete, sender=Unit, dispatch_uid='outbound_fold_unit_outflow')
+def unit_deleted(sender, instance, **kwargs):
+    fold_unit_outflow(instance.pk)
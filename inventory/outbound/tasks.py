@@ -0,0 +1,64 @@
+from django.contrib import admin
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import Min
+from django.http import HttpRequest, QueryDict
+from django.utils import timezone
+
+from jobs.registry import task
+from .exports import EXPORTERS
+from .forecasting import forecast_demand
+from .models import Outbound
+from .rollups import backfill_outflow
+from .services import backfill_totals
+
+
+def changelist_queryset(user, query):
+    """The outbounds the admin changelist shows ``user`` for the query string ``query``."""
+    request = HttpRequest()
+    request.GET, request.user = QueryDict(query), user or AnonymousUser()
+    model_admin = admin.site.get_model_admin(Outbound)
+    return model_admin.get_changelist_instance(request).get_queryset(request)
+
+
+@task('outbound.export', label='Export outbounds')
+def export_outbounds(context, query='', selected=None, format='csv'):
+    queryset = changelist_queryset(context.job.created_by, query)
+    if selected is not None:
+        queryset = queryset.filter(pk__in=selected)
+    queryset = queryset.order_by('pk')
+    total = queryset.count()
+
+    def chunks():
+        # The CSV exporter yields its header row first.
+        done = -1 if format == 'csv' else 0
+        for chunk in EXPORTERS[format](queryset):
+            yield chunk
+            done += 1
+            context.progress(max(done, 0), total)
+
+    context.save_result(f'outbound-{context.job.pk}.{format}', chunks())
+    return f'Exported {total} outbounds.'
+
+
+@task('outbound.backfill_totals', label='Recompute outbound totals', maintenance=True)
+def backfill_outbound_totals(context):
+    count = backfill_totals(progress=context.progress)
+    return f'Backfilled totals for {count} outbounds.'
+
+
+@task('outbound.backfill_outflow', label='Rebuild the daily outflow rollup', maintenance=True)
+def backfill_daily_outflow(context):
+    first = Outbound.objects.aggregate(first=Min('outbound_date'))['first']
+    first = timezone.localdate(first) if first else None
+
+    def progress(day, last):
+        context.progress((day - first).days, (last - first).days)
+
+    count = backfill_outflow(progress=progress)
+    return f'Wrote {count} daily outflow rows.'
+
+
+@task('outbound.forecast_demand', label='Forecast daily demand', maintenance=True)
+def forecast_stock_demand(context):
+    count = forecast_demand(progress=context.progress)
+    return f'Forecast demand for {count} stocks.'
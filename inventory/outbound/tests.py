@@ -1,3 +1,829 @@
-from django.test import TestCase
+import json
+from decimal import Decimal
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, transaction
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from inventory.routers import REPLICA_DB_ALIAS, PrimaryReplicaRouter
+from inventory.transactions import write_atomic
+
+from stocks.models import Stock, StockLocation, StockMovement, StockReservation
+from stocks.services import InsufficientStock, transfer_stock
+from stocks.signals import stocks_changed
+from stocks.valuation import value_stock
+from profiles.models import Unit
+from .admin import OutboundAdmin
+from .exports import iter_csv
+from .models import DailyStockOutflow, Outbound, OutboundItem, OutboundReversal, ReferenceSequence
+from .references import SequenceReferenceGenerator, TimeOrderedReferenceGenerator
+from .services import issue_outbound, item_costs, reconcile_outbound_items, reverse_outbounds
+
+
+def make_stocks(count, quantity=100):
+    return Stock.objects.bulk_create([
+        Stock(stock_no=f'STK-{i:05d}', unit='pcs', description='', quantity=quantity)
+        for i in range(count)
+    ])
+
+
+class IssueOutboundTests(TestCase):
+
+    def test_deducts_every_line(self):
+        stocks = make_stocks(3)
+        outbound = Outbound.objects.create()
+
+        issue_outbound(outbound, [(stocks[0], 5), (stocks[1], 10), (stocks[0].pk, 1)])
+
+        quantities = dict(Stock.objects.values_list('pk', 'quantity'))
+        self.assertEqual(quantities[stocks[0].pk], 94)
+        self.assertEqual(quantities[stocks[1].pk], 90)
+        self.assertEqual(quantities[stocks[2].pk], 100)
+        self.assertEqual(outbound.outbounditem_set.count(), 3)
+
+    def test_shortfall_rolls_back_the_whole_order(self):
+        stocks = make_stocks(2, quantity=5)
+        outbound = Outbound.objects.create()
+
+        with self.assertRaises(InsufficientStock):
+            issue_outbound(outbound, [(stocks[0], 5), (stocks[1], 6)])
+
+        self.assertEqual(list(Stock.objects.values_list('quantity', flat=True)), [5, 5])
+        self.assertFalse(OutboundItem.objects.exists())
+
+    def test_query_count_does_not_grow_with_lines(self):
+        stocks = make_stocks(150)
+        small, large = Outbound.objects.create(), Outbound.objects.create()
+
+        # Includes the daily rollup (items read before and after, one upsert)
+        # re-evaluating the reorder flags of the stocks touched, and reading
+        # their location rows and active reservations.
+        with self.assertNumQueries(13):
+            issue_outbound(small, [(stocks[0], 1), (stocks[1], 1)])
+        with self.assertNumQueries(13):
+            issue_outbound(large, [(stock, 1) for stock in stocks])
+
+    def test_new_outbound_is_inserted_with_totals(self):
+        stocks = make_stocks(2)
+
+        outbound = Outbound()
+        issue_outbound(outbound, [(stocks[0], 5), (stocks[1], 10)])
+
+        outbound.refresh_from_db()
+        self.assertEqual((outbound.total_quantity, outbound.line_count), (15, 2))
+
+
+class TransactionReferenceTests(TestCase):
+
+    def test_time_ordered_references_sort_in_issue_order(self):
+        generate = TimeOrderedReferenceGenerator()
+        references = [generate() for _ in range(2000)]
+
+        self.assertEqual(references, sorted(set(references)))
+        self.assertEqual({len(reference) for reference in references}, {26})
+
+    def test_sequence_blocks_are_handed_out_per_process(self):
+        first, second = SequenceReferenceGenerator(block_size=3), SequenceReferenceGenerator(block_size=3)
+
+        # One block each: the first starts the day's row, the second bumps it
+        # (savepoints included). The fourth reference comes from memory.
+        with self.assertNumQueries(10):
+            references = [first(), first(), second(), first()]
+
+        today = f'{timezone.localdate():%Y%m%d}'
+        self.assertEqual(references, [f'{today}-00000001', f'{today}-00000002', f'{today}-00000004',
+                                      f'{today}-00000003'])
+        self.assertEqual(ReferenceSequence.objects.get().next_value, 7)
+
+    @override_settings(OUTBOUND_REFERENCE_GENERATOR='outbound.references.SequenceReferenceGenerator')
+    def test_configured_generator_is_used(self):
+        self.assertRegex(Outbound.objects.create().transaction_ref, r'^\d{8}-\d{8}$')
+
+    def test_taken_reference_is_replaced(self):
+        taken = Outbound.objects.create().transaction_ref
+
+        with mock.patch.object(Outbound, 'generate_transaction_ref', side_effect=[taken, 'FRESH']):
+            outbound = Outbound.objects.create()
+
+        self.assertEqual(outbound.transaction_ref, 'FRESH')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Outbound.objects.create(transaction_ref=taken)  # chosen by the caller, so not replaced
+
+
+class OutboundItemCostTests(TestCase):
+
+    def test_items_are_costed_from_their_valued_issues(self):
+        stock = Stock.objects.create(stock_no='STK-1', unit='pcs', description='', quantity=100, unit_cost=2)
+        stock.quantity, stock.unit_cost = 110, 5
+        stock.save()
+        outbound = Outbound()
+        items = issue_outbound(outbound, [(stock, 60), (stock, 30)])
+        self.assertEqual(item_costs(items), {})  # nothing valued yet
+
+        value_stock()
+
+        # FIFO takes all 90 from the first 100 at 2.00; the average is 250 / 110.
+        self.assertEqual(item_costs(OutboundItem.objects.filter(outbound=outbound)), {
+            items[0].pk: (Decimal('120'), Decimal('136.3636')),
+            items[1].pk: (Decimal('60'), Decimal('68.1818')),
+        })
+
+
+class OutboundItemTests(TestCase):
+
+    def test_edit_only_applies_the_difference(self):
+        stock = make_stocks(1)[0]
+        item = OutboundItem.objects.create(outbound=Outbound.objects.create(), stock=stock, quantity=10)
+
+        item.quantity = 4
+        item.save()
+        stock.refresh_from_db()
+        self.assertEqual(stock.quantity, 96)
+
+        item.delete()
+        stock.refresh_from_db()
+        self.assertEqual(stock.quantity, 100)
+
+    def test_totals_follow_item_changes(self):
+        stock = make_stocks(1)[0]
+        first, second = Outbound.objects.create(), Outbound.objects.create()
+        item = OutboundItem.objects.create(outbound=first, stock=stock, quantity=10)
+        OutboundItem.objects.create(outbound=first, stock=stock, quantity=2)
+
+        item.quantity = 4
+        item.save()
+        first.refresh_from_db()
+        self.assertEqual((first.total_quantity, first.line_count), (6, 2))
+
+        item.outbound = second
+        item.save()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.total_quantity, first.line_count), (2, 1))
+        self.assertEqual((second.total_quantity, second.line_count), (4, 1))
+
+        item.delete()
+        second.refresh_from_db()
+        self.assertEqual((second.total_quantity, second.line_count), (0, 0))
+
+    def test_saving_a_stale_outbound_keeps_its_totals(self):
+        stock = make_stocks(1)[0]
+        outbound = Outbound.objects.create()
+        stale = Outbound.objects.get(pk=outbound.pk)
+        issue_outbound(outbound, [(stock, 3)])
+
+        stale.customer = 'Walk-in'
+        stale.save()
+
+        outbound.refresh_from_db()
+        self.assertEqual((outbound.customer, outbound.total_quantity, outbound.line_count), ('Walk-in', 3, 1))
+
+    def test_backfill_command_recomputes_totals(self):
+        stocks = make_stocks(2)
+        outbounds = [Outbound.objects.create() for _ in range(3)]
+        issue_outbound(outbounds[0], [(stocks[0], 5), (stocks[1], 7)])
+        issue_outbound(outbounds[1], [(stocks[0], 1)])
+        Outbound.objects.update(total_quantity=99, line_count=99)
+
+        call_command('backfill_outbound_totals', batch_size=2, stdout=StringIO())
+
+        totals = list(Outbound.objects.order_by('pk').values_list('total_quantity', 'line_count'))
+        self.assertEqual(totals, [(12, 2), (1, 1), (0, 0)])
+
+
+class OutboundLocationTests(TestCase):
+
+    def setUp(self):
+        self.stock = make_stocks(1)[0]
+        self.north, self.south = Unit.objects.create(name='North'), Unit.objects.create(name='South')
+        transfer_stock([(self.stock, 30)], to_unit=self.north)
+        transfer_stock([(self.stock, 20)], to_unit=self.south)
+
+    def balances(self):
+        return dict(StockLocation.objects.values_list('unit__name', 'quantity'))
+
+    def test_outbound_takes_from_its_unit(self):
+        outbound = Outbound.objects.create(unit=self.north)
+        [item] = issue_outbound(outbound, [(self.stock, 25)])
+
+        self.assertEqual(self.balances(), {'North': 5, 'South': 20})
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).quantity, 75)
+        with self.assertRaisesMessage(InsufficientStock, f"Not enough 'STK-00000' at unit #{self.north.pk}."):
+            issue_outbound(Outbound.objects.create(unit=self.north), [(self.stock, 6)])
+
+        item.delete()
+        self.assertEqual(self.balances(), {'North': 30, 'South': 20})
+
+    def test_changing_the_unit_moves_what_was_issued(self):
+        outbound = Outbound.objects.create(unit=self.north)
+        issue_outbound(outbound, [(self.stock, 15)])
+
+        outbound.unit = self.south
+        outbound.save()
+        self.assertEqual(self.balances(), {'North': 30, 'South': 5})
+
+        outbound.unit = None  # taken from the 50 unassigned instead
+        outbound.save()
+        self.assertEqual(self.balances(), {'North': 30, 'South': 20})
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).quantity, 85)
+
+    def test_stock_without_locations_is_issued_from_its_total(self):
+        other = Stock.objects.create(stock_no='STK-2', unit='pcs', description='', quantity=10)
+
+        issue_outbound(Outbound.objects.create(unit=self.north), [(other, 10)])
+
+        self.assertEqual(Stock.objects.get(pk=other.pk).quantity, 0)
+        self.assertFalse(other.locations.exists())
+
+
+class OutboundReversalTests(TestCase):
+
+    def setUp(self):
+        self.located, self.plain = make_stocks(2)
+        self.north, self.south = Unit.objects.create(name='North'), Unit.objects.create(name='South')
+        transfer_stock([(self.located, 30)], to_unit=self.north)
+        transfer_stock([(self.located, 20)], to_unit=self.south)
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def issue(self, unit, *lines):
+        outbound = Outbound(unit=unit, customer='ACME')
+        issue_outbound(outbound, lines)
+        return outbound
+
+    def quantities(self):
+        return {
+            'total': dict(Stock.objects.values_list('stock_no', 'quantity')),
+            'located': dict(StockLocation.objects.values_list('unit__name', 'quantity')),
+        }
+
+    def test_reversal_restores_balances_and_keeps_a_record(self):
+        before = self.quantities()
+        outbounds = [
+            self.issue(self.north, (self.located, 10), (self.plain, 5)),
+            self.issue(self.south, (self.located, 4), (self.plain, 3), (self.plain, 2)),
+            self.issue(None, (self.plain, 1)),
+        ]
+        kept = self.issue(self.north, (self.plain, 7))
+
+        self.assertEqual(reverse_outbounds([*outbounds, outbounds[0].pk], user=self.user, batch_size=2), 3)
+
+        after = self.quantities()
+        self.assertEqual(after['located'], before['located'])
+        self.assertEqual(after['total'], {'STK-00000': 100, 'STK-00001': 93})
+        self.assertEqual(list(Outbound.objects.all()), [kept])
+        self.assertEqual(sorted(DailyStockOutflow.objects.values_list('stock_id', 'quantity', 'txn_count')),
+                         [(self.plain.pk, 7, 1)])
+        # The two batches each summed the unlocated stock into one ledger row.
+        movements = StockMovement.objects.filter(kind=StockMovement.REVERSAL)
+        self.assertEqual(sorted(movements.values_list('stock_id', 'unit_id', 'quantity')), sorted([
+            (self.located.pk, self.north.pk, 10), (self.located.pk, self.south.pk, 4),
+            (self.plain.pk, None, 10), (self.plain.pk, None, 1),
+        ]))
+
+        record = OutboundReversal.objects.get(transaction_ref=outbounds[1].transaction_ref)
+        self.assertEqual((record.unit, record.customer, record.total_quantity, record.line_count, record.reversed_by),
+                         (self.south, 'ACME', 9, 3, self.user))
+        self.assertEqual(record.lines[0], {'stock_id': self.located.pk, 'stock_no': 'STK-00000', 'quantity': 4})
+        self.assertEqual(set(movements.values_list('reference', flat=True)),
+                         set(OutboundReversal.objects.values_list('reference', flat=True)))
+        self.assertEqual(reverse_outbounds(outbounds), 0)
+
+    def test_admin_deletes_and_the_action_return_stock(self):
+        self.client.force_login(self.user)
+        first, second, third = [self.issue(self.north, (self.plain, 10)) for i in range(3)]
+        changelist = reverse('admin:outbound_outbound_changelist')
+
+        self.client.post(changelist, {'action': 'delete_selected', '_selected_action': [first.pk, second.pk],
+                                      'post': 'yes'})
+        self.assertEqual(Stock.objects.get(pk=self.plain.pk).quantity, 90)
+
+        self.client.post(changelist, {'action': 'reverse_selected', '_selected_action': [third.pk]})
+        self.client.post(reverse('admin:outbound_outbound_delete', args=[self.issue(None, (self.plain, 5)).pk]),
+                         {'post': 'yes'})
+        self.assertEqual(Stock.objects.get(pk=self.plain.pk).quantity, 100)
+        self.assertEqual(
+            sorted(OutboundReversal.objects.values_list('reason', flat=True)),
+            ['Deleted in the admin'] * 3 + ['Reversed in the admin'],
+        )
+
+    def test_command_reverses_the_outbounds_selected(self):
+        outbounds = [self.issue(unit, (self.plain, 2)) for unit in (self.north, self.north, self.south)]
+        out = StringIO()
+
+        call_command('reverse_outbounds', outbounds[0].transaction_ref, reason='Duplicate', stdout=out)
+        call_command('reverse_outbounds', unit=self.north.pk, stdout=out)
+
+        self.assertEqual(out.getvalue(), 'Reversed 1 outbounds.\nReversed 1 outbounds.\n')
+        self.assertEqual(list(Outbound.objects.all()), [outbounds[2]])
+        self.assertEqual(Stock.objects.get(pk=self.plain.pk).quantity, 98)
+        with self.assertRaises(CommandError):
+            call_command('reverse_outbounds', stdout=out)
+
+
+class DailyOutflowTests(TestCase):
+
+    def setUp(self):
+        self.stocks = make_stocks(3)
+        self.units = Unit.objects.bulk_create([Unit(name='North'), Unit(name='South')])
+
+    def rollup(self):
+        return sorted(DailyStockOutflow.objects.values_list('date', 'stock_id', 'unit_id', 'quantity', 'txn_count'))
+
+    def test_write_paths_keep_the_rollup_exact(self):
+        first = Outbound(unit=self.units[0])
+        issue_outbound(first, [(self.stocks[0], 5), (self.stocks[1], 2), (self.stocks[0], 1)])
+        second = Outbound(unit=self.units[0])
+        issue_outbound(second, [(self.stocks[0], 3)])
+        today = first.outbound_date.date()
+        self.assertIn((today, self.stocks[0].pk, self.units[0].pk, 9, 2), self.rollup())
+
+        items = list(first.outbounditem_set.order_by('pk'))
+        items[0].quantity = 4
+        reconcile_outbound_items(first, created=[OutboundItem(stock=self.stocks[2], quantity=7)],
+                                 changed=[items[0]], deleted=[items[2]])
+        items[1].delete()
+        second.outbound_date -= timedelta(days=1)
+        second.unit = self.units[1]
+        second.save()
+        third = Outbound()
+        issue_outbound(third, [(self.stocks[1], 1)])
+        Outbound.objects.filter(pk=third.pk).delete()
+        self.units[1].delete()
+        incremental = self.rollup()
+
+        call_command('backfill_outflow', days_per_batch=1, stdout=StringIO())
+        self.assertEqual(incremental, self.rollup())
+        self.assertEqual(incremental, [
+            (today - timedelta(days=1), self.stocks[0].pk, None, 3, 1),
+            (today, self.stocks[0].pk, self.units[0].pk, 4, 1),
+            (today, self.stocks[2].pk, self.units[0].pk, 7, 1),
+        ])
+
+    def test_dashboard_reads_only_the_rollup(self):
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        issue_outbound(Outbound(unit=self.units[0]), [(self.stocks[0], 5), (self.stocks[1], 2)])
+        self.client.get(reverse('admin:outbound_outbound_dashboard'))  # warm the unit cache
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:outbound_outbound_dashboard'), {'days': 365})
+
+        self.assertContains(response, '7 issued in the last 365 days')
+        self.assertEqual(response.context['summary']['top_stocks'][0]['stock__stock_no'], 'STK-00000')
+        self.assertEqual(len(response.context['summary']['days']), 365)
+        self.assertFalse([query for query in queries if 'outbound_outbounditem' in query['sql']])
+
+
+class ForecastTests(TestCase):
+
+    def test_reorder_points_follow_daily_demand(self):
+        stock, idle = make_stocks(2, quantity=10)
+        stock.lead_time_days = 4
+        stock.save()
+        north, south = Unit.objects.bulk_create([Unit(name='North'), Unit(name='South')])
+        today = timezone.localdate()
+        # Daily totals over the last four days: 4, 0, 4 (split over two units), 4.
+        DailyStockOutflow.objects.bulk_create([
+            DailyStockOutflow(date=today - timedelta(days=3), stock=stock, unit=north, quantity=4, txn_count=1),
+            DailyStockOutflow(date=today - timedelta(days=1), stock=stock, unit=north, quantity=2, txn_count=1),
+            DailyStockOutflow(date=today - timedelta(days=1), stock=stock, unit=south, quantity=2, txn_count=1),
+            DailyStockOutflow(date=today, stock=stock, unit=None, quantity=4, txn_count=1),
+            DailyStockOutflow(date=today - timedelta(days=4), stock=idle, unit=None, quantity=9, txn_count=1),
+        ])
+        Stock.objects.filter(pk=idle.pk).update(daily_demand=1.5)  # from an earlier forecast
+        changed = []
+        stocks_changed.connect(lambda sender, stock_ids, **kwargs: changed.extend(stock_ids),
+                               dispatch_uid='test_forecast', weak=False)
+        self.addCleanup(stocks_changed.disconnect, dispatch_uid='test_forecast')
+
+        call_command('forecast_demand', days=4, update_reorder_points=True, stdout=StringIO())
+
+        stock.refresh_from_db()
+        # mean 3/day, standard deviation sqrt(3): 1.65 * 1.73 * sqrt(4) rounds up to 6.
+        self.assertEqual((stock.daily_demand, stock.safety_stock, stock.reorder_point), (3.0, 6, 18))
+        self.assertTrue(stock.below_reorder)
+        idle.refresh_from_db()
+        self.assertEqual((idle.daily_demand, idle.reorder_point, idle.below_reorder), (0.0, None, False))
+        self.assertEqual(idle.version, 2)
+        self.assertCountEqual(changed, [stock.pk, idle.pk])
+
+        # A second run with the same figures writes nothing.
+        version, changed[:] = stock.version, []
+        call_command('forecast_demand', days=4, update_reorder_points=True, stdout=StringIO())
+        stock.refresh_from_db()
+        self.assertEqual((stock.version, changed), (version, []))
+
+
+class OutboundAdminSaveTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+
+    def post_outbound(self, lines, outbound=None, initial=0, unit=''):
+        data = {
+            'outbound_date_0': '2024-08-01',
+            'outbound_date_1': '10:00:00',
+            'processed_by': self.user.pk,
+            'unit': unit,
+            'outbounditem_set-TOTAL_FORMS': len(lines),
+            'outbounditem_set-INITIAL_FORMS': initial,
+            'outbounditem_set-MIN_NUM_FORMS': 0,
+            'outbounditem_set-MAX_NUM_FORMS': 1000,
+        }
+        for index, line in enumerate(lines):
+            for field, value in line.items():
+                data[f'outbounditem_set-{index}-{field}'] = value
+        if outbound is None:
+            url = reverse('admin:outbound_outbound_add')
+        else:
+            url = reverse('admin:outbound_outbound_change', args=[outbound.pk])
+        return self.client.post(url, data)
+
+    def test_add_deducts_stock_once(self):
+        stocks = make_stocks(2)
+
+        response = self.post_outbound([
+            {'stock': stocks[0].pk, 'quantity': 7},
+            {'stock': stocks[1].pk, 'quantity': 3},
+        ])
+
+        self.assertEqual(response.status_code, 302)
+        quantities = dict(Stock.objects.values_list('pk', 'quantity'))
+        self.assertEqual(quantities, {stocks[0].pk: 93, stocks[1].pk: 97})
+
+    def test_change_applies_only_the_net_delta(self):
+        stocks = make_stocks(3)
+        outbound = Outbound.objects.create(processed_by=self.user)
+        kept, moved, removed = issue_outbound(outbound, [(stocks[0], 10), (stocks[1], 10), (stocks[2], 10)])
+
+        response = self.post_outbound([
+            {'id': kept.pk, 'outbound': outbound.pk, 'stock': stocks[0].pk, 'quantity': 4},
+            {'id': moved.pk, 'outbound': outbound.pk, 'stock': stocks[0].pk, 'quantity': 10},
+            {'id': removed.pk, 'outbound': outbound.pk, 'stock': stocks[2].pk, 'quantity': 10, 'DELETE': 'on'},
+        ], outbound=outbound, initial=3)
+
+        self.assertEqual(response.status_code, 302)
+        quantities = dict(Stock.objects.values_list('pk', 'quantity'))
+        self.assertEqual(quantities, {stocks[0].pk: 86, stocks[1].pk: 100, stocks[2].pk: 100})
+        self.assertEqual(outbound.outbounditem_set.count(), 2)
+        outbound.refresh_from_db()
+        self.assertEqual((outbound.total_quantity, outbound.line_count), (14, 2))
+
+    def test_shortfall_is_reported_on_the_form(self):
+        stock = make_stocks(1, quantity=5)[0]
+
+        response = self.post_outbound([{'stock': stock.pk, 'quantity': 6}])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Not enough stock for: STK-00000.')
+        stock.refresh_from_db()
+        self.assertEqual(stock.quantity, 5)
+
+    def test_shortfall_at_the_unit_is_reported_on_the_form(self):
+        stock = make_stocks(1, quantity=50)[0]
+        north, south = Unit.objects.create(name='North'), Unit.objects.create(name='South')
+        transfer_stock([(stock, 10)], to_unit=north)
+
+        response = self.post_outbound([{'stock': stock.pk, 'quantity': 1}], unit=south.pk)
+
+        self.assertContains(response, 'Not enough stock at South for: STK-00000.')
+        self.assertEqual(self.post_outbound([{'stock': stock.pk, 'quantity': 10}], unit=north.pk).status_code, 302)
+        self.assertEqual(StockLocation.objects.get(stock=stock, unit=north).quantity, 0)
+
+    def test_unit_change_that_cannot_be_moved_is_reported_on_the_form(self):
+        stock = make_stocks(1, quantity=50)[0]
+        north, south = Unit.objects.create(name='North'), Unit.objects.create(name='South')
+        transfer_stock([(stock, 10)], to_unit=north)
+        self.post_outbound([{'stock': stock.pk, 'quantity': 10}], unit=north.pk)
+        outbound = Outbound.objects.get()
+        [line] = [{'id': item.pk, 'outbound': outbound.pk, 'stock': stock.pk, 'quantity': 10}
+                  for item in outbound.outbounditem_set.all()]
+
+        response = self.post_outbound([line], outbound=outbound, initial=1, unit=south.pk)
+
+        self.assertContains(response, 'Not enough stock at South for: STK-00000.')
+        self.assertEqual(self.post_outbound([line], outbound=outbound, initial=1).status_code, 302)
+        self.assertEqual(StockLocation.objects.get(stock=stock, unit=north).quantity, 10)
+
+    def test_save_query_count_does_not_grow_with_lines(self):
+        stocks = make_stocks(40)
+        # Warm up per-process caches (content types for the admin log).
+        self.post_outbound([{'stock': stocks[0].pk, 'quantity': 1}])
+
+        with CaptureQueriesContext(connection) as small:
+            self.post_outbound([{'stock': stock.pk, 'quantity': 1} for stock in stocks[:2]])
+        with CaptureQueriesContext(connection) as large:
+            self.post_outbound([{'stock': stock.pk, 'quantity': 1} for stock in stocks])
+
+        self.assertEqual(len(small), len(large))
+
+
+class OutboundExportTests(TestCase):
+
+    def setUp(self):
+        self.stocks = make_stocks(3)
+        self.user = User.objects.create_user('clerk')
+        self.unit = Unit.objects.create(name='Store 1')
+
+    def make_outbounds(self, count):
+        for _ in range(count):
+            outbound = Outbound.objects.create(processed_by=self.user, unit=self.unit)
+            issue_outbound(outbound, [(self.stocks[0], 1), (self.stocks[1], 2)])
+
+    def test_csv_rows(self):
+        self.make_outbounds(1)
+        outbound = Outbound.objects.get()
+
+        rows = list(iter_csv(Outbound.objects.all()))
+
+        self.assertEqual(len(rows), 2)
+        self.assertIn(f'{outbound.transaction_ref},', rows[1])
+        self.assertIn(',clerk,3,Store 1,"STK-00000 (1), STK-00001 (2)"', rows[1])
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.make_outbounds(20)
+
+        with self.assertNumQueries(2):
+            self.assertEqual(len(list(iter_csv(Outbound.objects.all()))), 21)
+
+    def test_export_command_writes_ndjson(self):
+        self.make_outbounds(2)
+        out = StringIO()
+
+        call_command('export_outbounds', format='ndjson', stdout=out)
+
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]['items'], [
+            {'stock_no': 'STK-00000', 'quantity': 1},
+            {'stock_no': 'STK-00001', 'quantity': 2},
+        ])
+
+
+class OutboundAdminQueryCountTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+        self.units = Unit.objects.bulk_create([Unit(name=f'Store {i}') for i in range(5)])
+        self.stocks = make_stocks(30)
+
+    def make_outbounds(self, count):
+        start = Outbound.objects.count()
+        outbounds = Outbound.objects.bulk_create([
+            Outbound(transaction_ref=f'REF{i:07d}', processed_by=self.user, unit=self.units[i % len(self.units)])
+            for i in range(start, start + count)
+        ])
+        OutboundItem.objects.bulk_create([
+            OutboundItem(outbound=outbound, stock=self.stocks[i % len(self.stocks)], quantity=1)
+            for i, outbound in enumerate(outbounds)
+        ])
+        return outbounds
+
+    def get_changelist(self):
+        response = self.client.get(reverse('admin:outbound_outbound_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_changelist_query_count_is_flat(self):
+        self.make_outbounds(10)
+        with self.assertNumQueries(4):
+            self.get_changelist()
+
+        self.make_outbounds(990)
+        with self.assertNumQueries(4):
+            self.get_changelist()
+
+    def test_keyset_pages_walk_forward_and_back(self):
+        self.make_outbounds(250)
+        expected = list(Outbound.objects.order_by('-outbound_date', '-id').values_list('transaction_ref', flat=True))
+
+        seen = []
+        response = self.get_changelist()
+        pages = [response]
+        while response.context['cl'].keyset_next_url:
+            seen.extend(obj.transaction_ref for obj in response.context['cl'].result_list)
+            response = self.client.get(reverse('admin:outbound_outbound_changelist') + response.context['cl'].keyset_next_url)
+            pages.append(response)
+        seen.extend(obj.transaction_ref for obj in response.context['cl'].result_list)
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(pages), 3)
+
+        back = self.client.get(reverse('admin:outbound_outbound_changelist') + pages[-1].context['cl'].keyset_previous_url)
+        self.assertEqual(
+            [obj.transaction_ref for obj in back.context['cl'].result_list],
+            [obj.transaction_ref for obj in pages[1].context['cl'].result_list],
+        )
+
+    def test_count_is_estimated_above_threshold(self):
+        self.make_outbounds(120)
+        with mock.patch.object(OutboundAdmin, 'estimate_count_above', 50):
+            response = self.get_changelist()
+
+        self.assertTrue(response.context['cl'].result_count_is_estimate)
+        self.assertContains(response, '~120 outbounds')
+
+    def test_filter_by_total_quantity(self):
+        small, large = self.make_outbounds(2)
+        Outbound.objects.filter(pk=large.pk).update(total_quantity=50)
+
+        response = self.client.get(reverse('admin:outbound_outbound_changelist'), {'total_quantity': '11-100'})
+
+        self.assertEqual([obj.pk for obj in response.context['cl'].result_list], [large.pk])
+
+    def test_change_form_query_count_is_flat(self):
+        small, large = Outbound.objects.create(processed_by=self.user), Outbound.objects.create(processed_by=self.user)
+        issue_outbound(small, [(stock, 1) for stock in self.stocks[:2]])
+        issue_outbound(large, [(stock, 1) for stock in self.stocks])
+        # Warm up per-process caches (content types for the history link).
+        self.client.get(reverse('admin:outbound_outbound_change', args=[small.pk]))
+
+        with CaptureQueriesContext(connection) as small_queries:
+            self.client.get(reverse('admin:outbound_outbound_change', args=[small.pk]))
+        with CaptureQueriesContext(connection) as large_queries:
+            response = self.client.get(reverse('admin:outbound_outbound_change', args=[large.pk]))
+
+        self.assertContains(response, 'STK-00029 (1)')
+        self.assertEqual(len(small_queries), len(large_queries))
+
+
+class OutboundAPITests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+        self.stocks = make_stocks(3)
+        self.unit = Unit.objects.create(name='Store 1')
+
+    def post_batch(self, payload):
+        return self.client.post(reverse('api-outbound-batch'), json.dumps(payload), content_type='application/json')
+
+    def test_batch_issues_every_outbound(self):
+        response = self.post_batch({'outbounds': [
+            {'unit': self.unit.pk, 'customer': 'ACME', 'lines': [
+                {'stock_no': 'STK-00000', 'quantity': 5}, {'stock': self.stocks[1].pk, 'quantity': 2},
+            ]},
+            {'lines': [{'stock_no': 'STK-00000', 'quantity': 1}]},
+        ]})
+
+        self.assertEqual(response.status_code, 201)
+        results = response.json()['results']
+        self.assertEqual([(row['total_quantity'], row['line_count']) for row in results], [(7, 2), (1, 1)])
+        self.assertEqual(Stock.objects.get(pk=self.stocks[0].pk).quantity, 94)
+        self.assertEqual(Outbound.objects.get(pk=results[0]['id']).processed_by, self.user)
+
+    def test_reserved_stock_is_confirmed_into_an_outbound(self):
+        response = self.client.post(reverse('api-reservation-create'), json.dumps({
+            'unit': self.unit.pk, 'lines': [{'stock_no': 'STK-00000', 'quantity': 60}],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        hold = response.json()['hold']
+        # Someone else can only issue what the hold leaves.
+        self.assertEqual(self.post_batch({'outbounds': [{'lines': [{'stock_no': 'STK-00000', 'quantity': 41}]}]})
+                         .status_code, 409)
+
+        confirmed = self.client.post(reverse('api-reservation-confirm', args=[hold]), json.dumps({'customer': 'ACME'}),
+                                     content_type='application/json')
+
+        self.assertEqual(confirmed.status_code, 201)
+        outbound = Outbound.objects.get(pk=confirmed.json()['id'])
+        self.assertEqual((outbound.unit, outbound.customer, outbound.total_quantity), (self.unit, 'ACME', 60))
+        self.assertEqual(Stock.objects.get(pk=self.stocks[0].pk).quantity, 40)
+        self.assertFalse(StockReservation.objects.exists())
+        again = self.client.post(reverse('api-reservation-confirm', args=[hold]), '{}', content_type='application/json')
+        self.assertEqual(again.status_code, 404)
+
+    def test_batch_is_all_or_nothing(self):
+        response = self.post_batch({'outbounds': [
+            {'lines': [{'stock_no': 'STK-00000', 'quantity': 5}]},
+            {'lines': [{'stock_no': 'STK-00001', 'quantity': 101}]},
+        ]})
+
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Outbound.objects.exists())
+        self.assertEqual(set(Stock.objects.values_list('quantity', flat=True)), {100})
+
+    def test_batch_reports_every_invalid_line(self):
+        response = self.post_batch({'outbounds': [
+            {'unit': 999, 'lines': [{'stock_no': 'NOPE', 'quantity': 1}, {'stock': self.stocks[0].pk, 'quantity': 0}]},
+        ]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {
+            'outbounds[0].unit', 'outbounds[0].lines[0].stock_no', 'outbounds[0].lines[1].quantity',
+        })
+        self.assertEqual(self.client.get(reverse('api-outbound-batch')).status_code, 405)
+
+    def test_list_with_items_query_count_is_flat(self):
+        for _ in range(3):
+            issue_outbound(Outbound(unit=self.unit), [(self.stocks[0], 1), (self.stocks[1], 2)])
+        url = reverse('api-outbound-list')
+
+        with self.assertNumQueries(4):  # session, user, page, items
+            page = self.client.get(url, {'limit': 2, 'fields': 'transaction_ref,unit_name,items'}).json()
+        rest = self.client.get(page['next']).json()
+
+        self.assertEqual(page['results'][0]['unit_name'], 'Store 1')
+        self.assertEqual(page['results'][0]['items'][1], {'stock': self.stocks[1].pk, 'stock_no': 'STK-00001', 'quantity': 2})
+        self.assertEqual(len(rest['results']), 1)
+        self.assertIsNone(rest['next'])
+
+    async def test_async_history_is_newest_first_with_a_count(self):
+        outbounds = []
+        for _ in range(3):
+            outbound = Outbound(unit=self.unit, processed_by=self.user)
+            await sync_to_async(issue_outbound)(outbound, [(self.stocks[0], 1)])
+            outbounds.append(outbound)
+        await self.async_client.aforce_login(self.user)
+        url = reverse('api-outbound-history')
+
+        page = (await self.async_client.get(url, {'limit': 2, 'fields': 'transaction_ref', 'processed_by': 'admin'})).json()
+        rest = (await self.async_client.get(page['next'])).json()
+
+        self.assertEqual(page['count'], 3)
+        self.assertEqual(
+            [row['transaction_ref'] for row in page['results'] + rest['results']],
+            [outbound.transaction_ref for outbound in reversed(outbounds)],
+        )
+        self.assertNotIn('outbound_date', page['results'][0])
+
+    def test_middleware_stack_is_async_capable(self):
+        # A sync-only middleware would put every async view back on a thread.
+        for path in settings.MIDDLEWARE:
+            self.assertTrue(getattr(import_string(path), 'async_capable', True), path)
+
+
+class LoadTestHarnessTests(LiveServerTestCase):
+
+    def test_reports_throughput_and_latency(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        make_stocks(1)
+        out = StringIO()
+
+        call_command('load_test', target=[f'live={self.live_server_url}'], duration=0.3, warmup=0,
+                     concurrency=2, user='admin', password='password', stdout=out)
+
+        name, requests, rps, p50, p99, errors = out.getvalue().splitlines()[1].split()
+        self.assertEqual(name, 'live')
+        self.assertGreater(int(requests), 0)
+        self.assertEqual(int(errors), 0)
+
+
+class DatabaseConfigTests(TransactionTestCase):
+
+    def test_sqlite_connections_are_tuned(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            Unit.objects.count()
+        self.assertEqual(queries[0]['sql'], 'BEGIN DEFERRED')
+        with CaptureQueriesContext(connection) as queries, write_atomic():
+            Unit.objects.create(name='Unit')
+        self.assertEqual(queries[0]['sql'], 'BEGIN IMMEDIATE')
+
+    def test_admin_saves_take_the_write_lock(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        stock = make_stocks(1)[0]
+        url = reverse('admin:stocks_stock_change', args=[stock.pk])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {
+                'stock_no': stock.stock_no, 'unit': 'pcs', 'description': 'Edited', 'quantity': 100,
+                'safety_stock': 0, 'lead_time_days': 7, 'unit_cost': 0, 'loaded_version': stock.version,
+                'last_modified_date_0': '2024-01-01', 'last_modified_date_1': '00:00:00',
+                'locations-TOTAL_FORMS': 0, 'locations-INITIAL_FORMS': 0,
+            })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Stock.objects.get(pk=stock.pk).description, 'Edited')
+        self.assertEqual([query['sql'] for query in queries if query['sql'].startswith('BEGIN')], ['BEGIN IMMEDIATE'])
+
+    def test_replica_router_keeps_transactions_on_the_primary(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Stock), REPLICA_DB_ALIAS)
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Stock), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_write(Stock), DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate(REPLICA_DB_ALIAS, 'stocks'))
+
+    def test_write_benchmark_reports_throughput(self):
+        out = StringIO()
+        # One writer: the in-memory test database uses SQLite's shared cache,
+        # which reports lock conflicts at once instead of waiting them out.
+        call_command('benchmark_writes', seed=True, stocks=10, writers=1, duration=0.3, stdout=out)
+        self.assertRegex(out.getvalue(), r'sqlite, 1 writers: [\d.]+ outbounds/s, .*, 0 failed')
+        self.assertTrue(Outbound.objects.exists())
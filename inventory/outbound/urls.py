@@ -0,0 +1,22 @@
+from django.urls import path
+
+from outbound import views as outbound_views
+from profiles import views as profile_views
+from stocks import views as stock_views
+
+# JSON API; outbound.urls is the URLconf the project mounts at the site root.
+# Lookup, availability and history are async views for polling clients.
+urlpatterns = [
+    path('api/stocks/', stock_views.stock_list, name='api-stock-list'),
+    path('api/stocks/lookup/', stock_views.stock_lookup, name='api-stock-lookup'),
+    path('api/stocks/availability/', stock_views.stock_availability, name='api-stock-availability'),
+    path('api/stocks/<int:pk>/', stock_views.stock_detail, name='api-stock-detail'),
+    path('api/reservations/', stock_views.reservation_create, name='api-reservation-create'),
+    path('api/reservations/<str:hold>/', stock_views.reservation_release, name='api-reservation-release'),
+    path('api/reservations/<str:hold>/confirm/', outbound_views.reservation_confirm, name='api-reservation-confirm'),
+    path('api/units/', profile_views.unit_list, name='api-unit-list'),
+    path('api/outbounds/', outbound_views.outbound_list, name='api-outbound-list'),
+    path('api/outbounds/batch/', outbound_views.outbound_batch, name='api-outbound-batch'),
+    path('api/outbounds/history/', outbound_views.outbound_history, name='api-outbound-history'),
+    path('api/outbounds/<int:pk>/', outbound_views.outbound_detail, name='api-outbound-detail'),
+]
@@ -1,3 +1,243 @@
-from django.shortcuts import render
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-# Create your views here.
+from inventory.api import APIError, CursorPage, afetch_values, api_view, fetch_values, read_json, select_fields
+from inventory.transactions import write_atomic
+from profiles.models import Unit
+from stocks.models import Stock
+from stocks.reservations import HoldNotFound
+from stocks.services import InsufficientStock
+from .models import Outbound, OutboundItem
+from .services import confirm_hold, issue_outbound
+
+# API field name -> ORM path; 'items' is read separately.
+OUTBOUND_FIELDS = {
+    'id': 'id',
+    'transaction_ref': 'transaction_ref',
+    'customer': 'customer',
+    'outbound_date': 'outbound_date',
+    'unit': 'unit_id',
+    'unit_name': 'unit__name',
+    'processed_by': 'processed_by__username',
+    'total_quantity': 'total_quantity',
+    'line_count': 'line_count',
+}
+AVAILABLE_FIELDS = (*OUTBOUND_FIELDS, 'items')
+
+# Upper bound on the lines of one batch request, across all its outbounds.
+MAX_BATCH_LINES = 10000
+
+# History counts stop here, like the admin changelist's estimate threshold.
+HISTORY_COUNT_LIMIT = 10000
+
+
+def parse_date_param(request, name):
+    value = parse_datetime(request.GET[name])
+    if value is None:
+        raise APIError(f'{name} must be an ISO 8601 date and time.')
+    return value
+
+
+def filter_outbounds(request):
+    queryset = Outbound.objects.all()
+    if request.GET.get('unit'):
+        if not request.GET['unit'].isdigit():
+            raise APIError('unit must be a unit id.')
+        queryset = queryset.filter(unit_id=request.GET['unit'])
+    if request.GET.get('since'):
+        queryset = queryset.filter(outbound_date__gte=parse_date_param(request, 'since'))
+    if request.GET.get('until'):
+        queryset = queryset.filter(outbound_date__lt=parse_date_param(request, 'until'))
+    return queryset
+
+
+def filter_history(request):
+    queryset = filter_outbounds(request)
+    if request.GET.get('processed_by'):
+        queryset = queryset.filter(processed_by__username=request.GET['processed_by'])
+    return queryset
+
+
+def attach_items(rows):
+    """Add every row's lines under 'items', with one query for the whole page."""
+    items = {row['id']: [] for row in rows}
+    lines = (
+        OutboundItem.objects.filter(outbound_id__in=items)
+        .order_by('pk')
+        .values_list('outbound_id', 'stock_id', 'stock__stock_no', 'quantity')
+    )
+    for outbound_id, stock_id, stock_no, quantity in lines:
+        items[outbound_id].append({'stock': stock_id, 'stock_no': stock_no, 'quantity': quantity})
+    for row in rows:
+        row['items'] = items[row['id']]
+    return rows
+
+
+@api_view(permission='outbound.view_outbound')
+def outbound_list(request):
+    fields = select_fields(request, AVAILABLE_FIELDS)
+    page = CursorPage(request, filter_outbounds(request))
+    rows = fetch_values(page.queryset, fields, OUTBOUND_FIELDS)
+    if 'items' in fields:
+        attach_items(rows[:page.limit])
+    return JsonResponse(page.paginate(rows))
+
+
+@api_view(permission='outbound.view_outbound')
+async def outbound_history(request):
+    """
+    Newest-first outbound history for dashboards, filtered like the list plus
+    ``?processed_by=<username>``, with a count capped at HISTORY_COUNT_LIMIT.
+    """
+    fields = select_fields(request, OUTBOUND_FIELDS)
+    queryset = filter_history(request)
+    page = CursorPage(request, queryset, ordering=('-outbound_date', '-id'))
+    rows = await afetch_values(page.queryset, list(dict.fromkeys([*fields, 'outbound_date'])), OUTBOUND_FIELDS)
+    count = await queryset[:HISTORY_COUNT_LIMIT + 1].acount()
+    body = page.paginate(rows)
+    if 'outbound_date' not in fields:
+        for row in body['results']:
+            del row['outbound_date']
+    return JsonResponse({'count': min(count, HISTORY_COUNT_LIMIT), 'count_capped': count > HISTORY_COUNT_LIMIT, **body})
+
+
+@api_view(permission='outbound.view_outbound')
+def outbound_detail(request, pk):
+    fields = select_fields(request, AVAILABLE_FIELDS)
+    rows = fetch_values(Outbound.objects.filter(pk=pk), fields, OUTBOUND_FIELDS)
+    if not rows:
+        raise APIError('Outbound not found.', 404)
+    if 'items' in fields:
+        attach_items(rows)
+    return JsonResponse(rows[0])
+
+
+def parse_batch(payload):
+    """
+    Check a batch request and resolve its stocks and units with one query
+    each. Returns ``[(outbound, lines)]`` or raises APIError listing every
+    problem found.
+    """
+    specs = payload.get('outbounds') if isinstance(payload, dict) else None
+    if not isinstance(specs, list) or not specs:
+        raise APIError('Expected {"outbounds": [...]} with at least one outbound.')
+
+    errors = {}
+    stock_nos, unit_ids, line_total = set(), set(), 0
+    for index, spec in enumerate(specs):
+        lines = spec.get('lines') if isinstance(spec, dict) else None
+        if not isinstance(lines, list) or not lines:
+            errors[f'outbounds[{index}]'] = 'Each outbound needs a non-empty "lines" list.'
+            continue
+        line_total += len(lines)
+        if spec.get('unit') is not None:
+            unit_ids.add(spec['unit'])
+        for line in lines:
+            if isinstance(line, dict) and isinstance(line.get('stock_no'), str):
+                stock_nos.add(line['stock_no'])
+    if line_total > MAX_BATCH_LINES:
+        raise APIError(f'A batch may hold at most {MAX_BATCH_LINES} lines.')
+    if errors:
+        raise APIError('Invalid batch.', errors=errors)
+
+    stock_pks = dict(Stock.objects.filter(stock_no__in=stock_nos).values_list('stock_no', 'pk'))
+    known_units = set(Unit.objects.filter(pk__in=[pk for pk in unit_ids if isinstance(pk, int)]).values_list('pk', flat=True))
+
+    outbounds = []
+    for index, spec in enumerate(specs):
+        where = f'outbounds[{index}]'
+        customer = spec.get('customer') or ''
+        max_length = Outbound._meta.get_field('customer').max_length
+        if not isinstance(customer, str) or len(customer) > max_length:
+            errors[f'{where}.customer'] = f'customer must be a string of at most {max_length} characters.'
+        unit = spec.get('unit')
+        if unit is not None and unit not in known_units:
+            errors[f'{where}.unit'] = f'Unknown unit {unit!r}.'
+        outbound_date = timezone.now()
+        if spec.get('outbound_date'):
+            outbound_date = parse_datetime(str(spec['outbound_date']))
+            if outbound_date is None:
+                errors[f'{where}.outbound_date'] = 'outbound_date must be an ISO 8601 date and time.'
+            elif timezone.is_naive(outbound_date):
+                outbound_date = timezone.make_aware(outbound_date)
+
+        lines = []
+        for number, line in enumerate(spec['lines']):
+            at = f'{where}.lines[{number}]'
+            if not isinstance(line, dict):
+                errors[at] = 'Each line must be an object.'
+                continue
+            if 'stock_no' in line:
+                stock = stock_pks.get(line['stock_no'])
+                if stock is None:
+                    errors[f'{at}.stock_no'] = f"Unknown stock_no {line['stock_no']!r}."
+            else:
+                stock = line.get('stock')
+                if not isinstance(stock, int):
+                    errors[f'{at}.stock'] = 'Give the stock id as "stock" or its number as "stock_no".'
+            quantity = line.get('quantity')
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+                errors[f'{at}.quantity'] = 'quantity must be a whole number greater than zero.'
+            lines.append((stock, quantity))
+
+        outbounds.append((Outbound(customer=customer, unit_id=unit, outbound_date=outbound_date), lines))
+
+    if errors:
+        raise APIError('Invalid batch.', errors=errors)
+    return outbounds
+
+
+@api_view(methods=('POST',), permission='outbound.add_outbound')
+def outbound_batch(request):
+    """
+    Issue every outbound in the request body in one transaction: either all
+    of them are recorded and deducted, or none is.
+    """
+    outbounds = parse_batch(read_json(request))
+    try:
+        with write_atomic():
+            for outbound, lines in outbounds:
+                outbound.processed_by = request.user
+                issue_outbound(outbound, lines)
+    except InsufficientStock as error:
+        raise APIError(str(error), 409)
+    except Stock.DoesNotExist as error:
+        raise APIError(str(error), 400)
+
+    return JsonResponse({
+        'results': [
+            {
+                'id': outbound.pk,
+                'transaction_ref': outbound.transaction_ref,
+                'total_quantity': outbound.total_quantity,
+                'line_count': outbound.line_count,
+            }
+            for outbound, lines in outbounds
+        ],
+    }, status=201)
+
+
+@api_view(methods=('POST',), permission='outbound.add_outbound')
+def reservation_confirm(request, hold):
+    """Issue the stock held under ``hold`` as a new outbound; the body may give a ``customer``."""
+    payload = read_json(request) if request.body else {}
+    customer = (payload.get('customer') or '') if isinstance(payload, dict) else None
+    max_length = Outbound._meta.get_field('customer').max_length
+    if not isinstance(customer, str) or len(customer) > max_length:
+        raise APIError(f'customer must be a string of at most {max_length} characters.')
+
+    outbound = Outbound(customer=customer, processed_by=request.user)
+    try:
+        confirm_hold(outbound, hold)
+    except HoldNotFound:
+        raise APIError('Reservation not found.', 404)
+    except InsufficientStock as error:
+        raise APIError(str(error), 409)
+    return JsonResponse({
+        'id': outbound.pk,
+        'transaction_ref': outbound.transaction_ref,
+        'unit': outbound.unit_id,
+        'total_quantity': outbound.total_quantity,
+        'line_count': outbound.line_count,
+    }, status=201)
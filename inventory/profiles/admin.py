@@ -1,4 +1,5 @@
 from django.contrib import admin
+from search.backends import IndexedSearchMixin
 from .models import Profile, Unit
 
 
@@ -7,10 +8,10 @@ class ProfileAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'birth_date')  # Fields to search in the admin interface
 
 
-class UnitAdmin(admin.ModelAdmin):
+class UnitAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'description')  # Adjust based on the fields you want to display
     search_fields = ('name', 'description')  # Fields to search in the admin interface
 
 
 admin.site.register(Profile)
-admin.site.register(Unit)
+admin.site.register(Unit, UnitAdmin)
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import User
 
+from caching.querysets import CachedQuerySet
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(blank=True)
@@ -14,6 +16,9 @@ class Profile(models.Model):
 class Unit(models.Model):
     name = models.CharField(max_length=50, blank=False, null=True)
     description = models.TextField(blank=True, null=True)
+
+    objects = CachedQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
@@ -1,3 +1,25 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from caching import store as cache_store
+from .models import Unit
+
+
+class UnitAPITests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        cache_store.clear()
+
+    def test_list_is_served_from_the_cache(self):
+        Unit.objects.create(name='Store 1', description='Main')
+        url = reverse('api-unit-list')
+        response = self.client.get(url, {'fields': 'name'})
+        self.assertEqual(response.json()['results'], [{'id': Unit.objects.get().pk, 'name': 'Store 1'}])
+
+        with self.assertNumQueries(2):  # session, user
+            self.assertEqual(self.client.get(url, {'fields': 'name'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        Unit.objects.create(name='Store 2')
+        self.assertEqual(len(self.client.get(url).json()['results']), 2)
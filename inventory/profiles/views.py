@@ -1,3 +1,17 @@
-from django.shortcuts import render
+from django.http import JsonResponse
 
-# Create your views here.
+from caching.store import cached_queryset
+from inventory.api import CursorPage, api_view, make_etag, not_modified, select_fields, set_validators
+from .models import Unit
+
+UNIT_FIELDS = ('id', 'name', 'description')
+
+
+@api_view(permission='profiles.view_unit')
+def unit_list(request):
+    fields = select_fields(request, UNIT_FIELDS)
+    page = CursorPage(request, Unit.objects.all())
+    # Units rarely change: the page itself comes from the cache, and so does its ETag.
+    rows = [dict(zip(fields, row)) for row in cached_queryset(page.queryset.values_list(*fields))]
+    etag = make_etag(rows)
+    return not_modified(request, etag) or set_validators(JsonResponse(page.paginate(rows)), etag)
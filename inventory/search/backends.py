@@ -0,0 +1,169 @@
+"""
+Indexed replacements for the admin's ``icontains`` search.
+
+SQLite gets an FTS5 table per model using the trigram tokenizer, which matches
+substrings the same way ``icontains`` does but through an index; the tables are
+kept current by the signals in ``search.signals``. PostgreSQL keeps searching
+the real columns and gets ``pg_trgm`` GIN indexes so ``ILIKE '%x%'`` stops
+scanning, with trigram similarity used for ranking. Other databases, and terms
+too short for trigrams, fall back to the stock admin search.
+"""
+import sqlite3
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.text import smart_split, unescape_string_literal
+
+from .indexes import SEARCH_INDEXES, get_index
+
+MIN_TERM_LENGTH = 3  # shorter terms have no trigrams to look up
+
+
+def split_terms(search_term):
+    terms = []
+    for bit in smart_split(search_term):
+        if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+            bit = unescape_string_literal(bit)
+        if bit:
+            terms.append(bit)
+    return terms
+
+
+class SQLiteFTSBackend:
+    vendor = 'sqlite'
+
+    @staticmethod
+    def is_available():
+        return sqlite3.sqlite_version_info >= (3, 34, 0)
+
+    def install(self, connection, index):
+        columns = ', '.join(index.columns)
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {index.table} USING fts5({columns}, tokenize='trigram')")
+        self.rebuild(connection, index)
+
+    def rebuild(self, connection, index):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {index.table}')
+        self.sync(connection, index)
+
+    def sync(self, connection, index, queryset=None):
+        """Re-copy the rows of ``queryset`` (default: all) into the index table."""
+        source_sql, source_params = index.source(queryset).query.sql_with_params()
+        with connection.cursor() as cursor:
+            if queryset is not None:
+                pk_sql, pk_params = queryset.order_by().values('pk').query.sql_with_params()
+                cursor.execute(f'DELETE FROM {index.table} WHERE rowid IN ({pk_sql})', pk_params)
+            cursor.execute(f"INSERT INTO {index.table}(rowid, {', '.join(index.columns)}) {source_sql}", source_params)
+
+    def remove(self, connection, index, pk):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {index.table} WHERE rowid = %s', [pk])
+
+    def search(self, queryset, index, terms):
+        # The index table is joined in, unbounded, so the changelist's own
+        # filters and pagination see every hit; its rank (lower is better)
+        # orders them.
+        match = ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+        quote = connections[queryset.db].ops.quote_name
+        pk = f'{quote(queryset.model._meta.db_table)}.{quote(queryset.model._meta.pk.column)}'
+        return queryset.extra(
+            select={'search_rank': f'{index.table}.rank'},
+            tables=[index.table],
+            where=[f'{index.table}.rowid = {pk}', f'{index.table} MATCH %s'],
+            params=[match],
+        ).order_by('search_rank')
+
+
+class PostgresTrigramBackend:
+    vendor = 'postgresql'
+
+    @staticmethod
+    def is_available():
+        return True
+
+    def install(self, connection, index):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            for table, column in index.column_targets():
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+                )
+
+    def rebuild(self, connection, index):
+        pass  # the GIN indexes are maintained by PostgreSQL itself
+
+    def sync(self, connection, index, queryset=None):
+        pass
+
+    def remove(self, connection, index, pk):
+        pass
+
+    def search(self, queryset, index, terms):
+        from django.contrib.postgres.search import TrigramWordSimilarity
+        from django.db.models.functions import Greatest
+
+        condition = Q()
+        for term in terms:
+            or_queries = Q()
+            for field in index.fields:
+                or_queries |= Q(**{f'{field}__icontains': term})
+            condition &= or_queries
+        term = ' '.join(terms)
+        similarities = [TrigramWordSimilarity(term, field) for field in index.fields]
+        rank = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+        return queryset.filter(condition).annotate(search_rank=rank).order_by('-search_rank')
+
+
+BACKENDS = [SQLiteFTSBackend(), PostgresTrigramBackend()]
+
+
+def get_backend(connection):
+    for backend in BACKENDS:
+        if backend.vendor == connection.vendor and backend.is_available():
+            return backend
+    return None
+
+
+def install_all(connection):
+    backend = get_backend(connection)
+    if backend is not None:
+        for index in SEARCH_INDEXES:
+            backend.install(connection, index)
+
+
+def reindex(queryset):
+    """
+    Re-copy the rows of ``queryset`` into its model's index. For bulk writes,
+    which send no post_save for search.signals to act on.
+    """
+    index = get_index(queryset.model)
+    connection = connections[queryset.db]
+    backend = get_backend(connection)
+    if index is not None and backend is not None:
+        backend.sync(connection, index, queryset)
+
+
+def search(queryset, search_term):
+    """
+    Return ``queryset`` narrowed to ``search_term`` and ordered by relevance,
+    or None when no indexed search applies.
+    """
+    index = get_index(queryset.model)
+    backend = get_backend(connections[queryset.db])
+    terms = split_terms(search_term)
+    if index is None or backend is None or not terms:
+        return None
+    if any(len(term) < MIN_TERM_LENGTH for term in terms):
+        return None
+    return backend.search(queryset, index, terms)
+
+
+class IndexedSearchMixin:
+    """ModelAdmin mixin that answers the changelist search box from the search index."""
+
+    def get_search_results(self, request, queryset, search_term):
+        results = search(queryset, search_term)
+        if results is None:
+            return super().get_search_results(request, queryset, search_term)
+        return results, False
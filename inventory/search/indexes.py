@@ -0,0 +1,56 @@
+from django.apps import apps
+
+
+class SearchIndex:
+    """
+    The admin search fields of one model. ``related`` maps another model's
+    label to the lookup from this model to it, so edits there (a renamed user)
+    reach the rows that copy its values into the index.
+    """
+
+    def __init__(self, model_label, fields, related=None):
+        self.model_label = model_label
+        self.fields = tuple(fields)
+        self.related = dict(related or {})
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @property
+    def table(self):
+        return f'search_{self.model._meta.db_table}'
+
+    @property
+    def columns(self):
+        return [field.replace('__', '_') for field in self.fields]
+
+    def source(self, queryset=None):
+        """Rows to index as ``(pk, *fields)``, limited to ``queryset`` if given."""
+        if queryset is None:
+            queryset = self.model._default_manager.all()
+        return queryset.order_by().values_list('pk', *self.fields)
+
+    def column_targets(self):
+        """Yield ``(db_table, column)`` for every field, following joins."""
+        for path in self.fields:
+            model = self.model
+            *joins, name = path.split('__')
+            for join in joins:
+                model = model._meta.get_field(join).related_model
+            yield model._meta.db_table, model._meta.get_field(name).column
+
+
+SEARCH_INDEXES = [
+    SearchIndex('stocks.Stock', ('stock_no', 'name')),
+    SearchIndex('profiles.Unit', ('name', 'description')),
+    SearchIndex('outbound.Outbound', ('transaction_ref', 'processed_by__username'),
+                related={'auth.User': 'processed_by'}),
+]
+
+
+def get_index(model):
+    for index in SEARCH_INDEXES:
+        if index.model is model:
+            return index
+    return None
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from search.backends import get_backend
+from search.indexes import SEARCH_INDEXES
+
+
+class Command(BaseCommand):
+    help = 'Recreate the admin search indexes, e.g. after bulk loads that bypass model signals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        backend = get_backend(connection)
+        if backend is None:
+            raise CommandError(f'No search backend for the {connection.vendor} database.')
+
+        for index in SEARCH_INDEXES:
+            with transaction.atomic(using=options['database']):
+                backend.install(connection, index)
+            self.stdout.write(f'Rebuilt {index.table}')
@@ -0,0 +1,85 @@
+import sqlite3
+
+from django.db import migrations
+
+
+class RunSQLOn(migrations.RunSQL):
+    """RunSQL for one database vendor; nothing happens on the others."""
+
+    def __init__(self, vendor, *args, available=lambda: True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.vendor = vendor
+        self.available = available
+
+    def applies(self, schema_editor):
+        return schema_editor.connection.vendor == self.vendor and self.available()
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if self.applies(schema_editor):
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if self.applies(schema_editor):
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def fts5_trigram():
+    return sqlite3.sqlite_version_info >= (3, 34, 0)
+
+
+# The tables search.backends.SQLiteFTSBackend keeps, as search.indexes
+# defined them here; the rowid is the indexed row's pk.
+SQLITE_TABLES = [
+    (
+        "CREATE VIRTUAL TABLE search_stocks_stock USING fts5(stock_no, name, tokenize='trigram')",
+        'INSERT INTO search_stocks_stock(rowid, stock_no, name) SELECT id, stock_no, name FROM stocks_stock',
+        'DROP TABLE search_stocks_stock',
+    ),
+    (
+        "CREATE VIRTUAL TABLE search_profiles_unit USING fts5(name, description, tokenize='trigram')",
+        'INSERT INTO search_profiles_unit(rowid, name, description) SELECT id, name, description FROM profiles_unit',
+        'DROP TABLE search_profiles_unit',
+    ),
+    (
+        "CREATE VIRTUAL TABLE search_outbound_outbound "
+        "USING fts5(transaction_ref, processed_by_username, tokenize='trigram')",
+        'INSERT INTO search_outbound_outbound(rowid, transaction_ref, processed_by_username) '
+        'SELECT o.id, o.transaction_ref, u.username FROM outbound_outbound o '
+        'LEFT JOIN auth_user u ON u.id = o.processed_by_id',
+        'DROP TABLE search_outbound_outbound',
+    ),
+]
+
+# The pg_trgm indexes search.backends.PostgresTrigramBackend searches through.
+POSTGRES_INDEXES = [
+    ('stocks_stock', 'stock_no'),
+    ('stocks_stock', 'name'),
+    ('profiles_unit', 'name'),
+    ('profiles_unit', 'description'),
+    ('outbound_outbound', 'transaction_ref'),
+    ('auth_user', 'username'),
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('outbound', '0007_outbound_date_indexes'),
+        ('profiles', '0004_alter_unit_options'),
+        ('stocks', '0006_stock_no_unique_quantity_check'),
+    ]
+
+    operations = [
+        RunSQLOn('sqlite', [create, fill], reverse_sql=[drop], available=fts5_trigram)
+        for create, fill, drop in SQLITE_TABLES
+    ] + [
+        RunSQLOn('postgresql', 'CREATE EXTENSION IF NOT EXISTS pg_trgm', migrations.RunSQL.noop),
+    ] + [
+        RunSQLOn(
+            'postgresql',
+            f'CREATE INDEX {table}_{column}_trgm ON {table} USING gin ((UPPER({column}::text)) gin_trgm_ops)',
+            f'DROP INDEX {table}_{column}_trgm',
+        )
+        for table, column in POSTGRES_INDEXES
+    ]
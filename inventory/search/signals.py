@@ -0,0 +1,49 @@
+from django.apps import apps
+from django.db import connections
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .backends import get_backend
+from .indexes import SEARCH_INDEXES
+
+
+def connect_index(index):
+    def reindex(sender, instance, using, **kwargs):
+        backend = get_backend(connections[using])
+        if backend is not None:
+            backend.sync(connections[using], index, sender._default_manager.using(using).filter(pk=instance.pk))
+
+    def unindex(sender, instance, using, **kwargs):
+        backend = get_backend(connections[using])
+        if backend is not None:
+            backend.remove(connections[using], index, instance.pk)
+
+    post_save.connect(reindex, sender=index.model, weak=False, dispatch_uid=f'search_reindex_{index.table}')
+    post_delete.connect(unindex, sender=index.model, weak=False, dispatch_uid=f'search_unindex_{index.table}')
+
+    for label, lookup in index.related.items():
+        # The related model's fields that are copied into the index.
+        fields = [field.split('__', 1)[1] for field in index.fields if field.startswith(f'{lookup}__')]
+
+        def check_related(sender, instance, using, update_fields=None, fields=fields, **kwargs):
+            # Saves that leave the indexed values alone, like the last_login
+            # update on every admin login, have nothing to re-copy.
+            instance._search_reindex = False
+            if instance.pk is None or (update_fields is not None and not set(fields) & set(update_fields)):
+                return
+            stored = sender._default_manager.using(using).filter(pk=instance.pk).values_list(*fields).first()
+            instance._search_reindex = stored != tuple(getattr(instance, field) for field in fields)
+
+        def reindex_related(sender, instance, using, lookup=lookup, **kwargs):
+            backend = get_backend(connections[using])
+            if backend is not None and getattr(instance, '_search_reindex', True):
+                queryset = index.model._default_manager.using(using).filter(**{lookup: instance.pk})
+                backend.sync(connections[using], index, queryset)
+
+        pre_save.connect(check_related, sender=apps.get_model(label), weak=False,
+                         dispatch_uid=f'search_check_{index.table}_{label}')
+        post_save.connect(reindex_related, sender=apps.get_model(label), weak=False,
+                          dispatch_uid=f'search_reindex_{index.table}_{label}')
+
+
+for search_index in SEARCH_INDEXES:
+    connect_index(search_index)
@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from outbound.models import Outbound
+from profiles.models import Unit
+from stocks.models import Stock
+from .backends import SQLiteFTSBackend, search
+
+
+class SearchBackendTests(TestCase):
+
+    def make_stock(self, stock_no, name=''):
+        return Stock.objects.create(stock_no=stock_no, name=name, unit='pcs', description='', quantity=1)
+
+    def test_substring_matches_like_icontains(self):
+        bolt = self.make_stock('HW-10442', 'Hex bolt M8')
+        nut = self.make_stock('HW-10443', 'Hex nut M8')
+        self.make_stock('EL-20001', 'Cable tie')
+
+        self.assertEqual(set(search(Stock.objects.all(), '1044')), {bolt, nut})
+        self.assertEqual(list(search(Stock.objects.all(), 'hex BOLT')), [bolt])
+
+    def test_filters_apply_to_every_hit(self):
+        bolts = [self.make_stock(f'HW-{n}', 'Hex bolt') for n in range(3)]
+        Stock.objects.filter(pk=bolts[2].pk).update(quantity=5)
+
+        results = search(Stock.objects.filter(quantity=5), 'bolt')
+        self.assertEqual(list(results), [bolts[2]])
+        self.assertEqual(search(Stock.objects.all(), 'bolt').count(), 3)
+
+    def test_admin_changelist_uses_index(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.make_stock('HW-10442', 'Hex bolt M8')
+        self.make_stock('EL-20001', 'Cable tie')
+
+        response = self.client.get(reverse('admin:stocks_stock_changelist'), {'q': 'bolt'})
+
+        self.assertContains(response, 'HW-10442')
+        self.assertNotContains(response, 'EL-20001')
+
+    def test_index_follows_edits_and_deletes(self):
+        stock = self.make_stock('HW-1', 'Washer')
+        stock.name = 'Spring washer'
+        stock.save()
+        self.assertEqual(list(search(Stock.objects.all(), 'spring')), [stock])
+
+        stock.delete()
+        self.assertEqual(list(search(Stock.objects.all(), 'spring')), [])
+
+    def test_related_rename_reaches_outbounds(self):
+        user = User.objects.create_user('jdelacruz')
+        outbound = Outbound.objects.create(processed_by=user)
+        user.username = 'jsantos'
+        user.save()
+
+        self.assertEqual(list(search(Outbound.objects.all(), 'santos')), [outbound])
+        self.assertEqual(list(search(Outbound.objects.all(), 'delacruz')), [])
+
+    def test_unrelated_user_saves_leave_outbounds_alone(self):
+        user = User.objects.create_user('jdelacruz')
+        Outbound.objects.create(processed_by=user)
+
+        with mock.patch.object(SQLiteFTSBackend, 'sync') as sync:
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+            user.first_name = 'Juan'
+            user.save()
+        sync.assert_not_called()
+
+    def test_short_terms_fall_back(self):
+        Unit.objects.create(name='Warehouse A')
+        self.assertIsNone(search(Unit.objects.all(), 'A'))
@@ -1,10 +1,250 @@
-from django.contrib import admin
-from .models import Stock
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.forms.models import BaseInlineFormSet
+from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from inventory.pagination import KeysetPaginationMixin
+from inventory.transactions import WriteAtomicAdminMixin
+from jobs.models import job_storage
+from jobs.queue import enqueue
+from search.backends import IndexedSearchMixin
+from .imports import COLUMNS, IMPORT_BATCH_SIZE, ImportFileError, read_rows
+from .models import Stock, StockConflict, StockLocation, StockMovement, StockReservation, TransferLine, TransferOrder
+from .services import committed_quantities, execute_transfer, quantity_errors, unavailable
 
-class StockAdmin(admin.ModelAdmin):
-    list_display = ('stock_no', 'name', 'unit', 'quantity', 'available', 'last_modified_date')
+
+class StockImportForm(forms.Form):
+    file = forms.FileField(help_text='A .csv or .xlsx file with a header row: ' + ', '.join(COLUMNS) + '.')
+    batch_size = forms.IntegerField(min_value=1, initial=IMPORT_BATCH_SIZE)
+
+
+class StockAdminForm(forms.ModelForm):
+    # The version the page was rendered from; the save is refused if the stock has moved on since.
+    loaded_version = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
+    class Meta:
+        model = Stock
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['loaded_version'].initial = self.instance.version
+
+    def clean(self):
+        cleaned_data = super().clean()
+        loaded_version = cleaned_data.get('loaded_version')
+        if self.instance.pk and loaded_version is not None and loaded_version != self.instance.version:
+            raise ValidationError(
+                'Someone else changed this stock while you were editing it. Open it again to see their '
+                'changes; yours have not been saved.', code='conflict',
+            )
+        quantity = cleaned_data.get('quantity')
+        if self.instance.pk and quantity is not None:
+            for error in quantity_errors(quantity, *committed_quantities([self.instance.pk])[self.instance.pk]):
+                self.add_error('quantity', error)
+        return cleaned_data
+
+
+class ReorderFilter(admin.SimpleListFilter):
+    title = 'reorder'
+    parameter_name = 'reorder'
+
+    def lookups(self, request, model_admin):
+        return [('below', 'At or below reorder point')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'below':
+            # Answered from the partial stock_below_reorder_idx index.
+            return queryset.filter(below_reorder=True)
+        return queryset
+
+
+class StockLocationInline(admin.TabularInline):
+    # Balances only move through transfers and outbounds.
+    model = StockLocation
+    fields = ('unit', 'quantity')
+    readonly_fields = ('unit', 'quantity')
+    extra = 0
+    can_delete = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('unit')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class StockAdmin(WriteAtomicAdminMixin, KeysetPaginationMixin, IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('stock_no', 'name', 'unit', 'quantity', 'reorder_point', 'available', 'last_modified_date')
+    list_filter = (ReorderFilter,)
     search_fields = ('stock_no', 'name')  # Fields to search in the admin interface
+    readonly_fields = ('daily_demand',)
+    keyset_ordering = ('-last_modified_date', '-id')
+    form = StockAdminForm
+    inlines = [StockLocationInline]
 
-admin.site.register(Stock, StockAdmin)
+    def save_model(self, request, obj, form, change):
+        obj.save(modified_by=request.user)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except StockConflict as error:
+            # Written between validating the form and saving it; nothing was saved.
+            self.message_user(request, f'{error} Your changes have not been saved.', messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+    def get_urls(self):
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name='stocks_stock_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+
+        form = StockImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                read_rows(upload, upload.name)  # checks the file type only
+            except ImportFileError as error:
+                form.add_error('file', str(error))
+            else:
+                # The upload is imported by a worker; rejected rows become the job's result.
+                path = job_storage().save(f'uploads/{upload.name}', upload)
+                job = enqueue('stocks.import', {
+                    'path': path, 'filename': upload.name, 'batch_size': form.cleaned_data['batch_size'],
+                }, user=request.user)
+                self.message_user(request, f'Import of {upload.name} queued.', messages.SUCCESS)
+                return HttpResponseRedirect(reverse('admin:jobs_job_change', args=[job.pk]))
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import stock',
+            'form': form,
+        }
+        return TemplateResponse(request, 'admin/stocks/stock/import.html', context)
+
+
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'stock', 'kind', 'quantity', 'reference')
+    list_filter = ('kind',)
+    search_fields = ('stock__stock_no', 'reference')
+    list_select_related = ('stock',)
+
+    # The ledger is append-only; movements are written by the stock services.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
+    def has_delete_permission(self, request, obj=None):
+        return False
 
+
+class StockLocationAdmin(admin.ModelAdmin):
+    list_display = ('stock', 'unit', 'quantity')
+    # Filtering by unit reads one range of the (unit, stock) index.
+    list_filter = ('unit',)
+    search_fields = ('stock__stock_no',)
+    list_select_related = ('stock', 'unit')
+
+    # Balances are written by transfers and outbounds only.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class StockReservationAdmin(WriteAtomicAdminMixin, admin.ModelAdmin):
+    list_display = ('hold', 'stock', 'unit', 'quantity', 'created_by', 'expires_at')
+    list_filter = ('unit',)
+    search_fields = ('hold', 'stock__stock_no')
+    list_select_related = ('stock', 'unit', 'created_by')
+
+    # Holds are made through the API; deleting one releases it early.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class TransferLineFormSet(BaseInlineFormSet):
+
+    def clean(self):
+        super().clean()
+        if any(self.errors):
+            return
+        quantities = {}
+        for form in self.forms:
+            if form.cleaned_data.get('stock') and not self._should_delete_form(form):
+                stock = form.cleaned_data['stock']
+                quantities[stock.pk] = quantities.get(stock.pk, 0) + (form.cleaned_data.get('quantity') or 0)
+        if not quantities:
+            raise ValidationError('Add at least one line to transfer.')
+        short = unavailable(quantities, self.instance.from_unit_id, moving=True)
+        if short:
+            raise ValidationError('Not enough stock to transfer for: %(stocks)s.', params={'stocks': ', '.join(short)})
+
+
+class TransferLineInline(admin.TabularInline):
+    model = TransferLine
+    formset = TransferLineFormSet
+    fields = ('stock', 'quantity')
+    extra = 1
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('stock')
+
+    def has_change_permission(self, request, obj=None):
+        return obj is None
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class TransferOrderAdmin(WriteAtomicAdminMixin, admin.ModelAdmin):
+    list_display = ('reference', 'from_unit', 'to_unit', 'created_by', 'created_at')
+    list_filter = ('from_unit', 'to_unit')
+    search_fields = ('reference',)
+    list_select_related = ('from_unit', 'to_unit', 'created_by')
+    fields = ('reference', 'from_unit', 'to_unit', 'created_by', 'created_at')
+    readonly_fields = ('reference', 'created_by', 'created_at')
+    inlines = [TransferLineInline]
+
+    # A transfer is carried out when it is added; afterwards it is a record.
+    def has_change_permission(self, request, obj=None):
+        return obj is None and super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def save_model(self, request, obj, form, change):
+        obj.created_by = request.user
+        obj.save()
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is TransferLine:
+            # Lines and balances are written together by the transfer service.
+            execute_transfer(form.instance, formset.save(commit=False))
+        else:
+            super().save_formset(request, form, formset, change)
+
+
+admin.site.register(Stock, StockAdmin)
+admin.site.register(StockMovement, StockMovementAdmin)
+admin.site.register(StockLocation, StockLocationAdmin)
+admin.site.register(StockReservation, StockReservationAdmin)
+admin.site.register(TransferOrder, TransferOrderAdmin)
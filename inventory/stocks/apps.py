@@ -3,4 +3,10 @@ from django.apps import AppConfig
 
 class StocksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'outbound'
+    name = 'stocks'
+
+    def ready(self):
+        from .reorder import stocks_changed_receiver
+        from .signals import stocks_changed
+
+        stocks_changed.connect(stocks_changed_receiver, dispatch_uid='stocks_evaluate_reorder')
@@ -0,0 +1,257 @@
+"""
+Streaming stock import from supplier catalogues (CSV or XLSX).
+
+Rows are read one at a time, validated a batch at a time and upserted on
+``stock_no`` with a single ``bulk_create(update_conflicts=True)`` per batch,
+so memory use depends on the batch size rather than the file size. Columns
+that are not in the file are left alone on existing stocks. Quantity changes
+are recorded in the ledger as adjustments, like hand edits in the admin.
+"""
+import csv
+import io
+import os
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from inventory.transactions import write_atomic
+from search.backends import reindex
+from .models import Stock, StockMovement
+from .services import committed_quantities, quantity_errors, record_movements
+from .signals import stocks_changed
+
+IMPORT_BATCH_SIZE = 1000
+
+COLUMNS = ('stock_no', 'name', 'unit', 'description', 'quantity', 'available', 'remarks', 'unit_cost')
+REQUIRED_COLUMNS = ('stock_no', 'unit')
+
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', ''}
+
+
+class ImportFileError(ValueError):
+    pass
+
+
+def read_csv(file):
+    """Yield ``(line_number, row)`` from a CSV file opened in text or binary mode."""
+    if isinstance(file.read(0), bytes):
+        file = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    reader = csv.reader(file)
+    header = next(reader, None)
+    if header is None:
+        raise ImportFileError('The file is empty.')
+    header = [column.strip().lower() for column in header]
+    for row in reader:
+        if any(row):
+            yield reader.line_num, dict(zip(header, row))
+
+
+def read_xlsx(file):
+    """Yield ``(line_number, row)`` from the first sheet of a workbook, without loading it whole."""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError('Reading .xlsx files requires openpyxl.')
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ImportFileError('The file is empty.')
+        header = [str(column or '').strip().lower() for column in header]
+        for line, row in enumerate(rows, start=2):
+            if any(value not in (None, '') for value in row):
+                yield line, {column: '' if value is None else value for column, value in zip(header, row)}
+    finally:
+        workbook.close()
+
+
+READERS = {
+    '.csv': read_csv,
+    '.xlsx': read_xlsx,
+}
+
+
+def read_rows(file, name=None):
+    """Pick a reader from the file name's extension."""
+    extension = os.path.splitext(name or getattr(file, 'name', '') or '')[1].lower()
+    if extension not in READERS:
+        raise ImportFileError(f'Unsupported file type {extension!r}; use one of {", ".join(READERS)}.')
+    return READERS[extension](file)
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValidationError(f'{value!r} is not a yes/no value.')
+
+
+def clean_row(row, columns):
+    """Return ``(values, errors)`` for one row, with only the importable ``columns`` set."""
+    values, errors = {}, []
+    for column in columns:
+        value = row.get(column, '')
+        if isinstance(value, str):
+            value = value.strip()
+        try:
+            if column == 'available':
+                value = parse_bool(value)
+            elif column == 'quantity':
+                value = Stock._meta.get_field('quantity').clean(value if value != '' else None, None)
+                if value < 0:
+                    raise ValidationError('Quantity cannot be negative.')
+            elif column == 'remarks' and value == '':
+                value = None
+            elif column == 'unit_cost' and value == '':
+                value = Stock._meta.get_field('unit_cost').default
+            else:
+                value = Stock._meta.get_field(column).clean(str(value), None)
+        except ValidationError as error:
+            errors.append(f"{column}: {' '.join(error.messages)}")
+        else:
+            values[column] = value
+    return values, errors
+
+
+class ImportReport:
+    """Running totals of an import; ``rejected`` keeps only the first few rows."""
+    MAX_KEPT_REJECTS = 100
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.rejected_count = 0
+        self.rejected = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def reject(self, line, row, errors):
+        self.rejected_count += 1
+        if len(self.rejected) < self.MAX_KEPT_REJECTS:
+            self.rejected.append((line, row.get('stock_no', ''), errors))
+
+    def __str__(self):
+        return (
+            f'{self.created} created, {self.updated} updated, {self.rejected_count} rejected '
+            f'in {self.elapsed:.1f}s ({self.rows_per_second:.0f} rows/s)'
+        )
+
+
+def upsert_batch(values_by_stock_no, fields, user=None, reference=''):
+    """
+    Insert or update one batch of cleaned rows keyed by stock_no. Returns
+    ``(created, updated, rejected)``; ``rejected`` maps the stock_no of rows
+    left out, whose quantity is below what the stock has committed, to their
+    errors.
+    """
+    now = timezone.now()
+    values_by_stock_no = dict(values_by_stock_no)
+    rejected = {}
+    with write_atomic():
+        # Lock existing rows so the adjustment recorded below matches the
+        # quantity that was actually replaced, and the version bump is exact.
+        existing = {
+            stock_no: (quantity, version, pk)
+            for stock_no, quantity, version, pk in Stock.objects.select_for_update()
+            .filter(stock_no__in=values_by_stock_no)
+            .order_by('pk')
+            .values_list('stock_no', 'quantity', 'version', 'pk')
+        }
+        if 'quantity' in fields and existing:
+            committed = committed_quantities([pk for quantity, version, pk in existing.values()])
+            for stock_no, (quantity, version, pk) in existing.items():
+                errors = quantity_errors(values_by_stock_no[stock_no]['quantity'], *committed[pk])
+                if errors:
+                    rejected[stock_no] = errors
+                    del values_by_stock_no[stock_no]
+            existing = {stock_no: row for stock_no, row in existing.items() if stock_no not in rejected}
+            if not values_by_stock_no:
+                return 0, 0, rejected
+        stocks = [
+            Stock(
+                **{'name': '', 'description': '', 'quantity': 0, 'available': True, **values},
+                last_modified_date=now,
+                modified_by=user,
+                version=existing[values['stock_no']][1] + 1 if values['stock_no'] in existing else 1,
+            )
+            for values in values_by_stock_no.values()
+        ]
+        update_fields = [field for field in fields if field != 'stock_no'] + ['last_modified_date', 'version']
+        if user is not None:
+            update_fields.append('modified_by')
+        Stock.objects.bulk_create(
+            stocks, update_conflicts=True, unique_fields=['stock_no'], update_fields=update_fields,
+        )
+
+        pks = dict(Stock.objects.filter(stock_no__in=values_by_stock_no).values_list('stock_no', 'pk'))
+        deltas = {}
+        for stock in stocks:
+            previous = existing.get(stock.stock_no, (0, 0))[0]
+            if 'quantity' in fields or stock.stock_no not in existing:
+                deltas[pks[stock.stock_no]] = stock.quantity - previous
+        # Stock received through the import is valued at the file's unit cost.
+        unit_costs = {pks[stock.stock_no]: stock.unit_cost for stock in stocks} if 'unit_cost' in fields else None
+        record_movements({pk: delta for pk, delta in deltas.items() if delta},
+                         kind=StockMovement.ADJUSTMENT, reference=reference, unit_costs=unit_costs)
+        stocks_changed.send(sender=Stock, stock_ids=list(pks.values()))
+        # bulk_create sends no post_save, so new and renamed stocks are indexed here.
+        reindex(Stock.objects.filter(pk__in=pks.values()))
+
+    created = len(values_by_stock_no) - len(existing)
+    return created, len(existing), rejected
+
+
+def import_stock(rows, batch_size=IMPORT_BATCH_SIZE, user=None, reference='Stock import', progress=None):
+    """
+    Validate and upsert ``(line_number, row)`` pairs from read_rows() in
+    batches. Within a batch a later row for the same stock_no wins. Returns
+    an ImportReport; ``progress(report)`` is called after every batch.
+    """
+    report = ImportReport()
+    rows = iter(rows)
+    columns = None
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        report.rows += len(batch)
+        if columns is None:
+            present = set(batch[0][1])
+            missing = [column for column in REQUIRED_COLUMNS if column not in present]
+            if missing:
+                raise ImportFileError(f'Missing required column(s): {", ".join(missing)}.')
+            columns = [column for column in COLUMNS if column in present]
+
+        cleaned, sources = {}, {}
+        for line, row in batch:
+            values, errors = clean_row(row, columns)
+            if errors:
+                report.reject(line, row, errors)
+            else:
+                cleaned[values['stock_no']] = values
+                sources[values['stock_no']] = line, row
+        if cleaned:
+            created, updated, rejected = upsert_batch(cleaned, columns, user=user, reference=reference)
+            report.created += created
+            report.updated += updated
+            for stock_no, errors in rejected.items():
+                report.reject(*sources[stock_no], errors)
+        report.elapsed = time.perf_counter() - report.started
+        if progress:
+            progress(report)
+    report.elapsed = time.perf_counter() - report.started
+    return report
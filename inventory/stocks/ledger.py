@@ -0,0 +1,122 @@
+from django.db import connections, router, transaction
+from django.db.models import Case, F, Max, Sum, Value, When
+from django.utils import timezone
+
+from inventory.transactions import write_atomic
+from .models import LedgerCheckpoint, Stock, StockBalance, StockMovement
+from .services import UPDATE_BATCH_SIZE
+from .signals import stocks_changed
+
+REBUILD_BATCH_SIZE = 10000
+
+
+def chunked(values, size=UPDATE_BATCH_SIZE):
+    values = sorted(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def ledger_horizon():
+    """
+    The id of the last movement a checkpointed pass may read up to: every
+    movement at or below it is committed, so none can appear behind the
+    checkpoint later. SQLite commits writers one at a time, in id order. On
+    PostgreSQL ids are taken at insert but appear at commit, so a transaction
+    still open can commit a lower id than one already visible: a SHARE lock
+    on the table waits those out, and holds new inserts back for one read.
+    """
+    connection = connections[router.db_for_write(StockMovement)]
+    movements = StockMovement.objects.using(connection.alias)
+    if connection.vendor != 'postgresql':
+        return movements.aggregate(last=Max('id'))['last'] or 0
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE {StockMovement._meta.db_table} IN SHARE MODE')
+        return movements.aggregate(last=Max('id'))['last'] or 0
+
+
+def fold_movements(start_id, end_id):
+    """
+    Add the movements with ``start_id < id <= end_id`` to StockBalance and
+    move the checkpoint to ``end_id``. Returns the pks of the stocks touched.
+    """
+    totals = dict(
+        StockMovement.objects.filter(id__gt=start_id, id__lte=end_id)
+        .values_list('stock_id')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+    )
+    with transaction.atomic():
+        for batch in chunked(totals):
+            existing = set(StockBalance.objects.filter(stock_id__in=batch).values_list('stock_id', flat=True))
+            StockBalance.objects.bulk_create([
+                StockBalance(stock_id=pk, quantity=0) for pk in batch if pk not in existing
+            ])
+            StockBalance.objects.filter(stock_id__in=batch).update(
+                quantity=Case(
+                    *[When(stock_id=pk, then=F('quantity') + Value(totals[pk])) for pk in batch],
+                    default=F('quantity'),
+                )
+            )
+        LedgerCheckpoint.objects.filter(pk=1).update(movement_id=end_id, updated_at=timezone.now())
+    return set(totals)
+
+
+def project_balances(stock_ids):
+    """Copy checkpointed balances onto Stock.quantity, keeping movements written since then."""
+    for batch in chunked(stock_ids):
+        with write_atomic():
+            # Lock the stocks first so no issue can slip in between reading the
+            # pending movements and writing the projection.
+            list(Stock.objects.select_for_update().filter(pk__in=batch).order_by('pk').values_list('pk', flat=True))
+            checkpoint = LedgerCheckpoint.current().movement_id
+            balances = dict(StockBalance.objects.filter(stock_id__in=batch).values_list('stock_id', 'quantity'))
+            pending = dict(
+                StockMovement.objects.filter(stock_id__in=batch, id__gt=checkpoint)
+                .values_list('stock_id')
+                .annotate(total=Sum('quantity'))
+                .order_by()
+            )
+            projected = {pk: balances.get(pk, 0) + pending.get(pk, 0) for pk in batch}
+            # Only stocks whose quantity actually moves count as modified.
+            Stock.objects.filter(pk__in=batch).exclude(
+                quantity=Case(*[When(pk=pk, then=Value(quantity)) for pk, quantity in projected.items()])
+            ).update(
+                quantity=Case(
+                    *[When(pk=pk, then=Value(quantity)) for pk, quantity in projected.items()],
+                    default=F('quantity'),
+                ),
+                last_modified_date=timezone.now(),
+                version=F('version') + 1,
+            )
+            stocks_changed.send(sender=Stock, stock_ids=batch)
+
+
+def rebuild_balances(batch_size=REBUILD_BATCH_SIZE, full=False, progress=None):
+    """
+    Replay the ledger into StockBalance from the last checkpoint (or from the
+    start with ``full``) in id-range batches, then project the result onto
+    Stock.quantity for the stocks that moved. Returns the number of stocks
+    whose balance was recomputed.
+    """
+    checkpoint = LedgerCheckpoint.current()
+    if full:
+        with transaction.atomic():
+            StockBalance.objects.all().delete()
+            LedgerCheckpoint.objects.filter(pk=1).update(movement_id=0, updated_at=timezone.now())
+        checkpoint.movement_id = 0
+
+    last_id = ledger_horizon()
+    touched = set()
+    position = checkpoint.movement_id
+    while position < last_id:
+        end_id = min(position + batch_size, last_id)
+        touched |= fold_movements(position, end_id)
+        position = end_id
+        if progress:
+            progress(position, last_id)
+
+    if full:
+        # Stocks without any movement have a balance of zero.
+        touched |= set(Stock.objects.values_list('pk', flat=True))
+    project_balances(touched)
+    return len(touched)
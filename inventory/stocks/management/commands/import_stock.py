@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from stocks.imports import IMPORT_BATCH_SIZE, ImportFileError, import_stock, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Insert or update stocks by stock_no from a CSV or XLSX supplier catalogue.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='A .csv or .xlsx file with a header row.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help='Rows validated and upserted per transaction.')
+        parser.add_argument('--user', help='Username recorded as modified_by on every imported stock.')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user named {options['user']!r}.")
+
+        def progress(report):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{report.rows} rows read: {report}')
+
+        try:
+            with open(options['path'], 'rb') as handle:
+                report = import_stock(
+                    read_rows(handle), batch_size=options['batch_size'], user=user,
+                    reference=f"Import {options['path']}"[:100], progress=progress,
+                )
+        except (OSError, ImportFileError) as error:
+            raise CommandError(error)
+
+        for line, stock_no, errors in report.rejected:
+            self.stderr.write(f"Line {line} ({stock_no or 'no stock_no'}): {'; '.join(errors)}")
+        if report.rejected_count > len(report.rejected):
+            self.stderr.write(f'... and {report.rejected_count - len(report.rejected)} more rejected rows.')
+        self.stdout.write(self.style.SUCCESS(f'Imported {report.rows} rows: {report}'))
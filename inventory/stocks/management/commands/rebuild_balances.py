@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from stocks.ledger import REBUILD_BATCH_SIZE, rebuild_balances
+
+
+class Command(BaseCommand):
+    help = 'Replay the stock movement ledger into balances and Stock.quantity, starting from the last checkpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE,
+                            help='Number of movement ids folded per transaction.')
+        parser.add_argument('--full', action='store_true',
+                            help='Discard the checkpoint and replay the whole ledger.')
+
+    def handle(self, *args, **options):
+        def progress(position, last_id):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Folded movements up to {position} of {last_id}')
+
+        count = rebuild_balances(options['batch_size'], full=options['full'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Recomputed balances for {count} stocks.'))
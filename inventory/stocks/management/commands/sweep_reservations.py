@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from stocks.reservations import SWEEP_BATCH_SIZE, sweep_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete stock reservations whose hold has lapsed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE,
+                            help='Number of reservations deleted per statement.')
+
+    def handle(self, *args, **options):
+        def progress(deleted):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Deleted {deleted} reservations')
+
+        count = sweep_expired(options['batch_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} lapsed reservations.'))
@@ -0,0 +1,52 @@
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from stocks.valuation import VALUATION_BATCH_SIZE, valuation_report, value_stock, write_report
+
+
+def parse_month(value):
+    try:
+        year, month = (int(part) for part in value.split('-'))
+        return date(year, month, 1)
+    except ValueError:
+        raise CommandError(f"'{value}' is not a month like 2024-08.")
+
+
+class Command(BaseCommand):
+    help = (
+        'Value new stock movements by FIFO and weighted average, picking up from the last run. '
+        'With --month, also report stock value at the end of that month and the cost of stock issued in it.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Revalue the whole ledger from the start.')
+        parser.add_argument('--batch-size', type=int, default=VALUATION_BATCH_SIZE,
+                            help='Number of movement ids valued per transaction.')
+        parser.add_argument('--month', type=parse_month, help='Month to report on, as YYYY-MM.')
+        parser.add_argument('--output', help='Write the per-stock month report to this CSV file.')
+
+    def handle(self, *args, **options):
+        def progress(position, last_id):
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Valued movements up to id {position} of {last_id}')
+
+        count = value_stock(options['batch_size'], full=options['full'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f'Valued {count} movements.'))
+        if not options['month']:
+            return
+
+        start = options['month']
+        end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+        rows = valuation_report(*(timezone.make_aware(datetime.combine(day, time.min)) for day in (start, end)))
+        self.stdout.write(
+            f"{start:%Y-%m}: {sum(row['quantity'] for row in rows)} units on hand, "
+            f"worth {sum(row['fifo'] for row in rows):.2f} FIFO / "
+            f"{sum(row['average'] for row in rows):.2f} average; "
+            f"cost of stock issued {0 - sum(row['fifo_issued'] or 0 for row in rows):.2f} FIFO / "
+            f"{0 - sum(row['average_issued'] or 0 for row in rows):.2f} average."
+        )
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                write_report(rows, output)
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def record_opening_balances(apps, schema_editor):
+    # Stock quantities that predate the ledger become opening adjustments, so
+    # replaying the ledger reproduces today's balances.
+    Stock = apps.get_model('stocks', 'Stock')
+    StockMovement = apps.get_model('stocks', 'StockMovement')
+    batch = []
+    for pk, quantity in Stock.objects.exclude(quantity=0).values_list('pk', 'quantity').iterator(chunk_size=2000):
+        batch.append(StockMovement(stock_id=pk, kind='adjustment', quantity=quantity, reference='Opening balance'))
+        if len(batch) >= 2000:
+            StockMovement.objects.bulk_create(batch)
+            batch = []
+    StockMovement.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0004_stock_movement_ledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(record_opening_balances, migrations.RunPython.noop),
+    ]
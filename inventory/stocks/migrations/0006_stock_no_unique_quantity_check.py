@@ -0,0 +1,43 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:34
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_existing_stock(apps, schema_editor):
+    # Fail with a readable list instead of a bare IntegrityError half way
+    # through the table rebuild.
+    Stock = apps.get_model('stocks', 'Stock')
+    duplicates = list(
+        Stock.objects.values('stock_no').annotate(rows=Count('id')).filter(rows__gt=1).values_list('stock_no', flat=True)[:20]
+    )
+    negative = list(Stock.objects.filter(quantity__lt=0).values_list('stock_no', flat=True)[:20])
+    problems = []
+    if duplicates:
+        problems.append(f"duplicate stock_no values: {', '.join(duplicates)}")
+    if negative:
+        problems.append(f"negative quantities on: {', '.join(negative)}")
+    if problems:
+        raise RuntimeError('Fix these stocks before migrating: ' + '; '.join(problems))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0005_opening_movements'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(check_existing_stock, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='stock',
+            name='stock_no',
+            field=models.CharField(max_length=50, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.CheckConstraint(check=models.Q(('quantity__gte', 0)), name='stock_quantity_non_negative'),
+        ),
+    ]
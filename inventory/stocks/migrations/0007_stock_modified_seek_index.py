@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0006_stock_no_unique_quantity_check'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(fields=['last_modified_date', 'id'], name='stock_modified_seek_idx'),
+        ),
+    ]
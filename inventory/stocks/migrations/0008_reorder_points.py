@@ -0,0 +1,44 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0007_stock_modified_seek_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='below_reorder',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='daily_demand',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='lead_time_days',
+            field=models.PositiveIntegerField(default=7, help_text='Days between ordering and receiving stock.'),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='reorder_point',
+            field=models.IntegerField(blank=True, help_text='Flag the stock for reordering once its quantity falls to this level. Leave blank to not track it.', null=True),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='safety_stock',
+            field=models.IntegerField(default=0, help_text='Buffer on top of the demand expected over the lead time.'),
+        ),
+        migrations.AddIndex(
+            model_name='stock',
+            index=models.Index(condition=models.Q(('below_reorder', True)), fields=['last_modified_date', 'id'], name='stock_below_reorder_idx'),
+        ),
+    ]
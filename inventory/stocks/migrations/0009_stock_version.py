@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0008_reorder_points'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
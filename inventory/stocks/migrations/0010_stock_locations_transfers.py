@@ -0,0 +1,66 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:25
+
+import django.core.validators
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0004_alter_unit_options'),
+        ('stocks', '0009_stock_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockmovement',
+            name='unit',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='profiles.unit'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='kind',
+            field=models.CharField(choices=[('issue', 'Issue'), ('return', 'Return'), ('adjustment', 'Adjustment'), ('transfer', 'Transfer')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='StockLocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(default=0)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='locations', to='stocks.stock')),
+                ('unit', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='stock_locations', to='profiles.unit')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransferOrder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(editable=False, max_length=100, unique=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+                ('from_unit', models.ForeignKey(blank=True, help_text='Leave blank to take unassigned stock.', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transfers_out', to='profiles.unit')),
+                ('to_unit', models.ForeignKey(blank=True, help_text='Leave blank to give the stock back to the unassigned pool.', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='transfers_in', to='profiles.unit')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransferLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)])),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='stocks.stock')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='stocks.transferorder')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stocklocation',
+            constraint=models.UniqueConstraint(fields=('unit', 'stock'), name='stock_location_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocklocation',
+            constraint=models.CheckConstraint(check=models.Q(('quantity__gte', 0)), name='stock_location_quantity_non_negative'),
+        ),
+    ]
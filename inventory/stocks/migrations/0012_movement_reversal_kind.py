@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0011_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='kind',
+            field=models.CharField(choices=[('issue', 'Issue'), ('return', 'Return'), ('adjustment', 'Adjustment'), ('transfer', 'Transfer'), ('reversal', 'Reversal')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.7 on 2026-10-18 19:58
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stocks', '0012_movement_reversal_kind'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovementCost',
+            fields=[
+                ('movement', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cost', serialize=False, to='stocks.stockmovement')),
+                ('fifo_value', models.DecimalField(decimal_places=4, max_digits=18)),
+                ('average_value', models.DecimalField(decimal_places=4, max_digits=18)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockValuation',
+            fields=[
+                ('stock', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='valuation', serialize=False, to='stocks.stock')),
+                ('quantity', models.IntegerField(default=0)),
+                ('fifo_value', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('average_value', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('layers', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ValuationCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movement_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=4, default=0, help_text='Cost of one unit received. Stock put back without a cost of its own is valued at it.', max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='unit_cost',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+    ]
@@ -1,9 +1,21 @@
-from django.db import models
+import uuid
+
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+from django.db import models, transaction
 from django.contrib.auth.models import User  # Assuming you use Django's built-in User model
 from django.utils import timezone
 
+from caching.querysets import CachedQuerySet
+from .signals import stocks_below_reorder
+
+
+class StockConflict(Exception):
+    """The stock was changed by someone else since this copy of it was read."""
+
+
 class Stock(models.Model):
-    stock_no = models.CharField(max_length=50)
+    stock_no = models.CharField(max_length=50, unique=True)
     name = models.CharField(max_length=50, blank=True)
     unit = models.CharField(max_length=50)
     description = models.TextField()
@@ -13,13 +25,296 @@ class Stock(models.Model):
     last_modified_date = models.DateTimeField(default=timezone.now)
     entry_date = models.DateTimeField(auto_now_add=True)
     modified_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    reorder_point = models.IntegerField(
+        null=True, blank=True,
+        help_text='Flag the stock for reordering once its quantity falls to this level. Leave blank to not track it.',
+    )
+    safety_stock = models.IntegerField(default=0, help_text='Buffer on top of the demand expected over the lead time.')
+    lead_time_days = models.PositiveIntegerField(default=7, help_text='Days between ordering and receiving stock.')
+    unit_cost = models.DecimalField(
+        max_digits=12, decimal_places=4, default=0,
+        help_text='Cost of one unit received. Stock put back without a cost of its own is valued at it.',
+    )
+    # Average units issued per day, written by the forecast_demand job.
+    daily_demand = models.FloatField(default=0, editable=False)
+    # quantity <= reorder_point; kept current by stocks.reorder.
+    below_reorder = models.BooleanField(default=False, editable=False)
+    # Bumped by every write; saves only succeed against the version they read.
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    objects = CachedQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(check=models.Q(quantity__gte=0), name='stock_quantity_non_negative'),
+        ]
+        indexes = [
+            models.Index(fields=['last_modified_date', 'id'], name='stock_modified_seek_idx'),
+            # Only at-risk stocks are indexed, so listing them does not grow with the catalogue.
+            models.Index(fields=['last_modified_date', 'id'], name='stock_below_reorder_idx',
+                         condition=models.Q(below_reorder=True)),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_loaded_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        self.remember_loaded_values(fields)
+
+    def remember_loaded_values(self, fields=None):
+        loaded = getattr(self, '_loaded_values', {}) if fields else {}
+        for field in self._meta.concrete_fields:
+            if field.attname in self.__dict__ and (not fields or field.name in fields or field.attname in fields):
+                loaded[field.attname] = getattr(self, field.attname)
+        self._loaded_values = loaded
+
+    def changed_fields(self):
+        """Names of the loaded fields whose value differs from what was read."""
+        loaded = getattr(self, '_loaded_values', {})
+        return [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+            and (field.attname not in loaded or getattr(self, field.attname) != loaded[field.attname])
+        ]
 
     def save(self, *args, **kwargs):
-        # Check if the instance is being updated
+        # Callers may pass the user making the change; without one the
+        # existing modified_by is kept.
+        modified_by = kwargs.pop('modified_by', None)
+        if modified_by is not None:
+            self.modified_by = modified_by
+        loaded = getattr(self, '_loaded_values', {})
+        updating = self.pk is not None and not self._state.adding
+        if updating and 'quantity' in loaded:
+            previous, was_below = loaded['quantity'], loaded.get('below_reorder', False)
+        elif self.pk:
+            # An instance built by hand rather than read: look the row up.
+            previous, was_below = (
+                Stock.objects.filter(pk=self.pk).values_list('quantity', 'below_reorder').first() or (None, False)
+            )
+        else:
+            previous, was_below = None, False
         if self.pk:
-            # Set the modified_by field to the currently logged-in user
-            self.modified_by = kwargs.pop('modified_by', None)
-        super().save(*args, **kwargs)
+            # API clients revalidate against this (ETag / Last-Modified).
+            self.last_modified_date = timezone.now()
+        self.below_reorder = self.reorder_point is not None and self.quantity <= self.reorder_point
+
+        if updating:
+            # Write only what changed, and only if nobody wrote since it was read
+            # (see _do_update); the ledger delta below relies on the latter.
+            update_fields = kwargs.get('update_fields')
+            update_fields = self.changed_fields() if update_fields is None else list(update_fields)
+            kwargs['update_fields'] = set(update_fields) | {'last_modified_date', 'below_reorder', 'version'}
+            self._expected_version = self.version
+            self.version += 1
+
+        # Hand edits to quantity are recorded in the ledger as adjustments
+        try:
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                change = self.quantity - (previous or 0)
+                if change:
+                    StockMovement.objects.create(stock=self, kind=StockMovement.ADJUSTMENT, quantity=change,
+                                                 unit_cost=self.unit_cost if change > 0 else None)
+                if self.below_reorder and not was_below:
+                    stocks_below_reorder.send(sender=Stock, stock_ids=[self.pk])
+        except BaseException:
+            if updating:
+                self.version = self._expected_version
+            raise
+        finally:
+            self._expected_version = None
+        self.remember_loaded_values()
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        expected = getattr(self, '_expected_version', None)
+        if expected is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        # UPDATE ... WHERE id = %s AND version = %s
+        if not super()._do_update(base_qs.filter(version=expected), using, pk_val, values, update_fields,
+                                  forced_update):
+            raise StockConflict(f"Stock '{self.stock_no}' was changed by someone else since it was loaded.")
+        return True
 
     def __str__(self):
         return self.stock_no  # Display stock number as the object's string representation
+
+
+class StockLocation(models.Model):
+    """
+    How much of a stock is held at one unit. Stock.quantity stays the total;
+    whatever no location holds is the stock's unassigned quantity. A stock
+    with no rows here is not tracked per location at all. Rows are written
+    by stocks.services; a deleted unit's quantity falls back to unassigned.
+    """
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='locations')
+    # Looked up through stock_location_key, which leads with the unit.
+    unit = models.ForeignKey('profiles.Unit', on_delete=models.CASCADE, related_name='stock_locations', db_index=False)
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Leads with the unit, so one site's balances are a single index range.
+            models.UniqueConstraint(fields=['unit', 'stock'], name='stock_location_key'),
+            models.CheckConstraint(check=models.Q(quantity__gte=0), name='stock_location_quantity_non_negative'),
+        ]
+
+    def __str__(self):
+        return f'{self.stock} @ {self.unit}: {self.quantity}'
+
+
+class StockReservation(models.Model):
+    """
+    Quantity held for a checkout until ``expires_at``. Active holds count
+    against what others can issue; stocks.reservations confirms a hold into
+    an outbound or lets it lapse. ``unit`` is where the stock will be taken.
+    """
+    hold = models.CharField(max_length=32, db_index=True)
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='reservations')
+    unit = models.ForeignKey('profiles.Unit', on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Active quantity per stock (and unit) is summed from the index alone.
+            models.Index(fields=['stock', 'expires_at', 'unit', 'quantity'], name='reservation_active_idx'),
+            # The sweeper deletes lapsed holds oldest first.
+            models.Index(fields=['expires_at', 'id'], name='reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.stock} x {self.quantity} until {self.expires_at:%Y-%m-%d %H:%M}'
+
+
+class StockMovement(models.Model):
+    ISSUE = 'issue'
+    RETURN = 'return'
+    ADJUSTMENT = 'adjustment'
+    TRANSFER = 'transfer'
+    REVERSAL = 'reversal'
+    KIND_CHOICES = [
+        (ISSUE, 'Issue'),
+        (RETURN, 'Return'),
+        (ADJUSTMENT, 'Adjustment'),
+        (TRANSFER, 'Transfer'),
+        (REVERSAL, 'Reversal'),
+    ]
+
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE, related_name='movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField()  # signed: negative takes stock out, positive puts it back
+    reference = models.CharField(max_length=100, blank=True)
+    # Where the stock moved; transfers write a pair of rows that net to zero.
+    unit = models.ForeignKey('profiles.Unit', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # What one unit put back cost; blank falls back to the stock's unit_cost (see stocks.valuation).
+    unit_cost = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stock', 'id']),
+        ]
+
+    def __str__(self):
+        return f'{self.stock} {self.quantity:+d} ({self.kind})'
+
+
+class TransferOrder(models.Model):
+    """Quantities moved from one unit to another; a blank unit is the unassigned pool."""
+    reference = models.CharField(max_length=100, unique=True, editable=False)
+    from_unit = models.ForeignKey(
+        'profiles.Unit', on_delete=models.PROTECT, null=True, blank=True, related_name='transfers_out',
+        help_text='Leave blank to take unassigned stock.',
+    )
+    to_unit = models.ForeignKey(
+        'profiles.Unit', on_delete=models.PROTECT, null=True, blank=True, related_name='transfers_in',
+        help_text='Leave blank to give the stock back to the unassigned pool.',
+    )
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def clean(self):
+        if self.from_unit_id == self.to_unit_id:
+            raise ValidationError('Stock must be transferred between two different places.')
+
+    def save(self, *args, **kwargs):
+        if not self.reference:
+            self.reference = 'TR-' + uuid.uuid4().hex[:10].upper()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.reference
+
+
+class TransferLine(models.Model):
+    order = models.ForeignKey(TransferOrder, on_delete=models.CASCADE, related_name='lines')
+    stock = models.ForeignKey(Stock, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+
+    def __str__(self):
+        return f'{self.stock} - {self.quantity}'
+
+
+class StockBalance(models.Model):
+    """Balance of a stock after folding in every movement up to LedgerCheckpoint."""
+    stock = models.OneToOneField(Stock, on_delete=models.CASCADE, primary_key=True, related_name='balance')
+    quantity = models.IntegerField(default=0)
+
+
+class LedgerCheckpoint(models.Model):
+    """Single row holding the last StockMovement id folded into StockBalance."""
+    movement_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def current(cls):
+        checkpoint, created = cls.objects.get_or_create(pk=1)
+        return checkpoint
+
+
+class MovementCost(models.Model):
+    """
+    Change in a stock's value made by one movement, by FIFO and by moving
+    weighted average: positive for stock put back, negative for stock
+    taken out. Written by stocks.valuation.
+    """
+    movement = models.OneToOneField(StockMovement, on_delete=models.CASCADE, primary_key=True, related_name='cost')
+    fifo_value = models.DecimalField(max_digits=18, decimal_places=4)
+    average_value = models.DecimalField(max_digits=18, decimal_places=4)
+
+    def __str__(self):
+        return f'{self.movement}: {self.fifo_value} FIFO, {self.average_value} average'
+
+
+class StockValuation(models.Model):
+    """
+    A stock's valuation after every movement up to ValuationCheckpoint: the
+    quantity valued, its worth by each method, and the FIFO layers not yet
+    taken out as ``[quantity, unit_cost]`` pairs, oldest first.
+    """
+    stock = models.OneToOneField(Stock, on_delete=models.CASCADE, primary_key=True, related_name='valuation')
+    quantity = models.IntegerField(default=0)
+    fifo_value = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    average_value = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    layers = models.JSONField(default=list)
+
+    def __str__(self):
+        return f'{self.stock}: {self.quantity} worth {self.fifo_value} FIFO'
+
+
+class ValuationCheckpoint(models.Model):
+    """Single row holding the last StockMovement id valued into StockValuation."""
+    movement_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def current(cls):
+        checkpoint, created = cls.objects.get_or_create(pk=1)
+        return checkpoint
@@ -0,0 +1,46 @@
+"""
+Reorder-point evaluation.
+
+Stock.below_reorder marks stocks whose quantity has fallen to their reorder
+point. Stock.save() sets it for single edits; every bulk write path sends
+stocks_changed with the pks it touched, and only those stocks are
+re-evaluated here, inside the writer's transaction. The flag is covered by a
+partial index, so listing at-risk stocks costs as much as there are of them.
+"""
+from django.db.models import BooleanField, Case, F, Q, Value, When
+
+from .models import Stock
+from .services import UPDATE_BATCH_SIZE
+from .signals import stocks_below_reorder
+
+AT_RISK = Case(
+    When(Q(reorder_point__isnull=False, quantity__lte=F('reorder_point')), then=Value(True)),
+    default=Value(False),
+    output_field=BooleanField(),
+)
+
+
+def evaluate_reorder(stock_ids):
+    """
+    Bring below_reorder up to date for ``stock_ids``. Returns the pks that
+    have just fallen to their reorder point; stocks_below_reorder is sent
+    with them.
+    """
+    stock_ids = sorted(stock_ids)
+    fell = []
+    for start in range(0, len(stock_ids), UPDATE_BATCH_SIZE):
+        batch = stock_ids[start:start + UPDATE_BATCH_SIZE]
+        changed = dict(
+            Stock.objects.filter(pk__in=batch).alias(at_risk=AT_RISK).exclude(below_reorder=F('at_risk'))
+            .values_list('pk', 'below_reorder')
+        )
+        if changed:
+            Stock.objects.filter(pk__in=changed).update(below_reorder=AT_RISK)
+            fell += [pk for pk, was_below in changed.items() if not was_below]
+    if fell:
+        stocks_below_reorder.send(sender=Stock, stock_ids=fell)
+    return fell
+
+
+def stocks_changed_receiver(sender, stock_ids, **kwargs):
+    evaluate_reorder(stock_ids)
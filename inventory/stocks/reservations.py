@@ -0,0 +1,103 @@
+"""
+Short-lived stock holds.
+
+reserve() checks and records a hold in one short transaction, so a checkout
+that takes minutes does not keep stock rows locked while it is open. Until
+it lapses a hold counts against what anyone else can issue (see
+services.active_reservations); outbound.services.confirm_hold turns it into
+outbound items, release() gives it up, and sweep_expired() deletes holds
+that were neither.
+"""
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from inventory.transactions import write_atomic
+from .models import Stock, StockReservation
+from .services import InsufficientStock, active_reservations, available, lock_locations
+
+SWEEP_BATCH_SIZE = 1000
+
+
+class HoldNotFound(LookupError):
+    pass
+
+
+def hold_seconds():
+    return getattr(settings, 'STOCK_HOLD_SECONDS', 15 * 60)
+
+
+def reserve(lines, unit=None, user=None, seconds=None):
+    """
+    Hold ``(stock or stock pk, quantity)`` lines at ``unit`` for ``seconds``
+    (STOCK_HOLD_SECONDS by default). Raises InsufficientStock unless every
+    line fits next to the holds already active. Returns the hold id.
+    """
+    quantities = defaultdict(int)
+    for stock, quantity in lines:
+        if quantity <= 0:
+            raise ValueError('Reserved quantities must be greater than zero.')
+        quantities[getattr(stock, 'pk', stock)] += quantity
+    unit = getattr(unit, 'pk', unit)
+    hold = uuid.uuid4().hex
+    now = timezone.now()
+
+    with write_atomic():
+        # Locked only while the new holds are checked and written.
+        locked = {
+            pk: (stock_no, quantity)
+            for pk, stock_no, quantity in Stock.objects.select_for_update().filter(pk__in=quantities)
+            .order_by('pk').values_list('pk', 'stock_no', 'quantity')
+        }
+        missing = set(quantities) - set(locked)
+        if missing:
+            raise Stock.DoesNotExist(f"Stock matching pk(s) {sorted(missing)} does not exist.")
+        held = lock_locations(quantities)
+        reserved = active_reservations(quantities, now)
+        short = []
+        for pk, quantity in quantities.items():
+            stock_no, total = locked[pk]
+            fits_total = total - sum(reserved.get(pk, {}).values()) >= quantity
+            fits_unit = available(total, held.get(pk, {}), reserved.get(pk, {}), unit) >= quantity
+            if not (fits_total and fits_unit):
+                short.append(stock_no)
+        if short:
+            raise InsufficientStock(f"Not enough unreserved stock for: {', '.join(sorted(short))}.")
+
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                hold=hold, stock_id=pk, unit_id=unit, quantity=quantity, created_by=user, created_at=now,
+                expires_at=now + timedelta(seconds=hold_seconds() if seconds is None else seconds),
+            )
+            for pk, quantity in sorted(quantities.items())
+        ])
+    return hold
+
+
+def release(hold):
+    """Give up a hold. Returns the number of lines released."""
+    deleted, _ = StockReservation.objects.filter(hold=hold).delete()
+    return deleted
+
+
+def sweep_expired(batch_size=SWEEP_BATCH_SIZE, now=None, progress=None):
+    """
+    Delete holds that lapsed before ``now``, oldest first, ``batch_size``
+    rows per DELETE. Lapsed holds already count for nothing; this only
+    reclaims their rows. Returns the number deleted.
+    """
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        batch = list(
+            StockReservation.objects.filter(expires_at__lte=now)
+            .order_by('expires_at', 'id').values_list('id', flat=True)[:batch_size]
+        )
+        if not batch:
+            return deleted
+        deleted += StockReservation.objects.filter(pk__in=batch).delete()[0]
+        if progress:
+            progress(deleted)
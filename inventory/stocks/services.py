@@ -0,0 +1,391 @@
+import json
+from collections import defaultdict
+from functools import partial, wraps
+
+from django.db import connections, router, transaction
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.utils import timezone
+
+from inventory.transactions import write_atomic
+from .models import Stock, StockConflict, StockLocation, StockMovement, StockReservation, TransferLine, TransferOrder
+from .signals import stocks_changed
+
+# Keeps each conditional UPDATE well below SQLite's expression depth limit.
+UPDATE_BATCH_SIZE = 500
+CONFLICT_ATTEMPTS = 3
+# Ledger rows are sent as one JSON array and unpacked by the database, so
+# record_movements() is a single INSERT however many stocks it covers.
+MOVEMENT_ROWS = {
+    'sqlite': (
+        "SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]'), "
+        "json_extract(value, '$[3]') FROM json_each(%s) ORDER BY key"
+    ),
+    'postgresql': (
+        "SELECT (value ->> 0)::integer, value ->> 1, (value ->> 2)::integer, (value ->> 3)::numeric "
+        "FROM jsonb_array_elements(%s::jsonb) WITH ORDINALITY AS element (value, key) ORDER BY key"
+    ),
+}
+
+
+class InsufficientStock(ValueError):
+    pass
+
+
+def record_movements(deltas, kind=None, reference='', unit=None, unit_costs=None):
+    """
+    Append one ledger row per stock. Without an explicit ``kind`` the sign
+    decides: negative changes are issues, positive ones returns. Positive
+    changes are costed from ``unit_costs`` (stock pk -> cost) when given.
+    Written in one INSERT, so issuing costs the same round trips at any size.
+    """
+    unit_costs = unit_costs or {}
+    rows = [
+        (
+            pk,
+            kind or (StockMovement.ISSUE if delta < 0 else StockMovement.RETURN),
+            delta,
+            str(unit_costs[pk]) if delta > 0 and unit_costs.get(pk) is not None else None,
+        )
+        for pk, delta in sorted(deltas.items())
+    ]
+    if not rows:
+        return
+    connection = connections[router.db_for_write(StockMovement)]
+    if connection.vendor not in MOVEMENT_ROWS:
+        StockMovement.objects.bulk_create([
+            StockMovement(stock_id=pk, kind=row_kind, quantity=delta, reference=reference, unit_id=unit, unit_cost=cost)
+            for pk, row_kind, delta, cost in rows
+        ])
+        return
+    created_at = StockMovement._meta.get_field('created_at').get_db_prep_value(timezone.now(), connection)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {StockMovement._meta.db_table} "
+            f"(stock_id, kind, quantity, unit_cost, reference, unit_id, created_at) "
+            f"SELECT *, %s, %s, %s FROM ({MOVEMENT_ROWS[connection.vendor]}) AS movement",
+            [reference, unit, created_at, json.dumps(rows)],
+        )
+
+
+def lock_locations(stock_ids):
+    """Lock the StockLocation rows of ``stock_ids``; returns ``{stock_id: {unit_id: quantity}}`` for located stocks."""
+    held = defaultdict(dict)
+    rows = (
+        StockLocation.objects.select_for_update()
+        .filter(stock_id__in=stock_ids)
+        .order_by('stock_id', 'unit_id')
+        .values_list('stock_id', 'unit_id', 'quantity')
+    )
+    for stock_id, unit_id, quantity in rows:
+        held[stock_id][unit_id] = quantity
+    return held
+
+
+def active_reservations(stock_ids, now=None):
+    """
+    ``{stock_id: {unit_id: quantity}}`` held by reservations that have not
+    lapsed, summed over reservation_active_idx.
+    """
+    reserved = defaultdict(dict)
+    rows = (
+        StockReservation.objects.filter(stock_id__in=stock_ids, expires_at__gt=now or timezone.now())
+        .values_list('stock_id', 'unit_id')
+        .annotate(total=Sum('quantity'))
+        .order_by()
+    )
+    for stock_id, unit_id, total in rows:
+        reserved[stock_id][unit_id] = total
+    return reserved
+
+
+def availability(total, held, reserved, unit=None, moving=False):
+    """
+    ``(on_hand, reserved)`` for taking a stock at ``unit``, given its total,
+    its location rows and its active reservations (both ``{unit_id:
+    quantity}``). A stock kept at locations counts what ``unit`` holds, or
+    what no location holds without one, and the reservations made there.
+    Other stocks count their total and all their reservations, but have
+    nothing at a unit when ``moving`` stock away from it.
+    """
+    if held:
+        return held.get(unit, 0) if unit is not None else total - sum(held.values()), reserved.get(unit, 0)
+    return 0 if moving and unit is not None else total, sum(reserved.values())
+
+
+def available(total, held, reserved, unit=None, moving=False):
+    """How much of a stock can be taken at ``unit``: see availability()."""
+    on_hand, held_back = availability(total, held, reserved, unit, moving)
+    return on_hand - held_back
+
+
+def change_locations(changes, held):
+    """
+    Apply ``{(stock_id, unit_id): delta}`` to the location rows, creating the
+    ones ``held`` lacks. Callers lock the stocks first and validate the result.
+    """
+    missing = [key for key in changes if key[1] not in held.get(key[0], {})]
+    StockLocation.objects.bulk_create([
+        StockLocation(stock_id=stock_id, unit_id=unit_id, quantity=changes[stock_id, unit_id])
+        for stock_id, unit_id in missing
+    ])
+    keys = sorted(set(changes) - set(missing))
+    for start in range(0, len(keys), UPDATE_BATCH_SIZE):
+        batch = keys[start:start + UPDATE_BATCH_SIZE]
+        match = Q()
+        for stock_id, unit_id in batch:
+            match |= Q(stock_id=stock_id, unit_id=unit_id)
+        StockLocation.objects.filter(match).update(
+            quantity=Case(
+                *[When(stock_id=stock_id, unit_id=unit_id, then=F('quantity') + Value(changes[stock_id, unit_id]))
+                  for stock_id, unit_id in batch],
+                default=F('quantity'),
+            )
+        )
+
+
+def apply_stock_deltas(deltas, kind=None, reference='', unit=None):
+    """
+    Apply signed quantity changes to many stocks at once.
+
+    ``deltas`` maps stock pk -> change (negative deducts, positive returns).
+    All affected rows are locked in pk order, validated in one pass and then
+    updated with a conditional ``F()`` expression, so a shortfall discovered by
+    a concurrent writer still aborts the whole transaction. Every change is
+    also appended to the StockMovement ledger.
+
+    Stocks kept at locations are also taken from (or returned to) ``unit``'s
+    StockLocation row, or their unassigned quantity when there is no unit.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    unit = getattr(unit, 'pk', unit)
+
+    with write_atomic(savepoint=False):
+        locked = (
+            Stock.objects.select_for_update()
+            .filter(pk__in=deltas)
+            .order_by('pk')
+            .values_list('pk', 'stock_no', 'quantity')
+        )
+        found = {}
+        for pk, stock_no, quantity in locked:
+            found[pk] = (stock_no, quantity)
+            if quantity + deltas[pk] < 0:
+                raise InsufficientStock(f"Stock quantity for '{stock_no}' cannot be negative or zero.")
+
+        missing = set(deltas) - set(found)
+        if missing:
+            raise Stock.DoesNotExist(f"Stock matching pk(s) {sorted(missing)} does not exist.")
+
+        # Quantity held by other people's reservations cannot be taken.
+        taken = [pk for pk, delta in deltas.items() if delta < 0]
+        reserved = active_reservations(taken) if taken else {}
+        for pk, by_unit in reserved.items():
+            stock_no, quantity = found[pk]
+            if quantity + deltas[pk] < sum(by_unit.values()):
+                raise InsufficientStock(f"Not enough unreserved '{stock_no}'.")
+
+        held = lock_locations(deltas)
+        for pk, at in held.items():
+            stock_no, quantity = found[pk]
+            if deltas[pk] < 0 and available(quantity, at, reserved.get(pk, {}), unit) + deltas[pk] < 0:
+                where = 'unassigned' if unit is None else f'at unit #{unit}'
+                raise InsufficientStock(f"Not enough '{stock_no}' {where}.")
+
+        pks = sorted(deltas)
+        now = timezone.now()
+        for start in range(0, len(pks), UPDATE_BATCH_SIZE):
+            batch = pks[start:start + UPDATE_BATCH_SIZE]
+            guard = Q()
+            for pk in batch:
+                if deltas[pk] < 0:
+                    guard |= Q(pk=pk, quantity__gte=-deltas[pk])
+                else:
+                    guard |= Q(pk=pk)
+            updated = Stock.objects.filter(guard).update(
+                quantity=Case(
+                    *[When(pk=pk, then=F('quantity') + Value(deltas[pk])) for pk in batch],
+                    default=F('quantity'),
+                ),
+                last_modified_date=now,
+                version=F('version') + 1,
+            )
+            if updated != len(batch):
+                raise InsufficientStock('Stock changed while the outbound was being issued.')
+
+        if unit is not None:
+            change_locations({(pk, unit): deltas[pk] for pk in held}, held)
+        record_movements(deltas, kind, reference, unit)
+        stocks_changed.send(sender=Stock, stock_ids=pks)
+
+
+def move_stock(quantities, from_unit=None, to_unit=None, reference='', located_only=False):
+    """
+    Move ``{stock pk: quantity}`` from one unit's balance to another's, where
+    None on either side is the unassigned quantity. Totals do not change; the
+    ledger gets a pair of transfer rows per stock. With ``located_only``
+    stocks not kept at any location are skipped. Returns the pks moved.
+    """
+    from_unit, to_unit = getattr(from_unit, 'pk', from_unit), getattr(to_unit, 'pk', to_unit)
+    if any(quantity <= 0 for quantity in quantities.values()):
+        raise ValueError('Transfer quantities must be greater than zero.')
+    if from_unit == to_unit or not quantities:
+        return []
+
+    with write_atomic(savepoint=False):
+        # Same lock order as apply_stock_deltas: stocks, then their locations.
+        locked = {
+            pk: (stock_no, quantity)
+            for pk, stock_no, quantity in Stock.objects.select_for_update().filter(pk__in=quantities)
+            .order_by('pk').values_list('pk', 'stock_no', 'quantity')
+        }
+        missing = set(quantities) - set(locked)
+        if missing:
+            raise Stock.DoesNotExist(f"Stock matching pk(s) {sorted(missing)} does not exist.")
+        held = lock_locations(quantities)
+        if located_only:
+            quantities = {pk: quantity for pk, quantity in quantities.items() if pk in held}
+        reserved = active_reservations(quantities)
+
+        changes = {}
+        for pk, quantity in quantities.items():
+            stock_no, total = locked[pk]
+            if available(total, held.get(pk, {}), reserved.get(pk, {}), from_unit, moving=True) < quantity:
+                where = 'unassigned' if from_unit is None else f'at unit #{from_unit}'
+                raise InsufficientStock(f"Not enough '{stock_no}' {where}.")
+            if from_unit is not None:
+                changes[pk, from_unit] = -quantity
+            if to_unit is not None:
+                changes[pk, to_unit] = quantity
+        change_locations(changes, held)
+        StockMovement.objects.bulk_create([
+            StockMovement(stock_id=pk, kind=StockMovement.TRANSFER, quantity=sign * quantity,
+                          reference=reference, unit_id=unit)
+            for pk, quantity in sorted(quantities.items())
+            for sign, unit in ((-1, from_unit), (1, to_unit))
+        ])
+    return sorted(quantities)
+
+
+def read_availability(totals, unit=None, moving=False):
+    """
+    ``{stock pk: (on_hand, reserved)}`` by availability() for ``{stock pk:
+    total}``, from the current location rows and reservations. Nothing is
+    locked; the services check again when they write.
+    """
+    unit = getattr(unit, 'pk', unit)
+    held = defaultdict(dict)
+    for stock_id, unit_id, quantity in (
+        StockLocation.objects.filter(stock_id__in=totals).values_list('stock_id', 'unit_id', 'quantity')
+    ):
+        held[stock_id][unit_id] = quantity
+    reserved = active_reservations(totals)
+    return {
+        pk: availability(total, held.get(pk, {}), reserved.get(pk, {}), unit, moving)
+        for pk, total in totals.items()
+    }
+
+
+def committed_quantities(stock_ids):
+    """
+    ``{stock pk: (located, reserved)}``: what the location rows hold and what
+    active reservations set aside. A stock's quantity may not drop below
+    either; apply_stock_deltas() refuses to. Nothing is locked.
+    """
+    located = dict(
+        StockLocation.objects.filter(stock_id__in=stock_ids).values_list('stock_id')
+        .annotate(total=Sum('quantity')).order_by()
+    )
+    reserved = active_reservations(stock_ids)
+    return {pk: (located.get(pk, 0), sum(reserved.get(pk, {}).values())) for pk in stock_ids}
+
+
+def quantity_errors(quantity, located, reserved):
+    """Why ``quantity`` cannot replace a stock's quantity, given committed_quantities()."""
+    errors = []
+    if quantity < located:
+        errors.append(f'Quantity cannot be less than the {located} held at locations.')
+    if quantity < reserved:
+        errors.append(f'Quantity cannot be less than the {reserved} reserved.')
+    return errors
+
+
+def unavailable(quantities, unit=None, moving=False):
+    """
+    Stock numbers among ``{stock pk: quantity}`` that ``unit`` (or the
+    unassigned quantity) holds too little of once active reservations are set
+    aside; with ``moving`` the quantities leave ``unit`` (see move_stock).
+    Nothing is locked; the services check again when they write.
+    """
+    stocks = {pk: (stock_no, total) for pk, stock_no, total in
+              Stock.objects.filter(pk__in=quantities).values_list('pk', 'stock_no', 'quantity')}
+    figures = read_availability({pk: total for pk, (stock_no, total) in stocks.items()}, unit, moving)
+    return sorted(
+        stocks[pk][0]
+        for pk, (on_hand, reserved) in figures.items()
+        if on_hand - reserved < quantities[pk]
+    )
+
+
+def execute_transfer(order, lines):
+    """Save ``lines`` (unsaved TransferLines) on a saved TransferOrder and move their stock."""
+    if order.from_unit_id == order.to_unit_id:
+        raise ValueError('Stock must be transferred between two different places.')
+    quantities = defaultdict(int)
+    for line in lines:
+        line.order = order
+        quantities[line.stock_id] += line.quantity
+    with transaction.atomic():
+        TransferLine.objects.bulk_create(lines)
+        move_stock(quantities, order.from_unit_id, order.to_unit_id, reference=order.reference)
+
+
+def transfer_stock(lines, from_unit=None, to_unit=None, user=None):
+    """
+    Record a TransferOrder for ``(stock or stock pk, quantity)`` lines and
+    move the stock, all or nothing. Returns the order.
+    """
+    with transaction.atomic():
+        order = TransferOrder.objects.create(
+            from_unit_id=getattr(from_unit, 'pk', from_unit), to_unit_id=getattr(to_unit, 'pk', to_unit),
+            created_by=user,
+        )
+        execute_transfer(order, [
+            TransferLine(stock_id=getattr(stock, 'pk', stock), quantity=quantity) for stock, quantity in lines
+        ])
+    return order
+
+
+def retry_on_conflict(func=None, attempts=CONFLICT_ATTEMPTS):
+    """
+    Call ``func`` again when it raises StockConflict, up to ``attempts``
+    calls in all. ``func`` must read the stocks it changes afresh each time.
+    """
+    if func is None:
+        return partial(retry_on_conflict, attempts=attempts)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, attempts + 1):
+            try:
+                return func(*args, **kwargs)
+            except StockConflict:
+                if attempt == attempts:
+                    raise
+    return wrapper
+
+
+def update_stock(pk, change, modified_by=None, attempts=CONFLICT_ATTEMPTS):
+    """
+    Read stock ``pk``, let ``change(stock)`` edit it and save the fields it
+    changed, starting over from a fresh read if someone else wrote the stock
+    in between. Returns the saved stock.
+    """
+    @retry_on_conflict(attempts=attempts)
+    def attempt():
+        stock = Stock.objects.get(pk=pk)
+        change(stock)
+        stock.save(modified_by=modified_by)
+        return stock
+    return attempt()
@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+# Sent with ``stock_ids`` after stocks were written by bulk_create() or a
+# queryset update, neither of which fires post_save.
+stocks_changed = Signal()
+
+# Sent with ``stock_ids`` when stocks fall to their reorder point, for
+# notifications; stocks already below it are not sent again.
+stocks_below_reorder = Signal()
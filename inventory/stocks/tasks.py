@@ -0,0 +1,53 @@
+import csv
+import io
+
+from jobs.models import job_storage
+from jobs.registry import task
+from .imports import IMPORT_BATCH_SIZE, import_stock, read_rows
+from .ledger import rebuild_balances
+from .reservations import sweep_expired
+from .valuation import value_stock
+
+
+def rejected_rows_csv(report):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['line', 'stock_no', 'errors'])
+    for line, stock_no, errors in report.rejected:
+        writer.writerow([line, stock_no, '; '.join(errors)])
+    if report.rejected_count > len(report.rejected):
+        writer.writerow(['', '', f'... and {report.rejected_count - len(report.rejected)} more rejected rows.'])
+    return buffer.getvalue()
+
+
+@task('stocks.import', label='Import stock')
+def import_stock_file(context, path, filename, batch_size=IMPORT_BATCH_SIZE):
+    """Import an upload the admin left in job storage; rejected rows become the job's result."""
+    storage = job_storage()
+    try:
+        with storage.open(path, 'rb') as upload:
+            report = import_stock(
+                read_rows(upload, filename), batch_size=batch_size, user=context.user,
+                reference=f'Import {filename}'[:100], progress=lambda report: context.progress(report.rows),
+            )
+    finally:
+        storage.delete(path)
+    if report.rejected_count:
+        context.save_result('rejected.csv', [rejected_rows_csv(report)])
+    return f'Imported {report.rows} rows: {report}.'
+
+
+@task('stocks.rebuild_balances', label='Rebuild stock balances from the ledger', maintenance=True)
+def rebuild_stock_balances(context):
+    count = rebuild_balances(progress=context.progress)
+    return f'Rebuilt balances of {count} stocks.'
+
+
+@task('stocks.sweep_reservations', label='Delete lapsed stock reservations', maintenance=True)
+def sweep_reservations(context):
+    return f'Deleted {sweep_expired(progress=context.progress)} lapsed reservations.'
+
+
+@task('stocks.value_stock', label='Value new stock movements (FIFO and average cost)', maintenance=True)
+def value_stock_movements(context):
+    return f'Valued {value_stock(progress=context.progress)} movements.'
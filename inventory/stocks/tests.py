@@ -1,3 +1,640 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils import timezone
+
+from caching import store as cache_store
+from jobs.models import Job
+from .imports import import_stock, read_rows
+from .ledger import rebuild_balances
+from profiles.models import Unit
+from .models import (
+    LedgerCheckpoint, MovementCost, Stock, StockBalance, StockConflict, StockLocation, StockMovement,
+    StockReservation, StockValuation, TransferOrder, ValuationCheckpoint,
+)
+from .reservations import release, reserve
+from .services import InsufficientStock, apply_stock_deltas, transfer_stock, update_stock
+from .signals import stocks_below_reorder
+from .valuation import value_stock
+
+
+def make_stock(stock_no='STK-1', quantity=100):
+    return Stock.objects.create(stock_no=stock_no, unit='pcs', description='', quantity=quantity)
+
+
+class StockLedgerTests(TestCase):
+
+    def test_every_change_is_recorded(self):
+        stock = make_stock()
+        apply_stock_deltas({stock.pk: -30}, reference='REF1')
+        apply_stock_deltas({stock.pk: 5})
+        stock.refresh_from_db()
+        stock.quantity = 80
+        stock.save()
+
+        movements = list(stock.movements.order_by('id').values_list('kind', 'quantity', 'reference'))
+        self.assertEqual(movements, [
+            (StockMovement.ADJUSTMENT, 100, ''),
+            (StockMovement.ISSUE, -30, 'REF1'),
+            (StockMovement.RETURN, 5, ''),
+            (StockMovement.ADJUSTMENT, 5, ''),
+        ])
+
+    def test_rebuild_repairs_drifted_quantities(self):
+        first, second = make_stock('STK-1'), make_stock('STK-2', quantity=10)
+        apply_stock_deltas({first.pk: -40, second.pk: -3})
+        Stock.objects.update(quantity=999)  # simulate a write that bypassed the ledger
+
+        self.assertEqual(rebuild_balances(batch_size=2), 2)
+
+        self.assertEqual(dict(Stock.objects.values_list('pk', 'quantity')), {first.pk: 60, second.pk: 7})
+        self.assertEqual(LedgerCheckpoint.current().movement_id, StockMovement.objects.latest('id').id)
+
+    def test_rebuild_continues_from_checkpoint(self):
+        first, second = make_stock('STK-1'), make_stock('STK-2')
+        rebuild_balances()
+        apply_stock_deltas({first.pk: -10})
+
+        with self.assertNumQueries(16):  # includes re-evaluating the reorder flag
+            self.assertEqual(rebuild_balances(), 1)
+
+        self.assertEqual(StockBalance.objects.get(stock=first).quantity, 90)
+        self.assertEqual(StockBalance.objects.get(stock=second).quantity, 100)
+
+    def test_rebuild_stops_at_the_committed_horizon(self):
+        stock = make_stock()
+        apply_stock_deltas({stock.pk: -10})
+        horizon = StockMovement.objects.latest('id').id
+        apply_stock_deltas({stock.pk: -5})  # as if still being committed
+
+        with mock.patch('stocks.ledger.ledger_horizon', return_value=horizon):
+            rebuild_balances()
+        self.assertEqual(LedgerCheckpoint.current().movement_id, horizon)
+        self.assertEqual(StockBalance.objects.get(stock=stock).quantity, 90)
+
+        rebuild_balances()
+        self.assertEqual(StockBalance.objects.get(stock=stock).quantity, 85)
+
+    def test_command_full_replay(self):
+        stock = make_stock()
+        apply_stock_deltas({stock.pk: -1})
+        StockBalance.objects.all().delete()
+
+        out = io.StringIO()
+
+        call_command('rebuild_balances', full=True, stdout=out)
+
+        self.assertIn('Recomputed balances for 1 stocks.', out.getvalue())
+        stock.refresh_from_db()
+        self.assertEqual(stock.quantity, 99)
+        self.assertEqual(StockBalance.objects.get(stock=stock).quantity, 99)
+
+
+class StockValuationTests(TestCase):
+
+    def setUp(self):
+        # Received 10 at 1.00, then 10 at 2.00.
+        self.stock = Stock.objects.create(stock_no='STK-1', unit='pcs', description='', quantity=10, unit_cost=1)
+        self.receive(10, 2)
+
+    def receive(self, quantity, unit_cost):
+        self.stock.refresh_from_db()
+        self.stock.quantity += quantity
+        self.stock.unit_cost = unit_cost
+        self.stock.save()
+
+    def issue_costs(self):
+        return list(
+            MovementCost.objects.filter(movement__kind=StockMovement.ISSUE).order_by('movement_id')
+            .values_list('fifo_value', 'average_value')
+        )
+
+    def test_issues_are_costed_by_fifo_and_moving_average(self):
+        apply_stock_deltas({self.stock.pk: -15}, reference='OUT-1')
+        self.receive(5, 3)
+        apply_stock_deltas({self.stock.pk: -8}, reference='OUT-2')
+
+        self.assertEqual(value_stock(batch_size=2), 5)
+
+        self.assertEqual(self.issue_costs(), [(Decimal('-20'), Decimal('-22.5')), (Decimal('-19'), Decimal('-18'))])
+        valuation = StockValuation.objects.get(stock=self.stock)
+        self.assertEqual((valuation.quantity, valuation.fifo_value, valuation.average_value, valuation.layers),
+                         (2, Decimal('6'), Decimal('4.5'), [[2, 3.0]]))
+        self.assertEqual(ValuationCheckpoint.current().movement_id, StockMovement.objects.latest('id').id)
+
+    def test_runs_continue_from_the_checkpoint(self):
+        apply_stock_deltas({self.stock.pk: -15})
+        value_stock()
+        apply_stock_deltas({self.stock.pk: 3})  # a return, valued at the stock's unit cost
+        apply_stock_deltas({self.stock.pk: -6})
+
+        with self.assertNumQueries(10):
+            self.assertEqual(value_stock(), 2)
+        incremental = self.issue_costs()
+
+        self.assertEqual(value_stock(full=True), 5)
+        self.assertEqual(self.issue_costs(), incremental)
+        self.assertEqual(incremental[-1], (Decimal('-12'), Decimal('-10.125')))
+
+    def test_month_report(self):
+        apply_stock_deltas({self.stock.pk: -4}, reference='OUT-1')
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'valuation.csv')
+        out = io.StringIO()
+
+        call_command('value_stock', '--month', f'{timezone.localdate():%Y-%m}', output=path, stdout=out)
+
+        self.assertIn('16 units on hand, worth 26.00 FIFO / 24.00 average; cost of stock issued 4.00 FIFO / '
+                      '6.00 average.', out.getvalue())
+        with open(path, encoding='utf-8') as report:
+            self.assertEqual(report.read().splitlines()[1], 'STK-1,16,26.00,24.00,4.00,6.00')
+
+
+def catalogue(rows, header='stock_no,name,unit,description,quantity'):
+    return io.BytesIO('\n'.join([header] + rows).encode())
+
+
+class StockImportTests(TestCase):
+
+    def test_upserts_by_stock_no_and_records_adjustments(self):
+        user = User.objects.create_user('clerk')
+        existing = make_stock('STK-1', quantity=100)
+        existing.save(modified_by=user)
+
+        report = import_stock(read_rows(catalogue([
+            'STK-1,Bolt,pcs,Hex bolt,40',
+            'STK-2,Nut,pcs,Hex nut,25',
+            'STK-3,Washer,,Flat washer,5',
+            'STK-4,Screw,pcs,Wood screw,-1',
+        ]), 'catalogue.csv'))
+
+        self.assertEqual((report.rows, report.created, report.updated, report.rejected_count), (4, 1, 1, 2))
+        self.assertEqual([(line, stock_no) for line, stock_no, errors in report.rejected], [(4, 'STK-3'), (5, 'STK-4')])
+        stocks = {stock.stock_no: stock for stock in Stock.objects.all()}
+        self.assertEqual((stocks['STK-1'].name, stocks['STK-1'].quantity), ('Bolt', 40))
+        self.assertEqual(stocks['STK-1'].modified_by, user)
+        self.assertEqual(stocks['STK-2'].quantity, 25)
+        self.assertEqual(
+            list(StockMovement.objects.filter(reference='Stock import').order_by('stock__stock_no').values_list('quantity', flat=True)),
+            [-60, 25],
+        )
+
+    def test_columns_missing_from_the_file_are_kept(self):
+        make_stock('STK-1', quantity=100)
+
+        import_stock(read_rows(catalogue(['STK-1,Bolt,pcs'], header='stock_no,name,unit'), 'catalogue.csv'))
+
+        stock = Stock.objects.get()
+        self.assertEqual((stock.name, stock.quantity), ('Bolt', 100))
+
+    def test_unit_cost_column_prices_what_is_received(self):
+        make_stock('STK-1', quantity=10)
+
+        import_stock(read_rows(catalogue(['STK-1,pcs,25,2.50', 'STK-2,pcs,5,'], header='stock_no,unit,quantity,unit_cost'),
+                               'catalogue.csv'))
+
+        self.assertEqual(
+            list(StockMovement.objects.filter(reference='Stock import').order_by('stock__stock_no')
+                 .values_list('quantity', 'unit_cost')),
+            [(15, Decimal('2.5')), (5, Decimal('0'))],
+        )
+
+    def test_imported_stocks_are_searchable(self):
+        make_stock('STK-1', quantity=10)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        import_stock(read_rows(catalogue(['WIDGET-001,Widget,pcs,Blue widget,4', 'STK-1,Sprocket,pcs,Sprocket,10']),
+                               'catalogue.csv'))
+
+        changelist = reverse('admin:stocks_stock_changelist')
+        self.assertContains(self.client.get(changelist, {'q': 'widget'}), 'WIDGET-001')
+        self.assertContains(self.client.get(changelist, {'q': 'sprocket'}), 'STK-1')
+
+    def test_query_count_depends_on_batches_not_rows(self):
+        rows = [f'STK-{i},Item,pcs,Item {i},{i + 1}' for i in range(55)]
+
+        with CaptureQueriesContext(connection) as small:
+            import_stock(read_rows(catalogue(rows[:5]), 'catalogue.csv'), batch_size=50)
+        with CaptureQueriesContext(connection) as large:
+            import_stock(read_rows(catalogue(rows[5:]), 'catalogue.csv'), batch_size=50)
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Stock.objects.count(), 55)
+
+    def test_xlsx_files(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        workbook.active.append(['Stock_No', 'Unit', 'Description', 'Quantity', 'Available'])
+        workbook.active.append(['STK-1', 'pcs', 'Hex bolt', 7, 'no'])
+        content = io.BytesIO()
+        workbook.save(content)
+        content.seek(0)
+
+        report = import_stock(read_rows(content, 'catalogue.xlsx'))
+
+        self.assertEqual(report.created, 1)
+        stock = Stock.objects.get()
+        self.assertEqual((stock.quantity, stock.available), (7, False))
+
+    def test_command(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        self.addCleanup(os.remove, path)
+        with os.fdopen(handle, 'wb') as output:
+            output.write(catalogue(['STK-1,Bolt,pcs,Hex bolt,3', 'STK-2,Nut,pcs,Hex nut,x']).getvalue())
+        out, err = io.StringIO(), io.StringIO()
+
+        call_command('import_stock', path, batch_size=1, stdout=out, stderr=err)
+
+        self.assertIn('1 created, 0 updated, 1 rejected', out.getvalue())
+        self.assertIn('Line 3 (STK-2): quantity:', err.getvalue())
+
+    def test_admin_upload(self):
+        self.enterContext(override_settings(JOB_RESULTS_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        changelist = self.client.get(reverse('admin:stocks_stock_changelist'))
+        self.assertContains(changelist, reverse('admin:stocks_stock_import'))
+        self.assertContains(self.client.get(reverse('admin:stocks_stock_import')), 'name="file"')
+        upload = SimpleUploadedFile('catalogue.csv', catalogue(['STK-1,Bolt,pcs,Hex bolt,3']).getvalue())
+
+        response = self.client.post(reverse('admin:stocks_stock_import'), {'file': upload, 'batch_size': 500})
+
+        job = Job.objects.get()
+        self.assertRedirects(response, reverse('admin:jobs_job_change', args=[job.pk]))
+        self.assertFalse(Stock.objects.exists())  # imported by a worker, not the request
+        call_command('run_workers', burst=True, concurrency=1, stdout=io.StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED, job.message)
+        self.assertEqual(Stock.objects.get().modified_by, user)
+        self.assertEqual(os.listdir(os.path.join(settings.JOB_RESULTS_ROOT, 'uploads')), [])
+
+
+class ReorderTests(TestCase):
+
+    def test_only_touched_stocks_are_re_evaluated(self):
+        low, stale = make_stock('STK-1', quantity=10), make_stock('STK-2', quantity=10)
+        Stock.objects.update(reorder_point=5)
+        received = []
+        stocks_below_reorder.connect(lambda sender, stock_ids, **kwargs: received.append(stock_ids),
+                                     dispatch_uid='test_reorder', weak=False)
+        self.addCleanup(stocks_below_reorder.disconnect, dispatch_uid='test_reorder')
+
+        apply_stock_deltas({low.pk: -5})
+        apply_stock_deltas({low.pk: -1})
+
+        self.assertEqual(dict(Stock.objects.values_list('stock_no', 'below_reorder')), {'STK-1': True, 'STK-2': False})
+        self.assertEqual(received, [[low.pk]])
+
+        stale.reorder_point = 10
+        stale.save()
+        self.assertTrue(Stock.objects.get(pk=stale.pk).below_reorder)
+        self.assertEqual(received, [[low.pk], [stale.pk]])
+
+    def test_at_risk_listing_uses_the_partial_index(self):
+        queryset = Stock.objects.filter(below_reorder=True).order_by('-last_modified_date', '-id')
+        self.assertIn('stock_below_reorder_idx', queryset.explain())
+
+
+class StockConcurrencyTests(TestCase):
+
+    def test_stale_copy_is_not_saved(self):
+        stock = make_stock()
+        first, second = Stock.objects.get(pk=stock.pk), Stock.objects.get(pk=stock.pk)
+        first.quantity = 90
+        first.save()
+        second.quantity = 80
+
+        with self.assertRaises(StockConflict):
+            second.save()
+
+        self.assertEqual(second.version, first.version - 1)
+        self.assertEqual(Stock.objects.get(pk=stock.pk).quantity, 90)
+        self.assertEqual(list(stock.movements.values_list('quantity', flat=True)), [100, -10])
+
+    def test_only_changed_fields_are_written(self):
+        stock = Stock.objects.get(pk=make_stock().pk)
+        stock.remarks = 'Shelf 4'
+
+        with CaptureQueriesContext(connection) as queries:
+            stock.save()
+
+        update = next(query['sql'] for query in queries if query['sql'].startswith('UPDATE'))
+        self.assertIn('"remarks"', update)
+        self.assertNotIn('"quantity"', update)
+        self.assertIn('"version" = 1', update)  # the version it was read at
+        self.assertEqual(Stock.objects.get(pk=stock.pk).version, 2)
+
+    def test_bulk_writes_invalidate_loaded_copies(self):
+        stock = Stock.objects.get(pk=make_stock().pk)
+        apply_stock_deltas({stock.pk: -5})
+        stock.name = 'Bolt'
+
+        with self.assertRaises(StockConflict):
+            stock.save()
+
+    def test_update_stock_retries_from_a_fresh_read(self):
+        stock = make_stock()
+        calls = []
+
+        def rename(copy):
+            calls.append(copy.quantity)
+            if len(calls) == 1:
+                apply_stock_deltas({stock.pk: -5})  # someone issues stock meanwhile
+            copy.name = 'Bolt'
+
+        update_stock(stock.pk, rename)
+
+        self.assertEqual(calls, [100, 95])
+        self.assertEqual(Stock.objects.filter(pk=stock.pk).values_list('name', 'quantity').get(), ('Bolt', 95))
+
+    def test_admin_reports_edits_made_meanwhile(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        stock = make_stock()
+        url = reverse('admin:stocks_stock_change', args=[stock.pk])
+        self.assertContains(self.client.get(url), 'name="loaded_version" value="1"')
+        apply_stock_deltas({stock.pk: -5})
+
+        response = self.client.post(url, {
+            'stock_no': 'STK-1', 'unit': 'pcs', 'description': 'Edited', 'quantity': 100,
+            'safety_stock': 0, 'lead_time_days': 7, 'loaded_version': 1,
+        })
+
+        self.assertContains(response, 'Someone else changed this stock')
+        self.assertEqual(Stock.objects.filter(pk=stock.pk).values_list('description', 'quantity').get(), ('', 95))
+
+
+class StockLocationTests(TestCase):
+
+    def setUp(self):
+        self.stock = make_stock()
+        self.north, self.south = Unit.objects.create(name='North'), Unit.objects.create(name='South')
+
+    def balances(self):
+        return dict(StockLocation.objects.filter(stock=self.stock).values_list('unit__name', 'quantity'))
+
+    def test_transfers_move_stock_between_units(self):
+        transfer_stock([(self.stock, 30)], to_unit=self.north)
+        order = transfer_stock([(self.stock, 10)], from_unit=self.north, to_unit=self.south)
+
+        self.assertEqual(self.balances(), {'North': 20, 'South': 10})
+        self.assertEqual(list(order.lines.values_list('stock', 'quantity')), [(self.stock.pk, 10)])
+        self.assertEqual(
+            list(StockMovement.objects.filter(reference=order.reference).values_list('unit__name', 'quantity')),
+            [('North', -10), ('South', 10)],
+        )
+        # Totals do not move, so the ledger still replays to the same quantity.
+        rebuild_balances(full=True)
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).quantity, 100)
+
+    def test_short_transfer_changes_nothing(self):
+        transfer_stock([(self.stock, 30)], to_unit=self.north)
+
+        with self.assertRaisesMessage(InsufficientStock, f"Not enough 'STK-1' at unit #{self.north.pk}."):
+            transfer_stock([(self.stock, 31)], from_unit=self.north, to_unit=self.south)
+        with self.assertRaisesMessage(InsufficientStock, "Not enough 'STK-1' unassigned."):
+            transfer_stock([(self.stock, 71)], to_unit=self.south)
+
+        self.assertEqual(self.balances(), {'North': 30})
+        self.assertEqual(TransferOrder.objects.count(), 1)
+
+    def test_deltas_follow_the_unit(self):
+        transfer_stock([(self.stock, 30)], to_unit=self.north)
+
+        apply_stock_deltas({self.stock.pk: -5}, unit=self.north)
+        apply_stock_deltas({self.stock.pk: 2}, unit=self.south)
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            apply_stock_deltas({self.stock.pk: -3}, unit=self.south)
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            apply_stock_deltas({self.stock.pk: -71})  # only 70 are unassigned
+
+        self.assertEqual(self.balances(), {'North': 25, 'South': 2})
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).quantity, 97)
+
+    def test_per_site_lookups_use_the_index(self):
+        # Served by the unique (unit, stock) index; SQLite gives it its own name.
+        self.assertRegex(StockLocation.objects.filter(unit=self.north).explain(), r'(?i)\bindex\b')
+
+    def test_transfer_from_the_admin(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        url = reverse('admin:stocks_transferorder_add')
+        data = {
+            'to_unit': self.north.pk,
+            'lines-TOTAL_FORMS': 1, 'lines-INITIAL_FORMS': 0,
+            'lines-0-stock': self.stock.pk, 'lines-0-quantity': 101,
+        }
+
+        self.assertContains(self.client.post(url, data), 'Not enough stock to transfer for: STK-1.')
+        self.client.post(url, {**data, 'lines-0-quantity': 40})
+
+        order = TransferOrder.objects.get()
+        self.assertEqual(order.created_by.username, 'admin')
+        self.assertEqual(self.balances(), {'North': 40})
+        self.assertContains(self.client.get(reverse('admin:stocks_stock_change', args=[self.stock.pk])), 'North')
+
+    def test_availability_at_a_unit(self):
+        make_stock('STK-2', quantity=8)  # not kept at locations
+        transfer_stock([(self.stock, 30)], to_unit=self.north)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        response = self.client.get(reverse('api-stock-availability'), {'lines': 'STK-1:5,STK-2:5', 'unit': self.south.pk})
+
+        self.assertEqual([(line['stock_no'], line['on_hand']) for line in response.json()['lines']],
+                         [('STK-1', 0), ('STK-2', 8)])
+        response = self.client.get(reverse('api-stock-availability'), {'lines': 'STK-1:5', 'unit': self.north.pk})
+        self.assertTrue(response.json()['available'])
+
+    def test_availability_without_a_unit_counts_the_unassigned_quantity(self):
+        transfer_stock([(self.stock, 30)], to_unit=self.north)
+        reserve([(self.stock, 4)], unit=self.north)
+        reserve([(self.stock, 65)])
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        response = self.client.get(reverse('api-stock-availability'), {'lines': 'STK-1:6'})
+
+        [line] = response.json()['lines']
+        self.assertEqual((line['on_hand'], line['reserved'], line['short']), (70, 65, 1))
+        with self.assertRaises(InsufficientStock), transaction.atomic():
+            apply_stock_deltas({self.stock.pk: -6})
+        apply_stock_deltas({self.stock.pk: -5})
+
+
+    def test_quantity_cannot_drop_below_what_is_committed(self):
+        transfer_stock([(self.stock, 30)], to_unit=self.north)
+        reserve([(self.stock, 40)])
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        response = self.client.post(reverse('admin:stocks_stock_change', args=[self.stock.pk]), {
+            'stock_no': 'STK-1', 'unit': 'pcs', 'quantity': 20, 'safety_stock': 0, 'lead_time_days': 7,
+            'unit_cost': 0, 'last_modified_date_0': '2024-01-01', 'last_modified_date_1': '00:00:00',
+            'locations-TOTAL_FORMS': 1, 'locations-INITIAL_FORMS': 1,
+            'locations-0-id': StockLocation.objects.get().pk, 'locations-0-stock': self.stock.pk,
+        })
+        self.assertContains(response, 'Quantity cannot be less than the 30 held at locations.')
+        self.assertContains(response, 'Quantity cannot be less than the 40 reserved.')
+
+        report = import_stock(read_rows(catalogue(['STK-1,Bolt,pcs,Hex bolt,35', 'STK-2,Nut,pcs,Hex nut,5']),
+                                        'catalogue.csv'))
+        self.assertEqual((report.created, report.updated), (1, 0))
+        self.assertEqual(report.rejected, [(2, 'STK-1', ['Quantity cannot be less than the 40 reserved.'])])
+        self.assertEqual(Stock.objects.get(pk=self.stock.pk).quantity, 100)
+
+class StockReservationTests(TestCase):
+
+    def setUp(self):
+        self.stock = make_stock(quantity=10)
+
+    def test_holds_count_against_other_issuers(self):
+        hold = reserve([(self.stock, 6)])
+
+        with self.assertRaisesMessage(InsufficientStock, 'Not enough unreserved stock for: STK-1.'):
+            reserve([(self.stock, 5)])
+        with self.assertRaisesMessage(InsufficientStock, "Not enough unreserved 'STK-1'."), transaction.atomic():
+            apply_stock_deltas({self.stock.pk: -5})
+        apply_stock_deltas({self.stock.pk: -4})
+
+        self.assertEqual(release(hold), 1)
+        reserve([(self.stock, 6)])
+
+    def test_holds_at_a_unit_only_count_there(self):
+        north, south = Unit.objects.create(name='North'), Unit.objects.create(name='South')
+        transfer_stock([(self.stock, 5)], to_unit=north)
+        transfer_stock([(self.stock, 5)], to_unit=south)
+        reserve([(self.stock, 5)], unit=north)
+
+        with self.assertRaises(InsufficientStock):
+            transfer_stock([(self.stock, 1)], from_unit=north, to_unit=south)
+        apply_stock_deltas({self.stock.pk: -5}, unit=south)
+
+    def test_lapsed_holds_are_swept_in_batches(self):
+        for _ in range(3):
+            reserve([(self.stock, 3)], seconds=0)  # lapses at once
+        active = reserve([(self.stock, 10)])
+        out = io.StringIO()
+
+        call_command('sweep_reservations', batch_size=2, stdout=out)
+
+        self.assertIn('Deleted 3 lapsed reservations.', out.getvalue())
+        self.assertEqual(list(StockReservation.objects.values_list('hold', flat=True)), [active])
+
+    def test_active_quantity_is_read_from_the_index(self):
+        explained = (StockReservation.objects.filter(stock=self.stock, expires_at__gt=timezone.now())
+                     .values('stock').annotate(total=Sum('quantity')).explain())
+        self.assertIn('reservation_active_idx', explained)
+
+    def test_availability_sets_held_stock_aside(self):
+        reserve([(self.stock, 6)])
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+        response = self.client.get(reverse('api-stock-availability'), {'lines': 'STK-1:5'})
+
+        [line] = response.json()['lines']
+        self.assertEqual((line['on_hand'], line['reserved'], line['short']), (10, 6, 1))
+
+
+class StockAPITests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(self.user)
+        cache_store.clear()
+
+    def test_cursor_pages_and_sparse_fields(self):
+        for i in range(5):
+            make_stock(f'STK-{i}')
+        url = reverse('api-stock-list')
+
+        first = self.client.get(url, {'limit': 3, 'fields': 'stock_no'}).json()
+        second = self.client.get(first['next']).json()
+
+        self.assertEqual(first['results'][0], {'id': Stock.objects.get(stock_no='STK-0').pk, 'stock_no': 'STK-0'})
+        self.assertEqual([row['stock_no'] for row in first['results'] + second['results']],
+                         [f'STK-{i}' for i in range(5)])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(url, {'fields': 'price'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'cursor': 'nonsense'}).status_code, 400)
+
+    def test_list_revalidates_with_etag(self):
+        stock = make_stock('STK-1')
+        url = reverse('api-stock-list')
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(3):  # session, user, page fingerprint
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        apply_stock_deltas({stock.pk: -1})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_revalidates_from_the_cache(self):
+        stock = make_stock('STK-1')
+        url = reverse('api-stock-detail', args=[stock.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.json()['quantity'], 100)
+        self.assertIn('Last-Modified', response)
+
+        with self.assertNumQueries(2):  # session, user
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        stock.quantity = 90
+        stock.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((changed.status_code, changed.json()['quantity']), (200, 90))
+        self.assertEqual(self.client.get(reverse('api-stock-detail', args=[stock.pk + 1])).status_code, 404)
+
+    def test_basic_auth_and_permissions(self):
+        self.client.logout()
+        url = reverse('api-stock-list')
+        User.objects.create_user('clerk', password='secret')
+
+        self.assertEqual(self.client.get(url).status_code, 401)
+        credentials = 'Basic ' + base64.b64encode(b'admin:password').decode()
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=credentials).status_code, 200)
+        credentials = 'Basic ' + base64.b64encode(b'clerk:secret').decode()
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=credentials).status_code, 403)
+
+    def test_only_requests_with_credentials_skip_the_csrf_check(self):
+        make_stock(quantity=10)
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        url, body = reverse('api-reservation-create'), json.dumps({'lines': [{'stock_no': 'STK-1', 'quantity': 1}]})
+
+        self.assertEqual(client.post(url, body, content_type='application/json').status_code, 403)
+        credentials = 'Basic ' + base64.b64encode(b'admin:password').decode()
+        response = client.post(url, body, content_type='application/json', HTTP_AUTHORIZATION=credentials)
+        self.assertEqual(response.status_code, 201)
+        # A header that does not authenticate is not made up for by the session.
+        self.assertEqual(client.get(reverse('api-stock-list'), HTTP_AUTHORIZATION='Bearer x').status_code, 401)
+
+    async def test_async_lookup_and_availability(self):
+        await Stock.objects.abulk_create([
+            Stock(stock_no='STK-1', unit='pcs', description='', quantity=5),
+            Stock(stock_no='STK-2', unit='pcs', description='', quantity=0),
+        ])
+        await self.async_client.aforce_login(self.user)
+
+        single = await self.async_client.get(reverse('api-stock-lookup'), {'stock_no': 'STK-1', 'fields': 'quantity'})
+        many = await self.async_client.get(reverse('api-stock-lookup'), {'stock_no': 'STK-2,STK-1', 'fields': 'stock_no'})
+        missing = await self.async_client.get(reverse('api-stock-lookup'), {'stock_no': 'STK-9'})
+        self.assertEqual(single.json()['quantity'], 5)
+        self.assertEqual([row['stock_no'] for row in many.json()['results']], ['STK-1', 'STK-2'])
+        self.assertEqual(missing.status_code, 404)
+
+        response = await self.async_client.get(reverse('api-stock-availability'), {'lines': 'STK-1:3,STK-1:3,STK-9:1'})
+        body = response.json()
+        self.assertFalse(body['available'])
+        self.assertEqual([(line['stock_no'], line['short'], line['known']) for line in body['lines']],
+                         [('STK-1', 1, True), ('STK-9', 1, False)])
@@ -0,0 +1,207 @@
+"""
+Inventory valuation by FIFO and by moving weighted average.
+
+The ledger is valued from ValuationCheckpoint onwards, one movement id range
+per transaction. A range is read in a single query ordered by stock, and each
+stock's movements are valued as arrays rather than row by row: running
+totals come from ``accumulate`` and every FIFO issue is priced by bisecting
+the cumulative quantity of the layers put back before it. The value change
+of each movement is appended to MovementCost, and each stock's closing
+quantity, values and open FIFO layers are kept in StockValuation for the
+next run to start from.
+
+Stock put back is valued at the movement's unit_cost, or at the stock's
+unit_cost when it has none (returns, and movements that predate costing).
+Taking out more than was put back is costed at the stock's unit_cost too.
+Transfers only move stock between units and are skipped.
+"""
+import csv
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate, groupby
+
+from django.db import connections, router, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .ledger import chunked, ledger_horizon
+from .models import MovementCost, Stock, StockMovement, StockValuation, ValuationCheckpoint
+
+VALUATION_BATCH_SIZE = 100000  # movements per transaction
+INSERT_BATCH_SIZE = 1000  # rows; keeps SQLite under its bound-parameter limit
+# Movements made by issuing, editing and reversing outbounds.
+OUTBOUND_KINDS = (StockMovement.ISSUE, StockMovement.RETURN, StockMovement.REVERSAL)
+
+
+def value_stock_movements(quantities, unit_costs, layers=(), quantity=0, average_value=0.0, default_cost=0.0):
+    """
+    Value one stock's signed movement ``quantities`` in ledger order;
+    ``unit_costs`` prices the positive ones. ``layers``, ``quantity`` and
+    ``average_value`` are the stock's state before them. Returns the FIFO
+    and average value change of every movement, and the state after them
+    as ``(layers, quantity, average_value)``.
+    """
+    # FIFO: the open layers and everything put back form one cumulative
+    # (quantity, value) curve; an issue costs the stretch of it between the
+    # units taken out before it and those taken out with it.
+    layer_quantities = array('d', [layer[0] for layer in layers])
+    layer_costs = array('d', [layer[1] for layer in layers])
+    for change, unit_cost in zip(quantities, unit_costs):
+        if change > 0:
+            layer_quantities.append(change)
+            layer_costs.append(unit_cost)
+    taken = array('d', accumulate((-change if change < 0 else 0 for change in quantities), initial=0))
+    put = array('d', accumulate(layer_quantities, initial=0))
+    if taken[-1] > put[-1]:
+        layer_quantities.append(taken[-1] - put[-1])
+        layer_costs.append(default_cost)
+        put.append(taken[-1])
+    worth = array('d', accumulate((q * c for q, c in zip(layer_quantities, layer_costs)), initial=0))
+
+    def cost_of_first(units):
+        # Value of the first ``units`` units on the curve.
+        index = bisect_left(put, units)
+        if put[index] == units:
+            return worth[index]
+        return worth[index - 1] + (units - put[index - 1]) * layer_costs[index - 1]
+
+    at = array('d', map(cost_of_first, taken))
+    fifo = [
+        at[index] - at[index + 1] if change < 0 else change * unit_cost
+        for index, (change, unit_cost) in enumerate(zip(quantities, unit_costs))
+    ]
+    first = bisect_right(put, taken[-1]) - 1
+    remaining = [[int(put[first + 1] - taken[-1]), layer_costs[first]]] if first + 1 < len(put) else []
+    remaining += [[int(q), c] for q, c in zip(layer_quantities[first + 1:], layer_costs[first + 1:])]
+    remaining = [layer for layer in remaining if layer[0]]
+
+    # Moving average: an issue is costed at the average of what is held.
+    average = []
+    for change, unit_cost in zip(quantities, unit_costs):
+        if change > 0:
+            value = change * unit_cost
+        else:
+            value = change * (average_value / quantity if quantity > 0 else default_cost)
+        average.append(value)
+        quantity += change
+        average_value = average_value + value if quantity else 0.0
+    return fifo, average, (remaining, quantity, average_value)
+
+
+def value_movements(start_id, end_id):
+    """
+    Value the movements with ``start_id < id <= end_id`` and move the
+    checkpoint to ``end_id``. Returns the number of movements valued.
+    """
+    rows = (
+        StockMovement.objects.filter(id__gt=start_id, id__lte=end_id)
+        .exclude(kind=StockMovement.TRANSFER)
+        .order_by('stock_id', 'id')
+        .values_list('stock_id', 'id', 'quantity', 'unit_cost')
+    )
+    movements = {
+        stock_id: list(stock_rows) for stock_id, stock_rows in groupby(rows, key=lambda row: row[0])
+    }
+    states, default_costs = {}, {}
+    for batch in chunked(movements):
+        for stock_id, layers, quantity, average_value in (
+            StockValuation.objects.filter(stock_id__in=batch)
+            .values_list('stock_id', 'layers', 'quantity', 'average_value')
+        ):
+            states[stock_id] = (layers, quantity, float(average_value))
+        default_costs.update(Stock.objects.filter(pk__in=batch).values_list('pk', 'unit_cost'))
+
+    costs, valuations = [], []
+    for stock_id, stock_rows in movements.items():
+        default_cost = float(default_costs.get(stock_id) or 0)
+        layers, quantity, average_value = states.get(stock_id, ([], 0, 0.0))
+        quantities = [row[2] for row in stock_rows]
+        unit_costs = [default_cost if row[3] is None else float(row[3]) for row in stock_rows]
+        fifo, average, (layers, quantity, average_value) = value_stock_movements(
+            quantities, unit_costs, layers, quantity, average_value, default_cost,
+        )
+        # The column's four decimal places round them.
+        costs += zip([row[1] for row in stock_rows], fifo, average)
+        valuations.append(StockValuation(
+            stock_id=stock_id, quantity=quantity, layers=layers,
+            fifo_value=round(sum(q * c for q, c in layers), 4), average_value=round(average_value, 4),
+        ))
+
+    with transaction.atomic():
+        insert_costs(costs)
+        StockValuation.objects.bulk_create(
+            valuations, batch_size=INSERT_BATCH_SIZE, update_conflicts=True, unique_fields=['stock'],
+            update_fields=['quantity', 'fifo_value', 'average_value', 'layers'],
+        )
+        ValuationCheckpoint.objects.filter(pk=1).update(movement_id=end_id, updated_at=timezone.now())
+    return len(costs)
+
+
+def insert_costs(rows):
+    """Append ``(movement_id, fifo_value, average_value)`` rows to MovementCost, one statement per batch."""
+    table = MovementCost._meta.db_table
+    connection = connections[router.db_for_write(MovementCost)]
+    # bulk_create builds a model instance per row; at a few million rows a month that is most of the run.
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            batch = rows[start:start + INSERT_BATCH_SIZE]
+            cursor.execute(
+                f"INSERT INTO {table} (movement_id, fifo_value, average_value) "
+                f"VALUES {', '.join(['(%s, %s, %s)'] * len(batch))}",
+                [value for row in batch for value in row],
+            )
+
+
+def value_stock(batch_size=VALUATION_BATCH_SIZE, full=False, progress=None):
+    """
+    Value the ledger from the last checkpoint (or from the start with
+    ``full``) in id-range batches. Returns the number of movements valued.
+    """
+    checkpoint = ValuationCheckpoint.current()
+    if full:
+        with transaction.atomic():
+            MovementCost.objects.all().delete()
+            StockValuation.objects.all().delete()
+            ValuationCheckpoint.objects.filter(pk=1).update(movement_id=0, updated_at=timezone.now())
+        checkpoint.movement_id = 0
+
+    last_id = ledger_horizon()
+    valued = 0
+    position = checkpoint.movement_id
+    while position < last_id:
+        end_id = min(position + batch_size, last_id)
+        valued += value_movements(position, end_id)
+        position = end_id
+        if progress:
+            progress(position, last_id)
+    return valued
+
+
+def valuation_report(start, end):
+    """
+    Per stock, the quantity on hand and its value by each method at ``end``,
+    and the net cost of stock issued through outbounds in ``[start, end)``.
+    Read from MovementCost only, so run value_stock() first.
+    """
+    issued = Q(movement__kind__in=OUTBOUND_KINDS, movement__created_at__gte=start)
+    return list(
+        MovementCost.objects.filter(movement__created_at__lt=end)
+        .values('movement__stock_id', 'movement__stock__stock_no')
+        .annotate(
+            quantity=Sum('movement__quantity'),
+            fifo=Sum('fifo_value'),
+            average=Sum('average_value'),
+            fifo_issued=Sum('fifo_value', filter=issued),
+            average_issued=Sum('average_value', filter=issued),
+        )
+        .order_by('movement__stock__stock_no')
+    )
+
+
+def write_report(rows, file):
+    """Write valuation_report() rows as CSV, with costs issued as positive amounts."""
+    writer = csv.writer(file)
+    writer.writerow(['stock_no', 'quantity', 'fifo_value', 'average_value', 'fifo_cost_issued', 'average_cost_issued'])
+    for row in rows:
+        values = (row['fifo'], row['average'], 0 - (row['fifo_issued'] or 0), 0 - (row['average_issued'] or 0))
+        writer.writerow([row['movement__stock__stock_no'], row['quantity'], *(f'{value:.2f}' for value in values)])
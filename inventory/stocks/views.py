@@ -1,7 +1,208 @@
+from asgiref.sync import sync_to_async
+from django.db.models import Count, Max, Sum
+from django.http import JsonResponse
 from django.shortcuts import render
+from django.utils.dateparse import parse_datetime
+
+from caching.store import get_object
+from inventory.api import (
+    APIError, CursorPage, afetch_values, api_view, fetch_values, make_etag, not_modified, read_json, select_fields,
+    set_validators,
+)
+from profiles.models import Unit
+from .models import Stock, StockReservation
+from .reservations import release, reserve
+from .services import InsufficientStock, read_availability
+
+# API field name -> ORM path
+STOCK_FIELDS = {
+    'id': 'id',
+    'stock_no': 'stock_no',
+    'name': 'name',
+    'unit': 'unit',
+    'description': 'description',
+    'quantity': 'quantity',
+    'available': 'available',
+    'remarks': 'remarks',
+    'last_modified_date': 'last_modified_date',
+    'modified_by': 'modified_by__username',
+    'reorder_point': 'reorder_point',
+    'safety_stock': 'safety_stock',
+    'daily_demand': 'daily_demand',
+    'below_reorder': 'below_reorder',
+}
+
+# Stock numbers accepted by one lookup or availability request.
+MAX_LOOKUP = 500
 
-# Create your views here.
-from django.shortcuts import render
 
 def stock_master(request):
     return render(request, 'outbound/outbound.html')  # Renders the base template
+
+
+def filter_stocks(request):
+    queryset = Stock.objects.all()
+    if request.GET.get('stock_no'):
+        queryset = queryset.filter(stock_no__in=request.GET['stock_no'].split(','))
+    if request.GET.get('available') in ('true', 'false'):
+        queryset = queryset.filter(available=request.GET['available'] == 'true')
+    if request.GET.get('below_reorder') in ('true', 'false'):
+        queryset = queryset.filter(below_reorder=request.GET['below_reorder'] == 'true')
+    if request.GET.get('modified_since'):
+        since = parse_datetime(request.GET['modified_since'])
+        if since is None:
+            raise APIError('modified_since must be an ISO 8601 date and time.')
+        queryset = queryset.filter(last_modified_date__gt=since)
+    return queryset
+
+
+@api_view(permission='stocks.view_stock')
+def stock_list(request):
+    fields = select_fields(request, STOCK_FIELDS)
+    page = CursorPage(request, filter_stocks(request))
+
+    # A page changes when a row in it is modified, added or removed. Rows can
+    # be deleted without a timestamp moving, so lists only carry an ETag.
+    state = page.queryset.aggregate(last=Max('last_modified_date'), rows=Count('pk'), ids=Sum('pk'))
+    etag = make_etag(fields, state['last'], state['rows'], state['ids'])
+    response = not_modified(request, etag)
+    if response is None:
+        response = set_validators(JsonResponse(page.paginate(fetch_values(page.queryset, fields, STOCK_FIELDS))), etag)
+    return response
+
+
+@api_view(permission='stocks.view_stock')
+def stock_detail(request, pk):
+    fields = select_fields(request, STOCK_FIELDS)
+    # Revalidation is answered from the cache; only a changed stock is read.
+    stock = get_object(Stock, pk)
+    if stock is None:
+        raise APIError('Stock not found.', 404)
+
+    etag = make_etag(fields, stock.pk, stock.quantity, stock.last_modified_date)
+    response = not_modified(request, etag, stock.last_modified_date)
+    if response is None:
+        rows = fetch_values(Stock.objects.filter(pk=stock.pk), fields, STOCK_FIELDS)
+        if not rows:
+            raise APIError('Stock not found.', 404)
+        response = set_validators(JsonResponse(rows[0]), etag, stock.last_modified_date)
+    return response
+
+
+def split_stock_nos(value):
+    numbers = list(dict.fromkeys(number.strip() for number in value.split(',') if number.strip()))
+    if not numbers:
+        raise APIError('Give at least one stock number.')
+    if len(numbers) > MAX_LOOKUP:
+        raise APIError(f'At most {MAX_LOOKUP} stock numbers per request.')
+    return numbers
+
+
+@api_view(permission='stocks.view_stock')
+async def stock_lookup(request):
+    """Stocks by number (``?stock_no=A,B``), for scanners; a single number answers with the stock itself."""
+    fields = select_fields(request, STOCK_FIELDS)
+    numbers = split_stock_nos(request.GET.get('stock_no', ''))
+    queryset = Stock.objects.filter(stock_no__in=numbers)
+    if len(numbers) == 1:
+        columns = [STOCK_FIELDS[name] for name in fields]
+        try:
+            row = await queryset.values_list(*columns).aget()
+        except Stock.DoesNotExist:
+            raise APIError('Stock not found.', 404)
+        return JsonResponse(dict(zip(fields, row)))
+    return JsonResponse({'results': await afetch_values(queryset.order_by('stock_no'), fields, STOCK_FIELDS)})
+
+
+@api_view(permission='stocks.view_stock')
+async def stock_availability(request):
+    """
+    Whether ``?lines=STK-1:5,STK-2:3`` could be issued now, optionally at
+    ``?unit=<id>``: what is on hand less what active reservations hold. The
+    answer can change before an outbound is recorded; reserve the stock to
+    be sure of it.
+    """
+    requested = {}
+    for line in request.GET.get('lines', '').split(','):
+        stock_no, _, quantity = line.strip().rpartition(':')
+        if not stock_no or not quantity.isdigit() or int(quantity) <= 0:
+            raise APIError('lines must look like STK-1:5,STK-2:3 with quantities above zero.')
+        requested[stock_no] = requested.get(stock_no, 0) + int(quantity)
+    split_stock_nos(','.join(requested))  # enforces MAX_LOOKUP
+
+    unit = request.GET.get('unit')
+    if unit and not unit.isdigit():
+        raise APIError('unit must be a unit id.')
+    stocks = {
+        row['pk']: row async for row in
+        Stock.objects.filter(stock_no__in=requested, available=True).values('pk', 'stock_no', 'quantity').aiterator()
+    }
+    # The rule the services apply when they write; nothing is locked.
+    figures = await sync_to_async(read_availability)(
+        {pk: row['quantity'] for pk, row in stocks.items()}, int(unit) if unit else None,
+    )
+    found = {row['stock_no']: dict(zip(('on_hand', 'reserved'), figures[pk])) for pk, row in stocks.items()}
+    lines = []
+    for stock_no, quantity in requested.items():
+        row = found.get(stock_no, {'on_hand': 0, 'reserved': 0})
+        lines.append({
+            'stock_no': stock_no,
+            'requested': quantity,
+            'on_hand': row['on_hand'],
+            'reserved': row['reserved'],
+            'short': max(quantity - row['on_hand'] + row['reserved'], 0),
+            'known': stock_no in found,
+        })
+    return JsonResponse({'available': not any(line['short'] for line in lines), 'lines': lines})
+
+
+@api_view(methods=('POST',), permission='stocks.add_stockreservation')
+def reservation_create(request):
+    """
+    Hold stock for a checkout, given ``{"lines": [{"stock_no": "STK-1",
+    "quantity": 5}], "unit": 1}``. Answers with the hold id to confirm or
+    release and the time it lapses.
+    """
+    payload = read_json(request)
+    lines = payload.get('lines') if isinstance(payload, dict) else None
+    if not isinstance(lines, list) or not lines:
+        raise APIError('Expected {"lines": [...]} with at least one line.')
+    if len(lines) > MAX_LOOKUP:
+        raise APIError(f'At most {MAX_LOOKUP} lines per reservation.')
+
+    numbers = [line.get('stock_no') for line in lines if isinstance(line, dict)]
+    stock_pks = dict(
+        Stock.objects.filter(stock_no__in=[n for n in numbers if isinstance(n, str)]).values_list('stock_no', 'pk')
+    )
+    errors, parsed = {}, []
+    for number, line in enumerate(lines):
+        at = f'lines[{number}]'
+        if not isinstance(line, dict):
+            errors[at] = 'Each line must be an object.'
+            continue
+        if stock_pks.get(line.get('stock_no')) is None:
+            errors[f'{at}.stock_no'] = f"Unknown stock_no {line.get('stock_no')!r}."
+        quantity = line.get('quantity')
+        if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity <= 0:
+            errors[f'{at}.quantity'] = 'quantity must be a whole number greater than zero.'
+        parsed.append((stock_pks.get(line.get('stock_no')), quantity))
+    unit = payload.get('unit')
+    if unit is not None and not (isinstance(unit, int) and Unit.objects.filter(pk=unit).exists()):
+        errors['unit'] = f'Unknown unit {unit!r}.'
+    if errors:
+        raise APIError('Invalid reservation.', errors=errors)
+
+    try:
+        hold = reserve(parsed, unit=unit, user=request.user)
+    except InsufficientStock as error:
+        raise APIError(str(error), 409)
+    expires_at = StockReservation.objects.filter(hold=hold).values_list('expires_at', flat=True).first()
+    return JsonResponse({'hold': hold, 'expires_at': expires_at}, status=201)
+
+
+@api_view(methods=('DELETE',), permission='stocks.delete_stockreservation')
+def reservation_release(request, hold):
+    """Give up a hold before it lapses."""
+    if not release(hold):
+        raise APIError('Reservation not found.', 404)
+    return JsonResponse({'released': hold})